@@ -0,0 +1,128 @@
+'''
+Benchmark full --commit and --sync runs against a local stand-in API
+
+Runs fastly-blocklist.py against tests.fastly_api.FastlyAPI, an in-memory
+stand-in for the Fastly API with a fixed latency per request, for a block
+list of each size in SIZES:
+
+    commit  - deploy the new list to an empty service
+    update  - replace 1% of the list's items, then deploy the change
+    refetch - deploy again without changes, getting the updated list
+    reuse   - deploy again without changes, reusing the list's snapshot
+    sync    - sync the live service into a new config file
+
+Run from the repository root, with any extra options passed on to each
+run, e.g. to compare pool sizes:
+
+    python benchmarks/commit.py --pool_size 8
+'''
+
+import subprocess
+
+import os
+import sys
+import time
+import tempfile
+
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from tests.fastly_api import FastlyAPI  # noqa: E402
+
+# entries in the benchmarked block list
+SIZES = [10000, 100000, 1000000]
+
+# seconds added to each API request, like a round trip
+LATENCY = 0.02
+
+
+def write_items(path, size, offset=0):
+    '''
+    Write size distinct /32 networks to a file, one per line
+    '''
+
+    with open(path, 'w') as file_items:
+        for item in range(offset, offset + size):
+            file_items.write(
+                f'10.{item >> 16 & 255}.{item >> 8 & 255}.{item & 255}/32\n'
+            )
+
+
+def run(options, env):
+    '''
+    Run fastly-blocklist.py, and return the seconds it took
+    '''
+
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, str(ROOT / 'fastly-blocklist.py')] + options,
+        env=env, check=True, stdout=subprocess.DEVNULL
+    )
+
+    return time.perf_counter() - start
+
+
+def main():
+    '''
+    Time each run for each size in SIZES
+    '''
+
+    print(f'{"entries":>10} {"run":>8} {"seconds":>10} {"requests":>10}')
+
+    for size in SIZES:
+        with FastlyAPI(latency=LATENCY) as api, \
+                tempfile.TemporaryDirectory() as tmp:
+            api.add_service('SERVICEID')
+
+            env = dict(os.environ, FASTLY_HOST=api.host,
+                       FASTLY_SECURE='false')
+            apikey = os.path.join(tmp, 'apikey')
+            config = os.path.join(tmp, 'config.blocklist')
+            items = os.path.join(tmp, 'items.txt')
+            with open(apikey, 'w') as file_apikey:
+                file_apikey.write('APIKEY')
+
+            common = ['--apikey', apikey, '--config', config]
+            run(common + ['--init', '--service', 'SERVICEID'], env)
+            run(common + ['-n', '-l', 'bench', '-t', 'block',
+                          '--action', 'block', '--save'], env)
+            write_items(items, size)
+            run(common + ['-a', '-l', 'bench', '-f', items, '--save'], env)
+
+            # replace 1% of the items before the update run
+            write_items(items, size, size // 100)
+            setup = {
+                'update': common + ['--replace', '-l', 'bench', '-f', items,
+                                    '--save']
+            }
+            runs = [
+                ('commit', common + ['--commit']),
+                ('update', common + ['--commit']),
+                ('refetch', common + ['--commit']),
+                ('reuse', common + ['--commit']),
+                ('sync', ['--apikey', apikey,
+                          '--config', os.path.join(tmp, 'synced.blocklist'),
+                          '--service', 'SERVICEID', '--sync', '--save'])
+            ]
+
+            for name, options in runs:
+                if name in setup:
+                    run(setup[name], env)
+
+                api.requests.clear()
+                elapsed = run(options + sys.argv[1:], env)
+
+                print(f'{size:>10} {name:>8} {elapsed:>10.2f} '
+                      f'{sum(api.requests.values()):>10}')
+
+            entries = len(api.acl_entries('SERVICEID',
+                                          'fastlyblocklist_bench'))
+            if entries != size:
+                exit(f'Error: the stand-in ACL has {entries} entries, '
+                     f'expected {size}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+Benchmark converting the running config to remote config
+
+Builds configs with a growing number of lists and items and times
+State._convert_local_to_remote() on each. Run from the repository root:
+
+    python benchmarks/convert_local_to_remote.py
+
+Time per item should stay flat as the config grows.
+'''
+
+import gc
+import io
+import sys
+import time
+import argparse
+import contextlib
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lib import State  # noqa: E402
+
+# (number of lists, total number of items) for each run
+SCALES = [
+    (100, 100000),
+    (200, 500000),
+    (400, 1000000),
+    (800, 2000000)
+]
+
+
+def build_config(list_count, item_count):
+    '''
+    Build a config of block, var and combo lists
+    Half the lists are block lists holding all the items, a quarter are
+    regexp var lists, and a quarter are combo lists of the others.
+    '''
+
+    lists = []
+    block_count = list_count // 2
+    items_per_list = item_count // block_count
+
+    for number in range(list_count):
+        if number < block_count:
+            list_type, match = 'block', 'exact'
+            items = [
+                f'10.{number % 256}.{item // 256 % 256}.{item % 256}/32'
+                for item in range(items_per_list)
+            ]
+        elif number < block_count + list_count // 4:
+            list_type, match = 'var', 'regexp'
+            items = [f'bot{number}']
+        else:
+            list_type, match = 'combo', 'exact'
+            items = [f'list_{number % block_count}', f'list_{number - 100}']
+
+        lists.append({
+            'name': f'list_{number}',
+            'type': list_type,
+            'action_block': True,
+            'action_log': True,
+            'action_none': False,
+            'match': match,
+            'variable': 'req.http.User-Agent',
+            'block_length': 600,
+            'items': items
+        })
+
+    return {
+        'log': '',
+        'block': 'error 403 "Forbidden";',
+        'services': [{
+            'id': 'SERVICEID',
+            'type': 'recv',
+            'snippet_name': 'fastlyblocklist_benchmark',
+            'priority': '10',
+            'options': {'edge_only': True, 'var_ip': 'client.ip'}
+        }],
+        'lists': lists
+    }
+
+
+def main():
+    '''
+    Time converting configs of each size in SCALES
+    '''
+
+    print(f'{"lists":>8} {"items":>10} {"seconds":>10} {"us/item":>10}')
+
+    for list_count, item_count in SCALES:
+        env = argparse.Namespace(
+            config=build_config(list_count, item_count),
+            verbose=False
+        )
+
+        gc.collect()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            State()._convert_local_to_remote(env, 'SERVICEID')
+            elapsed = time.perf_counter() - start
+
+        print(f'{list_count:>8} {item_count:>10} {elapsed:>10.3f} '
+              f'{elapsed / item_count * 1e6:>10.3f}'
+              )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+'''
+Benchmark diffing local lists against remote ACLs and dictionaries
+
+Diffs lists of a growing size against remote copies where 1% of entries
+differ, and counts the batch operations produced. Run from the repository
+root:
+
+    python benchmarks/diff_remote.py
+
+Time per entry should stay flat as the lists grow.
+'''
+
+import gc
+import sys
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lib import remote  # noqa: E402
+from lib.state import (  # noqa: E402
+    RemoteItems, _remote_acl_item, _remote_dict_item
+)
+
+# number of entries on each side of a diff
+SIZES = [10000, 100000, 1000000]
+
+
+def acl_lists(size):
+    '''
+    Build remote ACL entries and local list items, 1% apart
+    '''
+
+    from_items = [
+        {
+            'id': str(entry),
+            'ip': f'10.{entry >> 16 & 255}.{entry >> 8 & 255}.{entry & 255}',
+            'negated': '0',
+            # the API leaves out the subnet of some entries
+            'subnet': None if entry % 2 else 32
+        }
+        for entry in range(size)
+    ]
+    to_items = [
+        f'10.{entry >> 16 & 255}.{entry >> 8 & 255}.{entry & 255}/32'
+        for entry in range(size // 100, size + size // 100)
+    ]
+
+    return from_items, RemoteItems(to_items, _remote_acl_item)
+
+
+def dict_lists(size):
+    '''
+    Build remote dictionary items and local temp list items, 1% apart
+    '''
+
+    from_items = [
+        {'item_key': f'10.0.{entry >> 8}.{entry & 255}', 'item_value': '100'}
+        for entry in range(size)
+    ]
+    to_items = {
+        f'10.0.{entry >> 8}.{entry & 255}': 100
+        for entry in range(size // 100, size + size // 100)
+    }
+
+    return from_items, RemoteItems(to_items.items(), _remote_dict_item)
+
+
+def main():
+    '''
+    Time diffing lists of each size in SIZES
+    '''
+
+    print(f'{"type":>6} {"entries":>10} {"ops":>8} {"seconds":>10}')
+
+    for size in SIZES:
+        for list_type, build, diff in [
+                ('acl', acl_lists, remote.diff_acl),
+                ('dict', dict_lists, remote.diff_dict)]:
+            from_items, to_items = build(size)
+
+            gc.collect()
+            start = time.perf_counter()
+            ops = sum(1 for _ in diff(from_items, to_items))
+            elapsed = time.perf_counter() - start
+
+            print(f'{list_type:>6} {size:>10} {ops:>8} {elapsed:>10.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+'''
+Benchmark per-request overhead of the pooled API transport
+
+Sends small requests to a local stand-in for the Fastly API, first opening
+a new connection for each request as the fastly client did, then through a
+lib.transport.Transport reusing its pooled keep-alive connections. Run from
+the repository root:
+
+    python benchmarks/transport.py
+
+Each request has a fixed added latency, like a round trip to the API. A new
+connection costs at least one more round trip, before any TLS handshake.
+'''
+
+import http.client
+
+import sys
+import json
+import time
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lib import transport  # noqa: E402
+
+# requests sent in each mode
+REQUESTS = 500
+
+# seconds added to each connection and request, like a round trip
+LATENCIES = [0, 0.001, 0.005]
+
+
+class Handler(BaseHTTPRequestHandler):
+    '''
+    Answer every request with a small JSON body, after a delay
+    '''
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def setup(self):
+        # connecting costs a round trip
+        time.sleep(self.server.latency)
+        super().setup()
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+
+        body = json.dumps({'id': 'ACLID', 'name': 'fastlyblocklist_list'})
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def fresh_connections(host):
+    '''
+    Send REQUESTS requests, each on a new connection
+    '''
+
+    for _ in range(REQUESTS):
+        connection = http.client.HTTPConnection(host, timeout=15)
+        connection.request('GET', '/service/SERVICEID/acl/ACLID')
+        json.loads(connection.getresponse().read())
+        connection.close()
+
+
+def pooled_connections(host):
+    '''
+    Send REQUESTS requests through a pooled Transport
+    '''
+
+    pool = transport.Transport('APIKEY', host=host, secure=False)
+    for _ in range(REQUESTS):
+        pool.request('GET', '/service/SERVICEID/acl/ACLID')
+    pool.close()
+
+
+def main():
+    '''
+    Time each mode at each latency in LATENCIES
+    '''
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = f'127.0.0.1:{server.server_port}'
+
+    print(f'{"latency ms":>10} {"mode":>8} {"requests":>8} '
+          f'{"ms/request":>10}')
+
+    for latency in LATENCIES:
+        server.latency = latency
+
+        for mode, send in [
+                ('fresh', fresh_connections),
+                ('pooled', pooled_connections)]:
+            start = time.perf_counter()
+            send(host)
+            elapsed = time.perf_counter() - start
+
+            print(f'{latency * 1000:>10.0f} {mode:>8} {REQUESTS:>8} '
+                  f'{elapsed / REQUESTS * 1000:>10.3f}')
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -4,12 +4,6 @@
 fsly_ip=$(dig +short global.ssl.fastly.net | head -1)
 tor_ips="https://check.torproject.org/torbulkexitlist?ip=${fsly_ip}"
 
-# Create a temp file to store ips
-tempfile=$(mktemp)
-
-# Get the IPs and store in file
-curl -Ls "${tor_ips}" | grep -v "^#" > $tempfile
-
 # Add a new block list "tor_ips"
 # This will fail harmlessly if the list is already defined
 python fastly-blocklist.py \
@@ -19,17 +13,14 @@ python fastly-blocklist.py \
     --action block \
     --save
 
-# Add the IPs to the blocklist
-python fastly-blocklist.py \
+# Get the IPs and replace the blocklist contents, reading from stdin
+# Only IPs that were added/removed since the last run are changed
+curl -Ls "${tor_ips}" | python fastly-blocklist.py \
     --list tor_ips \
-    --removeall \
-    --add \
-    --file $tempfile \
+    --replace \
+    --file - \
     --save
 
 # Deploy the config
 python fastly-blocklist.py \
     --commit
-
-# Remove our temp file
-rm $tempfile
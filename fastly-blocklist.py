@@ -19,10 +19,14 @@ def main(args):
     env = lib.Environment(args)
     state = lib.State()
 
+    # share one pool of API connections between sync and commit
+    remote = None
+    if args.sync or args.commit:
+        remote = lib.Remote(args, env)
+
     # sync state with live service
     if args.sync:
         print('Syncing with live service.')
-        remote = lib.Remote(env)
         state.sync(env, remote)
 
     # list operations
@@ -34,8 +38,10 @@ def main(args):
     # deploy and/or save config state
     if args.commit:
         print('Deploying to live service(s).')
-        remote = lib.Remote(env)
         state.commit(env, remote)
+    if remote:
+        remote.summary()
+        remote.close()
     if args.save:
         print(f'Saving running config to file: {env.config_file}')
         state.save(env)
@@ -75,6 +81,7 @@ if __name__ == '__main__':
         '--apikey', required=False, default='{}/.fastlyctl_token'.format(
             Path.home()), type=str, help=(
                 "Location of a file containing Fastly API key/token.\n"
+                "\tOnly read when --sync or --commit are used.\n"
                 "\tDefault: Read from ~/.fastlyctl_token"))
     ENVIRONMENT.add_argument('--config', required=False,
                              default='{}/config.blocklist'.format(Path.cwd()),
@@ -110,6 +117,76 @@ if __name__ == '__main__':
         help=(
             "VCL to execute when a request is blocked.\n"
             "\tDefault: error 403 \"Forbidden\""))
+    ENVIRONMENT.add_argument(
+        '--convert',
+        required=False,
+        choices=[
+            'json',
+            'binary'],
+        help=(
+            "Convert the config file to another format on --save.\n"
+            "\tjson\t- Human readable JSON.\n"
+            "\tbinary\t- Compact, memory mapped format for large lists.\n"
+            "\tLater saves keep the format of the loaded config file."))
+    ENVIRONMENT.add_argument(
+        '--pool_size',
+        required=False,
+        default=4,
+        type=int,
+        help=(
+            "Number of connections kept open to the Fastly API.\n"
+            "\tAlso the most API requests sent at once.\n"
+            "\tDefault: 4"))
+    ENVIRONMENT.add_argument(
+        '--timeout',
+        required=False,
+        default=15,
+        type=float,
+        help=(
+            "Seconds to wait for each Fastly API response.\n"
+            "\tDefault: 15"))
+    ENVIRONMENT.add_argument(
+        '--connect_timeout',
+        required=False,
+        default=10,
+        type=float,
+        help=(
+            "Seconds to wait when connecting to the Fastly API.\n"
+            "\tDefault: 10"))
+    ENVIRONMENT.add_argument(
+        '--acl_batch_size',
+        required=False,
+        default=250,
+        type=int,
+        help=(
+            "Number of ACL entries sent in each batch update, up to 1000.\n"
+            "\tDefault: 250"))
+    ENVIRONMENT.add_argument(
+        '--dict_batch_size',
+        required=False,
+        default=250,
+        type=int,
+        help=(
+            "Number of dictionary items sent in each batch update, up to "
+            "1000.\n"
+            "\tDefault: 250"))
+    ENVIRONMENT.add_argument(
+        '--adaptive_batches',
+        required=False,
+        action='store_true',
+        help=(
+            "Adapt batch sizes to how quickly the Fastly API answers.\n"
+            "\tBatch sizes grow while updates are answered quickly, and\n"
+            "\tshrink after slow updates or 413/429/5xx errors."))
+    ENVIRONMENT.add_argument(
+        '--retries',
+        required=False,
+        default=3,
+        type=int,
+        help=(
+            "Number of times a failed Fastly API request is retried.\n"
+            "\tRetries back off exponentially, with jitter.\n"
+            "\tDefault: 3"))
     # Manage configuration state
     STATE = PARSER.add_argument_group(
         'STATE', 'Modify live service and local config state')
@@ -121,6 +198,21 @@ if __name__ == '__main__':
     STATE.add_argument('--commit', required=False, action='store_true',
                        help=("Deploy running config to the live service(s).")
                        )
+    STATE.add_argument(
+        '--resume',
+        required=False,
+        action='store_true',
+        help=(
+            "Resume a --commit that failed part way through.\n"
+            "\tBatch updates it already applied are skipped."))
+    STATE.add_argument(
+        '--refresh',
+        required=False,
+        action='store_true',
+        help=(
+            "Get live lists in full on --commit, instead of reusing the\n"
+            "\tsnapshot saved by the last --sync/--commit while the\n"
+            "\tservice's active version and list sizes are unchanged."))
     STATE.add_argument(
         '--save',
         required=False,
@@ -224,6 +316,13 @@ if __name__ == '__main__':
     ITEMS.add_argument('-r', '--remove', required=False, action='store_true',
                        help=("Remove an item or items from a list.")
                        )
+    ITEMS.add_argument(
+        '--replace',
+        required=False,
+        action='store_true',
+        help=(
+            "Replace all items in a list with --item/--file.\n"
+            "\tOnly the items that differ are added/removed."))
     ITEMS.add_argument(
         '-i',
         '--item',
@@ -232,7 +331,7 @@ if __name__ == '__main__':
         type=lambda s: [
             str(item) for item in s.split(',')],
         help=(
-            "List item(s) to add/remove.\n"
+            "List item(s) to add/remove/replace.\n"
             "\t--item or --file are required when operating on list items.\n"
             "\tExample: 1.2.3.4,4.3.2.1"))
     ITEMS.add_argument(
@@ -241,8 +340,21 @@ if __name__ == '__main__':
         required=False,
         type=str,
         help=(
-            "File containing list items to add/remove.\n"
-            "\t--item or --file are required when operating on list items."))
+            "File containing list items to add/remove/replace, one per "
+            "line.\n"
+            "\t--item or --file are required when operating on list items.\n"
+            "\tUse - to read from stdin. gzip/bz2 files are decompressed.\n"
+            "\tBlank lines and lines starting with # are skipped."))
+    ITEMS.add_argument(
+        '-j',
+        '--jobs',
+        required=False,
+        default=1,
+        type=int,
+        help=(
+            "Number of processes used to validate items from --file.\n"
+            "\tSmall inputs are always validated in-process.\n"
+            "\tDefault: 1"))
     ITEMS.add_argument(
         '--clean',
         required=False,
@@ -257,6 +369,14 @@ if __name__ == '__main__':
         help=(
             "Remove all items from a list or all lists in the running "
             "config."))
+    ITEMS.add_argument(
+        '--aggregate',
+        required=False,
+        action='store_true',
+        help=(
+            "Collapse adjacent and overlapping networks in allow/block "
+            "list(s)\n"
+            "\tin the running config. Runs after any --add/--remove."))
 
     # print the fastly-blocklist header
     print(PARSER.description)
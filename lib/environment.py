@@ -8,6 +8,12 @@ import random
 import string
 import json
 
+from . import store
+from .lists import convert_items
+
+# JSON config files larger than this get a hint to convert to binary
+LARGE_CONFIG_SIZE = 64 * 1024 * 1024
+
 
 class Environment():
     '''
@@ -35,14 +41,9 @@ class Environment():
                 args.log,
                 args.block)
 
-        # Read Fastly API key from file.
-        try:
-            print(f'Reading API key from: {args.apikey}')
-            with open(args.apikey) as file_apikey:
-                self.apikey = file_apikey.read().replace('\n', '')
-            print(f'\tRead API key.')
-        except BaseException:
-            exit(f'Error: could not read API key from: {args.apikey}')
+        # Fastly API key file, read when the API key is first used.
+        self.apikey_file = args.apikey
+        self._apikey = None
 
         # Read or create a fastly-blocklist config file.
         try:
@@ -63,12 +64,39 @@ class Environment():
             print(f'Targeting service(s): {args.service}')
             self._set_service(args.service)
 
+        # Convert the config file to another format, once it is saved.
+        if args.convert:
+            print(f'Converting config file to {args.convert} format on '
+                  f'save: {self.config_file}'
+                  )
+            self.config_format = args.convert
+
+    @property
+    def apikey(self):
+        '''
+        Read the Fastly API key from file, only once it is needed
+        '''
+
+        if self._apikey is None:
+            try:
+                print(f'Reading API key from: {self.apikey_file}')
+                with open(self.apikey_file) as file_apikey:
+                    self._apikey = file_apikey.read().replace('\n', '')
+                print(f'\tRead API key.')
+            except BaseException:
+                exit(f'Error: could not read API key from: '
+                     f'{self.apikey_file}'
+                     )
+
+        return self._apikey
+
     def _init_config(self, force, config_file, service, log, block):
         '''
         Create a new fastly-blocklist config file
         '''
 
         self.config_file = config_file
+        self.config_format = 'json'
 
         self.config = {
             'log': f'{log}',
@@ -87,12 +115,10 @@ class Environment():
 
         # Write a new config file only if one doesn't exist, or if forced
         if not Path(self.config_file).exists():
-            with open(self.config_file, 'w') as file_config:
-                file_config.write(json.dumps(self.config, indent=4))
+            self._write_config()
         else:
             if force:
-                with open(self.config_file, 'w') as file_config:
-                    file_config.write(json.dumps(self.config, indent=4))
+                self._write_config()
             else:
                 exit('Error: config file exists. Use --force to overwrite.')
 
@@ -106,8 +132,23 @@ class Environment():
         self.config_file = config_file
 
         try:
-            with open(self.config_file) as file_config:
-                config = json.load(file_config)
+            # binary configs decode each list's items on first access
+            if store.is_binary(self.config_file):
+                self.config_format = 'binary'
+                config = store.load(self.config_file)
+            else:
+                self.config_format = 'json'
+                with open(self.config_file) as file_config:
+                    config = json.load(file_config)
+
+                for blockly_list in config['lists']:
+                    blockly_list['items'] = convert_items(blockly_list)
+
+                if Path(self.config_file).stat().st_size > LARGE_CONFIG_SIZE:
+                    print('\tWarning: every list in a JSON config file is '
+                          'loaded on each run. Use --convert binary --save to '
+                          'only load the lists used.'
+                          )
 
             self.config = config
         except BaseException:
@@ -151,9 +192,30 @@ class Environment():
         '''
 
         try:
-            with open(self.config_file, 'w') as file_config:
-                file_config.write(json.dumps(self.config, indent=4))
+            self._write_config()
         except BaseException:
             exit(f'Error: could not write to file: {self.config_file}')
 
         print(f'\tSaved config to file: {self.config_file}')
+
+    def _write_config(self):
+        '''
+        Write the running config to file in its format
+        Binary configs only append the lists that changed. JSON configs are
+        rewritten to a temporary file and renamed over the config file, so
+        a failed save never leaves a partially written config.
+        '''
+
+        if self.config_format == 'binary':
+            store.save(self.config, self.config_file)
+            return
+
+        # decode any lists still stored in a binary config
+        for blockly_list in self.config['lists']:
+            if isinstance(blockly_list, store.StoredList):
+                blockly_list.load()
+
+        store.replace_file(
+            self.config_file,
+            [json.dumps(self.config, indent=4).encode('utf-8')]
+        )
@@ -0,0 +1,68 @@
+'''
+Read list items from files and streams
+'''
+
+import io
+import sys
+import bz2
+import gzip
+
+# number of items handed to a list update at once
+BATCH_SIZE = 10000
+
+# magic bytes for supported compressed streams
+MAGIC_GZIP = b'\x1f\x8b'
+MAGIC_BZ2 = b'BZh'
+
+
+def open_feed(path):
+    '''
+    Open a file of list items for reading as text
+    Reads stdin when path is '-'. gzip and bz2 input is decompressed.
+    '''
+
+    if path == '-':
+        raw = sys.stdin.buffer
+    else:
+        raw = open(path, 'rb')
+
+    if not hasattr(raw, 'peek'):
+        raw = io.BufferedReader(raw)
+
+    magic = raw.peek(3)[:3]
+    if magic[:2] == MAGIC_GZIP:
+        raw = gzip.GzipFile(fileobj=raw)
+    elif magic == MAGIC_BZ2:
+        raw = bz2.BZ2File(raw)
+
+    return io.TextIOWrapper(raw, encoding='utf-8', newline=None)
+
+
+def read_items(feed):
+    '''
+    Lazily read items from an open feed, one per line
+    Blank lines and lines starting with '#' are skipped.
+    '''
+
+    for line in feed:
+        item = line.rstrip('\r\n')
+        stripped = item.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        yield item
+
+
+def batched(items, size=BATCH_SIZE):
+    '''
+    Group an iterable of items into lists of at most size items
+    '''
+
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
@@ -0,0 +1,157 @@
+'''
+Index blockly lists for fast item lookups
+'''
+
+from .lists import is_dict_list
+
+
+class ListIndex():
+    '''
+    Index blockly lists for fast item lookups
+
+    Lists are looked up by name. Dictionary type lists already store their
+    items as a key -> value mapping, which is used as-is. Other lists have
+    their items mirrored into an insertion-ordered dict, and the list's
+    'items' array is rebuilt from it once, on flush(). Either way lookups,
+    adds and removes are constant time.
+    '''
+
+    def __init__(self, env):
+        '''
+        Index the lists in the running config by name
+        '''
+
+        self.env = env
+        self.lists = {
+            blockly_list['name']: blockly_list
+            for blockly_list in env.config['lists']
+        }
+
+        # per-list item indexes, built the first time a list is touched
+        self._members = {}
+        self._dirty = set()
+
+    def get(self, name):
+        '''
+        Get a list by name, or None if it does not exist
+        '''
+
+        return self.lists.get(name)
+
+    def add(self, name, item):
+        '''
+        Add an item to a list, return False if it already exists
+        Adding an existing key to a dictionary type list with a new value
+        (e.g. a later temp list expiration) updates the value in place.
+        '''
+
+        members = self._index(name)
+
+        if isinstance(item, dict):
+            ((key, value),) = item.items()
+            if key in members and members[key] == value:
+                return False
+            members[key] = value
+            return True
+
+        if item in members:
+            return False
+
+        members[item] = None
+        self._dirty.add(name)
+
+        return True
+
+    def remove(self, name, item):
+        '''
+        Remove an item from a list, return False if it does not exist
+        '''
+
+        members = self._index(name)
+
+        if isinstance(item, dict):
+            ((item, _),) = item.items()
+
+        if item not in members:
+            return False
+
+        del members[item]
+        self._dirty.add(name)
+
+        return True
+
+    def lookup(self, name, search_key):
+        '''
+        Get the item for a key in a dictionary type list
+        '''
+
+        members = self._index(name)
+
+        if search_key not in members:
+            return None
+
+        return {search_key: members[search_key]}
+
+    def expire(self, name, current_time):
+        '''
+        Remove items from a temp list that expired before current_time
+        Returns the number of items removed.
+        '''
+
+        members = self._index(name)
+
+        expired = [
+            key for key, value in members.items()
+            if int(value) < current_time
+        ]
+        for key in expired:
+            del members[key]
+
+        return len(expired)
+
+    def items(self, name):
+        '''
+        Get a snapshot of the items in a list
+        '''
+
+        members = self._index(name)
+
+        if is_dict_list(self.lists[name]):
+            return [{key: value} for key, value in members.items()]
+
+        return list(members)
+
+    def clear(self, name):
+        '''
+        Remove all items from a list
+        '''
+
+        if is_dict_list(self.lists[name]):
+            self.lists[name]['items'].clear()
+        else:
+            self._members[name] = {}
+            self._dirty.add(name)
+
+    def flush(self):
+        '''
+        Write modified list indexes back to the running config
+        '''
+
+        for name in self._dirty:
+            if not is_dict_list(self.lists[name]):
+                self.lists[name]['items'][:] = self._members[name]
+
+        self._dirty = set()
+
+    def _index(self, name):
+        '''
+        Get (or build) the item index for a list
+        '''
+
+        if name not in self._members:
+            if is_dict_list(self.lists[name]):
+                self._members[name] = self.lists[name]['items']
+            else:
+                self._members[name] = dict.fromkeys(self.lists[name]['items'])
+
+        return self._members[name]
@@ -6,7 +6,16 @@ import urllib.parse
 
 import re
 import time
-import ipaddress
+import itertools
+
+from concurrent import futures
+
+from . import feed, networks
+from .index import ListIndex
+from .lists import is_dict_list
+
+# smallest batch worth sharding across a process pool
+POOL_MIN_ITEMS = 10000
 
 
 class Items():
@@ -20,6 +29,9 @@ class Items():
         '''
 
         self.list = args.list
+        self.index = ListIndex(env)
+        self.jobs = max(args.jobs, 1)
+        self.pool = None
 
         if args.removeall:
             print('Removing all item(s) from list(s)')
@@ -29,6 +41,13 @@ class Items():
             print('Cleaning temp list(s)')
             self.update = 'remove'
             self._clean(env)
+        if args.replace:
+            print('Replacing item(s) in list(s)')
+            self.update = 'replace'
+            self.item = args.item
+            self.file = args.file
+            self._replace(env)
+            print('Replaced item(s) in list(s)')
         if args.add:
             print('Adding item(s) to list(s)')
             self.update = 'add'
@@ -43,6 +62,15 @@ class Items():
             self.file = args.file
             self._remove(env)
             print('Removed item(s) from list(s)')
+        if args.aggregate:
+            print('Aggregating allow/block list(s)')
+            self._aggregate(env)
+
+        if self.pool:
+            self.pool.shutdown()
+
+        # write index changes back to the running config
+        self.index.flush()
 
     def _clean(self, env):
         '''
@@ -51,58 +79,62 @@ class Items():
 
         current_time = int(time.time())
 
-        # try to cleanup provided list names
-        if self.list:
-            for name in self.list:
-                for config_list in env.config['lists']:
-
-                    # only try to cleanup if this is a temp list.
-                    if config_list['name'] == name \
-                            and config_list['type'] == 'temp':
-
-                        for item in config_list['items']:
-                            for key, value in item.items():
-                                # remove items where timestamp < now
-                                if value < current_time:
-                                    self._update_list(env, {key: value})
+        # try to cleanup provided list names, or all lists
+        names = self.list if self.list else list(self.index.lists)
 
-                        print(f'\tCleaning temp list: {name}')
+        for name in names:
+            config_list = self.index.get(name)
 
-        # try to cleanup all lists
-        else:
-            for config_list in env.config['lists']:
+            # only try to cleanup if this is a temp list.
+            if not config_list or config_list['type'] != 'temp':
+                continue
 
-                # only try to cleanup if this is a temp list.
-                if config_list['type'] == 'temp':
-                    for item in config_list['items']:
-                        for key, value in item.items():
-                            # remove items where timestamp < now
-                            if value < current_time:
-                                self.list = [config_list['name']]
-                                self._update_list(env, {key: value})
+            # remove items where timestamp < now
+            removed = self.index.expire(name, current_time)
 
-                    print('\tCleaned temp list: {}'.format(
-                        config_list['name']))
+            print(f'\tCleaned temp list: {name}. Removed {removed} '
+                  f'expired item(s).'
+                  )
 
     def _removeall(self, env):
         '''
         Remove all items from a list or lists
         '''
 
-        # try to remove all items from provided list name
-        if self.list:
-            for name in self.list:
-                for config_list in env.config['lists']:
-                    if config_list['name'] == name:
-                        config_list['items'] = []
-                        print(f'\tRemoved all items from list: {name}')
+        # try to remove all items from provided list names, or all lists
+        names = self.list if self.list else list(self.index.lists)
 
-        # try to remove all items from all lists
-        else:
-            for config_list in env.config['lists']:
-                config_list['items'] = []
-                print('\tRemoved all items from list: {}'.format(
-                    config_list['name']))
+        for name in names:
+            if self.index.get(name):
+                self.index.clear(name)
+                print(f'\tRemoved all items from list: {name}')
+
+    def _aggregate(self, env):
+        '''
+        Collapse adjacent and overlapping networks in allow/block list(s)
+        '''
+
+        # try to aggregate provided list names, or all lists
+        names = self.list if self.list else list(self.index.lists)
+
+        for name in names:
+            config_list = self.index.get(name)
+
+            # only try to aggregate allow and block lists
+            if not config_list \
+                    or config_list['type'] not in ['allow', 'block']:
+                continue
+
+            items = self.index.items(name)
+            aggregated = networks.aggregate_networks(items)
+
+            self.index.clear(name)
+            for item in aggregated:
+                self.index.add(name, item)
+
+            print(f'\tAggregated list: {name}. Saved '
+                  f'{len(items) - len(aggregated)} of {len(items)} entries.'
+                  )
 
     def _add(self, env):
         '''
@@ -117,23 +149,82 @@ class Items():
 
         # try to add item(s) from --item argument
         if self.item:
-            for item in self.item:
-                self._update_list(env, item)
+            self._update_list(env, self.item)
 
         # try to add item(s) from --file provided
         if self.file:
-            try:
-                if env.verbose:
-                    print(f'\tReading list items from file: {self.file}')
-                with open(self.file) as file_items:
-                    items = file_items.read().splitlines()
-                if env.verbose:
-                    print(f'\tRead items from file.')
-            except BaseException:
-                exit(f'Error: could not read items from file: {self.file}')
-
-            for item in items:
-                self._update_list(env, item)
+            for items in feed.batched(
+                    self._read_file(env), feed.BATCH_SIZE * self.jobs):
+                self._update_list(env, items)
+
+    def _replace(self, env):
+        '''
+        Replace the items in a list or lists, applying only the differences
+        '''
+
+        if not self.list:
+            exit('Error: no list name(s) defined. Use --list <name>,<name>')
+
+        if not self.item and not self.file:
+            exit('Error: --replace requires list items. Use --item or --file')
+
+        for name in self.list:
+            # check the the list indicated actually exists
+            if not self.index.get(name):
+                exit(f'Error: List does not exist. Cannot update: {name}')
+
+        # validate the incoming items for each list, keyed like the list
+        incoming = {name: {} for name in self.list}
+
+        batches = []
+        if self.item:
+            batches.append(self.item)
+        if self.file:
+            batches = itertools.chain(batches, feed.batched(
+                self._read_file(env), feed.BATCH_SIZE * self.jobs
+            ))
+
+        for items in batches:
+            for name in self.list:
+                for valid_item in self._validate_items(
+                        env, items, self.index.get(name)):
+                    incoming[name][self._match_key(valid_item)] = valid_item
+
+        for name in self.list:
+
+            # remove items that aren't in the incoming items
+            removed = 0
+            for item in self.index.items(name):
+                if self._match_key(item) not in incoming[name]:
+                    self.index.remove(name, item)
+                    removed += 1
+
+            # add items that aren't in the list yet
+            added = 0
+            for key, valid_item in incoming[name].items():
+                if isinstance(valid_item, dict):
+                    if self.index.lookup(name, key) is not None:
+                        continue
+                if self.index.add(name, valid_item):
+                    added += 1
+
+            unchanged = len(incoming[name]) - added
+            print(f'\tReplaced items in list: {name}. Added {added}, '
+                  f'removed {removed}, unchanged {unchanged}.'
+                  )
+
+    @staticmethod
+    def _match_key(item):
+        '''
+        Get the key an item is matched on when replacing a list
+        Dict items are matched on their key only, so e.g. temp items keep
+        their existing expiration.
+        '''
+
+        if isinstance(item, dict):
+            return next(iter(item))
+
+        return item
 
     def _remove(self, env):
         '''
@@ -146,177 +237,155 @@ class Items():
         if not self.item and not self.file:
             exit('Error: --remove requires list items. Use --item or --file')
 
-        # try to add item(s) from --item argument
+        # try to remove item(s) from --item argument
         if self.item:
-            for item in self.item:
-                self._update_list(env, item)
+            self._update_list(env, self.item)
 
-        # try to add item(s) from --file provided
+        # try to remove item(s) from --file provided
         if self.file:
-            try:
-                if env.verbose:
-                    print(f'\tReading list items from file: {self.file}')
-                with open(self.file) as file_items:
-                    items = file_items.read().splitlines()
-                if env.verbose:
-                    print(f'\tRead items from file.')
-            except BaseException:
-                exit(f'Error: could not read items from file: {self.file}')
-
-            for item in items:
-                self._update_list(env, item)
-
-    def _update_list(self, env, item):
-
-        lists = [blockly_list['name'] for blockly_list in env.config['lists']]
+            for items in feed.batched(
+                    self._read_file(env), feed.BATCH_SIZE * self.jobs):
+                self._update_list(env, items)
+
+    def _read_file(self, env):
+        '''
+        Lazily read items from the --file provided
+        '''
+
+        try:
+            if env.verbose:
+                print(f'\tReading list items from file: {self.file}')
+            file_items = feed.open_feed(self.file)
+        except OSError:
+            exit(f'Error: could not read items from file: {self.file}')
+
+        try:
+            yield from feed.read_items(file_items)
+        except (OSError, EOFError, UnicodeDecodeError):
+            exit(f'Error: could not read items from file: {self.file}')
+        finally:
+            if self.file != '-':
+                file_items.close()
+
+        if env.verbose:
+            print(f'\tRead items from file.')
+
+    def _update_list(self, env, items):
+
         for name in self.list:
             # check the the list indicated actually exists
-            if name not in lists:
+            if not self.index.get(name):
                 exit(f'Error: List does not exist. Cannot update: {name}')
-            else:
-                for blockly_list in env.config['lists']:
-                    if blockly_list['name'] == name:
-
-                        # add item to the list
-                        if self.update == 'add':
-
-                            # _validate_item validates the item string and
-                            # creates the object to be inserted into list
-                            valid_item, error = self._validate_item(
-                                env, item, name
-                            )
-                            if error:
-                                continue
-
-                            # don't insert duplicates
-                            if valid_item in blockly_list['items']:
-                                if env.verbose:
-                                    print(f'\tWarning: item: {item} already '
-                                          f'exists in list: {name}. '
-                                          f'Skipping item.'
-                                          )
-                                continue
-
-                            # finally, add the item to the list
-                            try:
-                                blockly_list['items'].append(valid_item)
-                                if env.verbose:
-                                    print(f'\tAdded item: {item} to list: '
-                                          f'{name}'
-                                          )
-                            except BaseException:
-                                pass
-
-                        # remove item from the list
-                        if self.update == 'remove':
-
-                            # validate item for dictionary type lists
-                            if blockly_list['type'] in ['geo', 'temp'] \
-                                or (blockly_list['type'] == 'var'
-                                    and blockly_list['match'] == 'exact'):
-
-                                # _get_dict_item looks up a dict item by key
-                                valid_item, error = self._get_dict_item(
-                                    blockly_list, item
-                                )
-                                if error:
-                                    continue
-
-                            # validate item for list type lists
-                            else:
-
-                                # _validate_item validates the item string
-                                valid_item, error = self._validate_item(
-                                    env, item, name
-                                )
-                                if error:
-                                    continue
-
-                            # skip removal if the item doesn't exist
-                            if valid_item not in blockly_list['items']:
-                                if env.verbose:
-                                    print(f'\tWarning: item: {item} does not '
-                                          f'exist in list: {name}. Skipping '
-                                          f'item.'
-                                          )
-                                continue
-
-                            # finally, remove the item from the list
-                            try:
-                                blockly_list['items'].remove(valid_item)
-                                if env.verbose:
-                                    print(f'\tRemoved item: {item} from '
-                                          f'list: {name}'
-                                          )
-                            except BaseException:
-                                pass
-
-    def _validate_item(self, env, item, name):
+
+        for name in self.list:
+            blockly_list = self.index.get(name)
+
+            # add items to the list
+            if self.update == 'add':
+
+                # _validate_items validates the item strings and
+                # creates the objects to be inserted into list
+                for valid_item in self._validate_items(
+                        env, items, blockly_list):
+
+                    # don't insert duplicates
+                    if not self.index.add(name, valid_item):
+                        if env.verbose:
+                            print(f'\tWarning: item: {valid_item} already '
+                                  f'exists in list: {name}. Skipping item.'
+                                  )
+                        continue
+
+                    if env.verbose:
+                        print(f'\tAdded item: {valid_item} to list: {name}')
+
+            # remove items from the list
+            if self.update == 'remove':
+
+                # look up items by key for dictionary type lists
+                if is_dict_list(blockly_list):
+
+                    valid_items = []
+                    for item in items:
+                        # _get_dict_item looks up a dict item by key
+                        valid_item, error = self._get_dict_item(
+                            blockly_list, item
+                        )
+                        if not error:
+                            valid_items.append(valid_item)
+
+                # validate items for list type lists
+                else:
+                    valid_items = self._validate_items(
+                        env, items, blockly_list
+                    )
+
+                for valid_item in valid_items:
+
+                    # skip removal if the item doesn't exist
+                    if not self.index.remove(name, valid_item):
+                        if env.verbose:
+                            print(f'\tWarning: item: {valid_item} does not '
+                                  f'exist in list: {name}. Skipping item.'
+                                  )
+                        continue
+
+                    if env.verbose:
+                        print(f'\tRemoved item: {valid_item} from list: '
+                              f'{name}'
+                              )
+
+    def _validate_items(self, env, items, blockly_list):
         '''
-        Make sure this item can be inserted into this list
+        Validate a batch of items for this list
+        Large batches are sharded across a process pool when --jobs > 1.
         '''
 
-        # get attributes of the list we're trying to modify
-        lists = [blockly_list['name'] for blockly_list in env.config['lists']]
-        for blockly_list in env.config['lists']:
-            if blockly_list['name'] == name:
-                list_name = blockly_list['name']
-                list_type = blockly_list['type']
-                list_match = blockly_list['match']
-                block_length = blockly_list['block_length']
+        list_name = blockly_list['name']
 
-        valid_item = None
-        error = False
-
-        try:
-            # geo lists require a capitalized ISO-2 country code
-            if list_type == 'geo':
-                if re.match('^[A-Z]{2}$', item):
-                    valid_item = {item: 'fastly-blocklist'}
-                else:
-                    raise
+        # only ship the list's attributes to workers, not its items
+        list_attributes = {
+            key: value for key, value in blockly_list.items()
+            if key != 'items'
+        }
+        list_names = set(self.index.lists)
+        current_time = int(time.time())
 
-            # allow and block lists can take a IP or CIDR + ! for negation
-            if list_type in ['allow', 'block']:
-                if item[:1] == '!':
-                    valid_item = '!{}'.format(
-                        str(ipaddress.ip_network(item[1:]))
-                    )
-                else:
-                    valid_item = str(ipaddress.ip_network(item))
-
-            # temp lists can take an IP address only
-            if list_type == 'temp':
-                valid_item = str(ipaddress.ip_address(item))
-                # set temp list expiration time: now + block_length
-                expiration_time = int(time.time()) + block_length
-                valid_item = {valid_item: expiration_time}
-
-            # exact var lists take any string, it will be urlencoded
-            if list_type == 'var' and list_match == 'exact':
-                encoded_item = urllib.parse.quote(item, safe='')
-                valid_item = {encoded_item: 'fastly-blocklist'}
-
-            # regexp var lists can take any string, it will be urlencoded
-            if list_type == 'var' and list_match == 'regexp':
-                encoded_item = urllib.parse.quote(item, safe='')
-                valid_item = encoded_item
-
-            # combo lists can use any list names
-            if list_type == 'combo':
-                if item in lists and not item == list_name:
-                    valid_item = item
-                else:
-                    raise
+        if self.jobs > 1 and len(items) >= POOL_MIN_ITEMS:
+            if not self.pool:
+                self.pool = futures.ProcessPoolExecutor(
+                    max_workers=self.jobs
+                )
+
+            shard_size = -(-len(items) // self.jobs)
+            shards = [
+                items[start:start + shard_size]
+                for start in range(0, len(items), shard_size)
+            ]
+
+            # map() returns results in shard order, so items stay in order
+            valid_items = []
+            rejects = []
+            for shard_valid, shard_rejects in self.pool.map(
+                    validate_items,
+                    shards,
+                    [list_attributes] * len(shards),
+                    [list_names] * len(shards),
+                    [current_time] * len(shards)):
+                valid_items.extend(shard_valid)
+                rejects.extend(shard_rejects)
+        else:
+            valid_items, rejects = validate_items(
+                items, list_attributes, list_names, current_time
+            )
 
-        except BaseException:
-            if env.verbose:
+        if env.verbose:
+            for item in rejects:
                 print(f'\tWarning: item: {item} is not a valid entry for '
                       f'list: {list_name}. Skipping item.'
                       )
-            error = True
 
-        return valid_item, error
+        return valid_items
 
     def _get_dict_item(self, config_list, search_key):
         '''
@@ -330,11 +399,92 @@ class Items():
             return search_key, error
 
         # get dict where key matches search_key
-        for item in config_list['items']:
-            for key, value in item.items():
-                if key == search_key:
-                    return {key: value}, error
+        item = self.index.lookup(config_list['name'], search_key)
+        if item is not None:
+            return item, error
 
         error = True
 
         return None, error
+
+
+def validate_items(items, blockly_list, list_names, current_time):
+    '''
+    Validate a batch of items for a list
+    Returns the objects to be inserted into the list and a list of rejects.
+    '''
+
+    list_type = blockly_list['type']
+
+    # IP lists are validated in bulk
+    if list_type in ['allow', 'block', 'temp']:
+
+        # allow and block lists can take a IP or CIDR + ! for negation,
+        # temp lists can take an IP address only
+        valid_items, rejects = networks.validate_networks(
+            items, address_only=(list_type == 'temp')
+        )
+
+        # set temp list expiration time: now + block_length
+        if list_type == 'temp':
+            expiration_time = current_time + blockly_list['block_length']
+            valid_items = [
+                {valid_item: expiration_time} for valid_item in valid_items
+            ]
+
+        return valid_items, rejects
+
+    valid_items = []
+    rejects = []
+    for item in items:
+        valid_item, error = _validate_item(item, blockly_list, list_names)
+        if error:
+            rejects.append(item)
+        else:
+            valid_items.append(valid_item)
+
+    return valid_items, rejects
+
+
+def _validate_item(item, blockly_list, list_names):
+    '''
+    Make sure this item can be inserted into this list
+    '''
+
+    # get attributes of the list we're trying to modify
+    list_name = blockly_list['name']
+    list_type = blockly_list['type']
+    list_match = blockly_list['match']
+
+    valid_item = None
+    error = False
+
+    try:
+        # geo lists require a capitalized ISO-2 country code
+        if list_type == 'geo':
+            if re.match('^[A-Z]{2}$', item):
+                valid_item = {item: 'fastly-blocklist'}
+            else:
+                raise
+
+        # exact var lists take any string, it will be urlencoded
+        if list_type == 'var' and list_match == 'exact':
+            encoded_item = urllib.parse.quote(item, safe='')
+            valid_item = {encoded_item: 'fastly-blocklist'}
+
+        # regexp var lists can take any string, it will be urlencoded
+        if list_type == 'var' and list_match == 'regexp':
+            encoded_item = urllib.parse.quote(item, safe='')
+            valid_item = encoded_item
+
+        # combo lists can use any list names
+        if list_type == 'combo':
+            if item in list_names and not item == list_name:
+                valid_item = item
+            else:
+                raise
+
+    except BaseException:
+        error = True
+
+    return valid_item, error
@@ -0,0 +1,173 @@
+'''
+Journal the batch updates a commit has applied, so it can be resumed
+'''
+
+from pathlib import Path
+
+import json
+import hashlib
+import itertools
+import threading
+
+
+def batch_digest(batch):
+    '''
+    Get a digest of a batch's operations, to recognize it when resuming
+    '''
+
+    return hashlib.sha1(
+        json.dumps(batch, sort_keys=True).encode('utf-8')
+    ).hexdigest()
+
+
+class Journal():
+    '''
+    Journal the batch updates a commit has applied, so it can be resumed
+    Each batch is recorded as the range of operations it holds in its list's
+    diff, with a digest of those operations, under the service, the live
+    version the diff was made from and the list (ACL or dictionary id) it
+    was applied to. The draft version a commit clones isn't used, as a
+    resumed commit clones another. The live config the diffs were made from
+    is saved when a commit fails, so a resumed commit makes the same diffs
+    and can skip the ranges already applied. A service with a
+    batch whose response was lost may have had it applied, so a resumed
+    commit gets its live config again instead.
+    '''
+
+    def __init__(self, path, resume=False):
+        '''
+        Set up a journal file, reading it if resuming
+        '''
+
+        self.path = path
+        self.file = None
+        self.lock = threading.Lock()
+
+        # (service, version, list id) -> {start: (end, digest)}
+        self.applied = {}
+        # service id -> the live config of its failed commit
+        self.remote = {}
+        # services with a batch which may or may not have been applied
+        self.lost_sids = set()
+
+        if resume:
+            self._read()
+
+    def _read(self):
+        '''
+        Read the records of a commit that didn't finish
+        '''
+
+        try:
+            with open(self.path) as file_journal:
+                lines = file_journal.readlines()
+        except FileNotFoundError:
+            return
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # a record cut short when the commit stopped
+                continue
+
+            if 'applied' in record:
+                sid, version, list_id, start, end, digest = record['applied']
+                self.applied.setdefault(
+                    (sid, version, list_id), {}
+                )[start] = (end, digest)
+            elif 'remote' in record:
+                self.remote[record['remote']['service_id']] = record['remote']
+            elif 'lost' in record:
+                self.lost_sids.add(record['lost'])
+
+        # diffs made from a service's live config now would be different
+        for sid in self.lost_sids:
+            self.remote.pop(sid, None)
+        self.applied = {
+            key: ranges for key, ranges in self.applied.items()
+            if key[0] not in self.lost_sids
+        }
+
+    def _write(self, record):
+        '''
+        Append a record to the journal file
+        The journal of a previous commit is kept while resuming it, and
+        replaced otherwise.
+        '''
+
+        with self.lock:
+            if self.file is None:
+                mode = 'a' if self.applied or self.remote \
+                    or self.lost_sids else 'w'
+                self.file = open(self.path, mode)
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+
+    def record(self, sid, version, list_id, start, batch):
+        '''
+        Record a batch of operations applied to a list
+        '''
+
+        self._write({
+            'applied': [
+                sid, version, list_id, start, start + len(batch),
+                batch_digest(batch)
+            ]
+        })
+
+    def save_remote(self, from_remote):
+        '''
+        Save the live config a failing commit was made from
+        '''
+
+        self._write({'remote': from_remote})
+
+    def lost(self, sid):
+        '''
+        Record a batch sent to a service whose response was lost
+        '''
+
+        self._write({'lost': sid})
+
+    def skip_applied(self, sid, version, list_id, ops, counts):
+        '''
+        Number a list's diff operations, leaving out any already applied
+        Yields (index, op). A journaled range is only left out when its
+        operations are the same as when they were applied. Skipped
+        operations are tallied in counts.
+        '''
+
+        applied = self.applied.get((sid, version, list_id), {})
+
+        ops = enumerate(ops)
+        for index, op in ops:
+            if index not in applied:
+                yield index, op
+                continue
+
+            end, digest = applied[index]
+            batch = [op]
+            batch.extend(
+                op for _, op in itertools.islice(ops, end - index - 1)
+            )
+
+            if batch_digest(batch) == digest:
+                counts['skip'] += len(batch)
+            else:
+                yield from enumerate(batch, index)
+
+    def finish(self):
+        '''
+        Remove the journal once its commit has finished
+        '''
+
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+        try:
+            Path(self.path).unlink()
+        except FileNotFoundError:
+            pass
@@ -5,6 +5,44 @@ Manage blockly lists
 import re
 
 
+def is_dict_list(blockly_list):
+    '''
+    Check if a list's items are stored as a key -> value mapping
+    geo, temp and exact var lists are backed by Edge Dictionaries.
+    '''
+
+    return blockly_list['type'] in ['geo', 'temp'] \
+        or (blockly_list['type'] == 'var' and blockly_list['match'] == 'exact')
+
+
+def convert_items(blockly_list):
+    '''
+    Get a list's items in the storage format for its type
+    Dictionary type list items are converted from the older array of
+    single-key dicts to a key -> value mapping. Temp list expirations are
+    stored as integers. Later duplicates of a key replace earlier ones,
+    except in temp lists where the latest expiration wins. Items that are
+    already a mapping are returned as-is, so loading a config doesn't walk
+    every list.
+    '''
+
+    items = blockly_list['items']
+
+    if not is_dict_list(blockly_list) or isinstance(items, dict):
+        return items
+
+    converted = {}
+    for item in items:
+        for key, value in item.items():
+            if blockly_list['type'] == 'temp':
+                value = int(value)
+                if key in converted and converted[key] > value:
+                    continue
+            converted[key] = value
+
+    return converted
+
+
 class Lists():
     '''
     Manage blockly lists
@@ -72,6 +110,8 @@ class Lists():
                 'variable': args.variable,
                 'block_length': args.block_length,
                 'items': []}
+            if is_dict_list(blockly_list):
+                blockly_list['items'] = {}
 
             env.config['lists'].append(blockly_list)
             print(f'\tCreated list.')
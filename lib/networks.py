@@ -0,0 +1,266 @@
+'''
+Validate, canonicalize and aggregate IP addresses and networks in bulk
+'''
+
+import socket
+import ipaddress
+
+# address family: (packed length in bytes, max prefix length)
+FAMILIES = {
+    socket.AF_INET: (4, 32),
+    socket.AF_INET6: (16, 128),
+}
+
+
+def validate_networks(items, address_only=False):
+    '''
+    Validate and canonicalize a batch of IP address/CIDR items
+    Items may be negated with a leading '!'. Host bits are masked off.
+    Unless address_only, 'start-end' ranges expand to the networks covering
+    them. With address_only, items must be single IP addresses without a
+    prefix.
+    Returns a list of canonical items in input order and a list of rejects.
+    '''
+
+    valid = []
+    rejects = []
+
+    append_valid = valid.append
+    append_reject = rejects.append
+    inet_pton = socket.inet_pton
+    inet_ntop = socket.inet_ntop
+    af_inet = socket.AF_INET
+    af_inet6 = socket.AF_INET6
+
+    for item in items:
+
+        if address_only:
+            negated = ''
+            address = item
+            prefix = None
+        else:
+            if item[:1] == '!':
+                negated = '!'
+                address = item[1:]
+            else:
+                negated = ''
+                address = item
+            address, slash, prefix = address.partition('/')
+            if not slash:
+                prefix = None
+
+            # start-end ranges expand to the networks covering them
+            if '-' in address:
+                expanded = None if slash else _expand_range(address)
+                if expanded is None:
+                    append_reject(item)
+                else:
+                    valid.extend(
+                        f'{negated}{network}' for network in expanded
+                    )
+                continue
+
+        family = af_inet6 if ':' in address else af_inet
+
+        try:
+            packed = inet_pton(family, address)
+        except (OSError, ValueError):
+            packed = None
+
+        # anything the fast path can't parse gets a second opinion from
+        # ipaddress, which also catches the forms it canonicalizes itself
+        if packed is None \
+                or (prefix is not None
+                    and not (prefix.isascii() and prefix.isdigit())):
+            canonical = _validate_slow(item, address_only)
+            if canonical is None:
+                append_reject(item)
+            else:
+                append_valid(canonical)
+            continue
+
+        length, max_prefix = FAMILIES[family]
+
+        if prefix is None:
+            prefix_length = max_prefix
+        else:
+            prefix_length = int(prefix)
+            if prefix_length > max_prefix:
+                append_reject(item)
+                continue
+
+        # mask off host bits
+        if prefix_length < max_prefix:
+            value = int.from_bytes(packed, 'big')
+            host_bits = max_prefix - prefix_length
+            packed = (value >> host_bits << host_bits).to_bytes(length, 'big')
+
+        # IPv4 addresses accepted by inet_pton are already canonical
+        if family == af_inet6 or prefix_length < max_prefix:
+            address = inet_ntop(family, packed)
+
+            # ipaddress renders embedded IPv4 addresses as hextets
+            if family == af_inet6 and '.' in address:
+                canonical = _validate_slow(item, address_only)
+                if canonical is None:
+                    append_reject(item)
+                else:
+                    append_valid(canonical)
+                continue
+
+        if address_only:
+            append_valid(address)
+        else:
+            append_valid(f'{negated}{address}/{prefix_length}')
+
+    return valid, rejects
+
+
+def _validate_slow(item, address_only):
+    '''
+    Validate and canonicalize a single item with ipaddress
+    '''
+
+    try:
+        if address_only:
+            return str(ipaddress.ip_address(item))
+        if item[:1] == '!':
+            return '!{}'.format(ipaddress.ip_network(item[1:], strict=False))
+        return str(ipaddress.ip_network(item, strict=False))
+    except ValueError:
+        return None
+
+
+def _expand_range(address_range):
+    '''
+    Get the canonical networks covering a 'start-end' IP address range
+    '''
+
+    first, _, last = address_range.partition('-')
+
+    try:
+        return [
+            str(network) for network in ipaddress.summarize_address_range(
+                ipaddress.ip_address(first.strip()),
+                ipaddress.ip_address(last.strip())
+            )
+        ]
+    except (TypeError, ValueError):
+        return None
+
+
+def aggregate_networks(items):
+    '''
+    Collapse adjacent and overlapping networks in a list of canonical items
+    Negated and non-negated networks are collapsed separately. A network is
+    only merged into a wider one when no network of the opposite sign sits
+    between them, so longest-prefix matching gives the same result for
+    every address before and after aggregation.
+    Returns the aggregated items, sorted by address.
+    '''
+
+    aggregated = []
+    parsed = {}
+
+    for item in items:
+        negated = item[:1] == '!'
+        address, _, prefix = item.lstrip('!').partition('/')
+        family = socket.AF_INET6 if ':' in address else socket.AF_INET
+
+        try:
+            start = int.from_bytes(socket.inet_pton(family, address), 'big')
+            prefix_length = int(prefix)
+        except (OSError, ValueError):
+            # leave anything we can't parse untouched
+            aggregated.append(item)
+            continue
+
+        parsed.setdefault(family, ({}, {}))
+        parsed[family][negated][(start, prefix_length)] = True
+
+    networks = []
+    for family, signed in parsed.items():
+        max_prefix = FAMILIES[family][1]
+        for negated in [False, True]:
+            for start, prefix_length in _aggregate_sign(
+                    signed[negated], signed[not negated], max_prefix):
+                networks.append((family, start, prefix_length, negated))
+
+    for family, start, prefix_length, negated in sorted(networks):
+        length, max_prefix = FAMILIES[family]
+        address = socket.inet_ntop(family, start.to_bytes(length, 'big'))
+        if family == socket.AF_INET6 and '.' in address:
+            address = str(ipaddress.IPv6Address(start))
+        negation = '!' if negated else ''
+        aggregated.append(f'{negation}{address}/{prefix_length}')
+
+    return aggregated
+
+
+def _aggregate_sign(nets, opposite, max_prefix):
+    '''
+    Collapse networks of one sign, grouped by the innermost network of the
+    opposite sign that contains them
+    '''
+
+    lengths = sorted({prefix for _, prefix in opposite}, reverse=True)
+
+    groups = {}
+    pinned = []
+    for start, prefix in nets:
+        container = None
+        for length in lengths:
+            if length > prefix:
+                continue
+            host_bits = max_prefix - length
+            key = (start >> host_bits << host_bits, length)
+            if key in opposite:
+                container = key
+                break
+
+        # the same network with both signs is left alone
+        if container and container[1] == prefix:
+            pinned.append((start, prefix))
+        else:
+            groups.setdefault(container, []).append((start, prefix))
+
+    collapsed = list(pinned)
+    for container, group in groups.items():
+        result = _collapse(group, max_prefix)
+
+        # don't grow a group into the opposite network containing it
+        if container in result:
+            result = sorted(group)
+
+        collapsed.extend(result)
+
+    return collapsed
+
+
+def _collapse(nets, max_prefix):
+    '''
+    Drop covered networks and merge adjacent siblings
+    '''
+
+    stack = []
+    for start, prefix in sorted(nets):
+        end = start + (1 << (max_prefix - prefix))
+
+        # sorted by start then width, so anything starting inside the last
+        # network kept is covered by it
+        if stack and start < stack[-1][2]:
+            continue
+
+        stack.append((start, prefix, end))
+
+        # merge siblings into their parent network, as far up as possible
+        while len(stack) > 1:
+            start_a, prefix_a, end_a = stack[-2]
+            start_b, prefix_b, end_b = stack[-1]
+            parent_bits = max_prefix - prefix_a + 1
+            if prefix_a != prefix_b or prefix_a == 0 or end_a != start_b \
+                    or start_a >> parent_bits << parent_bits != start_a:
+                break
+            stack[-2:] = [(start_a, prefix_a - 1, end_b)]
+
+    return [(start, prefix) for start, prefix, _ in stack]
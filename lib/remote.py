@@ -4,9 +4,32 @@ Manage remote state
 
 import urllib.parse
 
+import os
 import re
 import json
-import fastly
+import time
+import socket
+import itertools
+import threading
+import collections
+
+from concurrent import futures
+
+from .journal import Journal
+from .snapshot import Snapshots
+
+# entries requested per page of an ACL or dictionary
+PER_PAGE = 1000
+
+# most entries the API takes in one batch update
+MAX_BATCH_SIZE = 1000
+
+# adaptive batch sizes grow by a step after each batch answered within the
+# target latency, shrink by a quarter after slower batches and by half after
+# an error response a smaller batch may avoid
+BATCH_SIZE_STEP = 50
+TARGET_LATENCY = 1.0
+SHRINK_STATUSES = (413, 429, 500, 502, 503, 504)
 
 
 class Remote():
@@ -14,20 +37,162 @@ class Remote():
     Manage remote state
     '''
 
-    def __init__(self, env):
+    def __init__(self, args, env):
         '''
-        Connect & auth to the Fastly API
+        Set up a pool of connections to the Fastly API
+        One Remote is shared by --sync and --commit, so connections opened
+        while syncing are reused by the commit.
         '''
-        try:
-            self.api = fastly.API(timeout=15)
-            self.api.authenticate_by_key(env.apikey)
-        except BaseException:
-            exit('Error: could not connect & auth to Fastly API')
 
-    def get_remote_config_service(self, env, sid):
+        # the API transport is only needed remotely, so don't import it on
+        # startup
+        from . import transport
+
+        # FASTLY_HOST/FASTLY_SECURE point us at another API, e.g. for tests
+        host = os.environ.get('FASTLY_HOST', transport.API_HOST)
+        secure = os.environ.get('FASTLY_SECURE', 'true').lower() \
+            in ['true', '1', 't', 'y', 'yes']
+
+        # also the most requests sent at once
+        self.pool_size = args.pool_size
+
+        # entries per batch update, for each type of list
+        self.batch_sizes = {}
+        for list_type, size in [
+                ('acl', args.acl_batch_size),
+                ('dict', args.dict_batch_size)]:
+            if not 1 <= size <= MAX_BATCH_SIZE:
+                exit(f'Error: {list_type} batch size must be from 1 to '
+                     f'{MAX_BATCH_SIZE}'
+                     )
+            self.batch_sizes[list_type] = BatchSize(
+                size, args.adaptive_batches
+            )
+
+        self.transport = transport.Transport(
+            env.apikey,
+            host=host,
+            secure=secure,
+            pool_size=args.pool_size,
+            timeout=args.timeout,
+            connect_timeout=args.connect_timeout,
+            retries=args.retries
+        )
+
+        # batch updates applied by a commit, kept until it finishes
+        self.journal = Journal(f'{env.config_file}.journal', args.resume)
+
+        # lists seen by the last sync or commit to each service
+        self.snapshots = Snapshots(f'{env.config_file}.snapshots')
+        self.refresh = args.refresh
+
+    def close(self):
+        '''
+        Close any connections to the Fastly API
+        '''
+
+        self.transport.close()
+
+    def summary(self):
+        '''
+        Print the batch sizes used and the number of API requests sent
+        '''
+
+        for list_type, batch_size in self.batch_sizes.items():
+            if batch_size.batches:
+                print(f'\tSent {batch_size.batches} {list_type} batches. '
+                      f'Batch size: {batch_size.size}, ranged from '
+                      f'{batch_size.smallest} to {batch_size.largest}.'
+                      )
+
+        print(f'\tSent {self.transport.requests} Fastly API requests, '
+              f'{self.transport.retried} of them retries.'
+              )
+
+    def resume_remote_config(self, env, sid):
+        '''
+        Resume from the live config a failed commit to a service was made
+        from, if it was journaled
+        '''
+
+        if sid in self.journal.lost_sids:
+            print(f'\tGetting the live config again, as the last commit\'s '
+                  f'updates may have been applied.')
+
+        if sid not in self.journal.remote:
+            return False
+
+        print(f'\tResuming from the live config of the last commit.')
+        env.from_remote = self.journal.remote[sid]
+
+        return True
+
+    def finish_commit(self):
+        '''
+        Remove the journal of a commit which finished
+        '''
+
+        self.journal.finish()
+
+    def save_snapshot(self, env):
+        '''
+        Save a snapshot of the lists just synced from a live service
+        '''
+
+        self.snapshots.save(
+            env.from_remote['service_id'], env.from_remote['version'],
+            env.from_remote['acls'], env.from_remote['dicts']
+        )
+
+    def drop_snapshot(self, env):
+        '''
+        Remove the snapshot of a service about to be changed, so a commit
+        which doesn't finish can't leave it out of date
+        '''
+
+        self.snapshots.drop(env.to_remote['service_id'])
+
+    def save_deployed_snapshot(self, env):
+        '''
+        Save a snapshot of the lists just deployed to a live service
+        Dictionaries hold the items deployed. ACLs which weren't updated keep
+        their live entries, while the entries of ACLs which were are left
+        out, as the ids of entries created aren't known.
+        '''
+
+        from_acls = {
+            from_acl['name']: from_acl['items']
+            for from_acl in env.from_remote['acls']
+        }
+
+        self.snapshots.save(
+            env.to_remote['service_id'], env.to_remote['version'],
+            [
+                {
+                    'name': to_acl['name'],
+                    'id': to_acl['id'],
+                    'items': None if to_acl['updated']
+                    else from_acls.get(to_acl['name'], [])
+                }
+                for to_acl in env.to_remote['acls']
+            ],
+            [
+                {
+                    'name': to_dict['name'],
+                    'id': to_dict['id'],
+                    'items': to_dict['items']
+                }
+                for to_dict in env.to_remote['dicts']
+            ]
+        )
+
+    def get_remote_config_service(self, env, sid, reuse=False):
         '''
         Get all the fastly-blocklist config from a live service
         All live config is put into env.from_remote dict
+        With reuse, lists are taken from the service's snapshot when its
+        active version hasn't changed since, and each list still has as many
+        entries, unless --refresh is used.
         '''
 
         print(f'\tGetting live config.')
@@ -37,42 +202,112 @@ class Remote():
         }
 
         try:
-            version = self.api.service(
-                id=sid
-            ).get_active_version_number()
+            version = self._get_active_version(sid)
             env.from_remote['version'] = version
         except BaseException:
             exit(f'Error: could not get active version for service: {sid}')
 
-        # get snippet
+        snapshot = None
+        if reuse and not self.refresh:
+            snapshot = self.snapshots.load(sid)
+            if snapshot and snapshot['version'] != version:
+                snapshot = None
+        if snapshot:
+            print(f'\t\tReusing snapshot of live lists at version: '
+                  f'{version}'
+                  )
+
+        # get the snippet and each list's contents concurrently, at most
+        # pool_size requests at a time
         env.from_remote['snippet'] = {}
-        self._get_snippet(env)
-
-        # get acls
-        env.from_remote['acls'] = []
-        acls = self.api.conn.request('GET',
-                                     f'/service/{sid}'
-                                     f'/version/{version}'
-                                     f'/acl'
-                                     )[1]
-        for acl in acls:
-            if re.match('^fastlyblocklist_', acl['name']):
-                # get the acl's contents
-                self._get_acl(env, acl['name'], acl['id'])
-        print('\t\tGot fastly-blocklist acls.')
-
-        # get dictionaries
-        env.from_remote['dicts'] = []
-        dicts = self.api.conn.request('GET',
-                                      f'/service/{sid}'
-                                      f'/version/{version}'
-                                      f'/dictionary'
-                                      )[1]
-        for remote_dict in dicts:
-            if re.match('^fastlyblocklist_', remote_dict['name']):
-                # get the acl's contents
-                self._get_dict(env, remote_dict['name'], remote_dict['id'])
-        print('\t\tGot fastly-blocklist dictionaries.')
+        with futures.ThreadPoolExecutor(self.pool_size) as executor:
+            snippet = executor.submit(self._get_snippet, env)
+
+            # lists are versioned, so a snapshot at the active version has
+            # them all
+            if snapshot:
+                acls = snapshot['acls']
+                dicts = snapshot['dicts']
+            else:
+                acls = executor.submit(self.transport.request, 'GET',
+                                       f'/service/{sid}'
+                                       f'/version/{version}'
+                                       f'/acl'
+                                       )
+                dicts = executor.submit(self.transport.request, 'GET',
+                                        f'/service/{sid}'
+                                        f'/version/{version}'
+                                        f'/dictionary'
+                                        )
+                acls = acls.result()[1]
+                dicts = dicts.result()[1]
+
+            # start on the first page of each list, then on the rest once
+            # the first page says how many there are
+            acl_pages = [
+                (acl['name'],
+                 self._get_acl(executor, sid, acl['id'], acl.get('items')))
+                for acl in acls
+                if re.match('^fastlyblocklist_', acl['name'])
+            ]
+            dict_pages = [
+                (remote_dict['name'],
+                 self._get_dict(executor, sid, version, remote_dict,
+                                remote_dict.get('items')))
+                for remote_dict in dicts
+                if re.match('^fastlyblocklist_', remote_dict['name'])
+            ]
+            for name, pages in acl_pages + dict_pages:
+                try:
+                    pages.start()
+                except BaseException as e:
+                    exit(f'Error: Couldn\'t get list for service: '
+                         f'{sid} list name: {name}.\n'
+                         f'Exception: {e}'
+                         )
+
+            snippet.result()
+
+            # collect lists in the order the API returned them
+            env.from_remote['acls'] = []
+            for name, pages in acl_pages:
+                try:
+                    env.from_remote['acls'].append(
+                        {
+                            'name': name,
+                            'id': pages.container_id,
+                            'items': pages.items()
+                        }
+                    )
+                except BaseException as e:
+                    exit(f'Error: Couldn\'t get acl for service: '
+                         f'{sid} acl name: {name}.\n'
+                         f'Exception: {e}'
+                         )
+
+                if env.verbose:
+                    print(f'\t\tGot fastly-blocklist acl name: {name}')
+            print('\t\tGot fastly-blocklist acls.')
+
+            env.from_remote['dicts'] = []
+            for name, pages in dict_pages:
+                try:
+                    env.from_remote['dicts'].append(
+                        {
+                            'name': name,
+                            'id': pages.container_id,
+                            'items': pages.items()
+                        }
+                    )
+                except BaseException as e:
+                    exit(f'Error: Couldn\'t get dict for service: '
+                         f'{sid} dict name: {name}.\n'
+                         f'Exception: {e}'
+                         )
+
+                if env.verbose:
+                    print(f'\t\tGot fastly-blocklist dict name: {name}')
+            print('\t\tGot fastly-blocklist dictionaries.')
 
     def deploy_list_updates(self, env):
         '''
@@ -83,33 +318,48 @@ class Remote():
         print('\t\tDeploying list updates to service.')
 
         env.flag_new_version = False
+        updates = []
 
-        # create/update acls
-        to_acls = [to_acl['name'] for to_acl in env.to_remote['acls']]
-        from_acls = [from_acl['name'] for from_acl in env.from_remote['acls']]
+        # create/update acls, by id
+        from_acls = {
+            from_acl['name']: from_acl['id']
+            for from_acl in env.from_remote['acls']
+        }
 
-        for name in to_acls:
+        for to_acl in env.to_remote['acls']:
+            name = to_acl['name']
             if name in from_acls:
-                self._update_acl(env, name)
+                acl_id = from_acls[name]
             else:
                 if not env.flag_new_version:
                     env.flag_new_version = True
                     self._new_version(env)
-                self._new_acl(env, name)
-
-        # create/update dicts
-        to_dicts = [to_dict['name'] for to_dict in env.to_remote['dicts']]
-        from_dicts = [from_dict['name']
-                      for from_dict in env.from_remote['dicts']]
+                acl_id = self._new_acl(env, name)
+            update = self._update_acl(env, name, acl_id)
+            to_acl.update(id=acl_id, updated=update is not None)
+            updates.append(update)
+
+        # create/update dicts, by id
+        from_dicts = {
+            from_dict['name']: from_dict['id']
+            for from_dict in env.from_remote['dicts']
+        }
 
-        for name in to_dicts:
+        for to_dict in env.to_remote['dicts']:
+            name = to_dict['name']
             if name in from_dicts:
-                self._update_dict(env, name)
+                dict_id = from_dicts[name]
             else:
                 if not env.flag_new_version:
                     env.flag_new_version = True
                     self._new_version(env)
-                self._new_dict(env, name)
+                dict_id = self._new_dict(env, name)
+            update = self._update_dict(env, name, dict_id)
+            to_dict.update(id=dict_id, updated=update is not None)
+            updates.append(update)
+
+        # send every list's batches at once
+        self._send_updates(env, [update for update in updates if update])
 
         if env.flag_new_version:
             self._deploy_version(env)
@@ -195,19 +445,18 @@ class Remote():
         sid = env.to_remote['service_id']
 
         try:
-            version = self.api.service(
-                id=sid
-            ).get_active_version_number()
+            version = self._get_active_version(sid)
             env.to_remote['version'] = version
             version_old = version
         except BaseException:
             exit(f'Error: could not get active version for service: {sid}')
 
         try:
-            response = self.api.version(
-                service_id=sid,
-                version=version
-            ).clone()
+            response = self.transport.request('PUT',
+                                              f'/service/{sid}'
+                                              f'/version/{version}'
+                                              f'/clone'
+                                              )[1]
             version_new = response['number']
             env.to_remote['version'] = version_new
 
@@ -221,6 +470,19 @@ class Remote():
               f'{version_old} for service: {sid}'
               )
 
+    def _get_active_version(self, sid):
+        '''
+        Get the number of a service's active version
+        '''
+
+        service = self.transport.request('GET', f'/service/{sid}')[1]
+
+        for version in service['versions']:
+            if version['active'] is True:
+                return version['number']
+
+        raise ValueError(f'no active version for service: {sid}')
+
     def _deploy_version(self, env):
         '''
         Make the service version active
@@ -230,10 +492,11 @@ class Remote():
         version = env.to_remote['version']
 
         try:
-            response = self.api.version(
-                service_id=sid,
-                version=version
-            ).activate()
+            response = self.transport.request('PUT',
+                                              f'/service/{sid}'
+                                              f'/version/{version}'
+                                              f'/activate'
+                                              )[1]
         except BaseException as e:
             exit(f'Error: could not activate version: {version} for '
                  f'service: {sid}.\n'
@@ -260,13 +523,13 @@ class Remote():
         }
 
         try:
-            self.api.conn.request('POST',
-                                  f'/service/{sid}'
-                                  f'/version/{version}'
-                                  f'/snippet',
-                                  body=body,
-                                  headers=headers
-                                  )
+            self.transport.request('POST',
+                                   f'/service/{sid}'
+                                   f'/version/{version}'
+                                   f'/snippet',
+                                   body=body,
+                                   headers=headers
+                                   )
 
             print(f'\t\tAdded new snippet name: {snippet_name}')
 
@@ -292,11 +555,11 @@ class Remote():
         env.from_remote['snippet']['priority'] = '1'
 
         try:
-            snippets = self.api.conn.request('GET',
-                                             f'/service/{sid}'
-                                             f'/version/{version}'
-                                             f'/snippet'
-                                             )[1]
+            snippets = self.transport.request('GET',
+                                              f'/service/{sid}'
+                                              f'/version/{version}'
+                                              f'/snippet'
+                                              )[1]
 
             for snippet in snippets:
                 if re.match(re_snippet_name, snippet['name']) \
@@ -312,10 +575,10 @@ class Remote():
                 raise
 
             # get the snippet's contents and put in env.from_remote
-            snippet_content = self.api.conn.request('GET',
-                                                    f'/service/{sid}'
-                                                    f'/snippet/{snippet_id}'
-                                                    )[1]
+            snippet_content = self.transport.request('GET',
+                                                     f'/service/{sid}'
+                                                     f'/snippet/{snippet_id}'
+                                                     )[1]
 
             env.from_remote['snippet']['content'] = snippet_content['content']
 
@@ -343,12 +606,12 @@ class Remote():
         }
 
         try:
-            self.api.conn.request('PUT',
-                                  f'/service/{sid}'
-                                  f'/snippet/{snippet_id}',
-                                  body=body,
-                                  headers=headers
-                                  )
+            self.transport.request('PUT',
+                                   f'/service/{sid}'
+                                   f'/snippet/{snippet_id}',
+                                   body=body,
+                                   headers=headers
+                                   )
 
             print(f'\t\tUpdated snippet name: {snippet_name}')
 
@@ -366,11 +629,11 @@ class Remote():
         version = env.to_remote['version']
 
         try:
-            self.api.conn.request('DELETE',
-                                  f'/service/{sid}'
-                                  f'/version/{version}'
-                                  f'/snippet/{name}'
-                                  )[1]
+            self.transport.request('DELETE',
+                                   f'/service/{sid}'
+                                   f'/version/{version}'
+                                   f'/snippet/{name}'
+                                   )[1]
 
             print(f'\t\tDeleted fastly-blocklist vcl snippet name: {name}')
 
@@ -381,7 +644,7 @@ class Remote():
 
     def _new_acl(self, env, name):
         '''
-        Create a new ACL in this service + version
+        Create a new ACL in this service + version, and return its id
         '''
 
         sid = env.to_remote['service_id']
@@ -395,13 +658,13 @@ class Remote():
         }
 
         try:
-            response = self.api.conn.request('POST',
-                                             f'/service/{sid}'
-                                             f'/version/{version}'
-                                             f'/acl',
-                                             body=body,
-                                             headers=headers
-                                             )
+            response = self.transport.request('POST',
+                                              f'/service/{sid}'
+                                              f'/version/{version}'
+                                              f'/acl',
+                                              body=body,
+                                              headers=headers
+                                              )[1]
         except BaseException as e:
             exit(f'Error: could not add acl name: {name} to '
                  f'service: {sid} version: {version}.\n'
@@ -410,46 +673,49 @@ class Remote():
 
         print(f'\t\tAdded new acl: {name}')
 
-        self._update_acl(env, name)
+        return response['id']
 
-    def _get_acl(self, env, name, acl_id):
+    def _get_acl(self, executor, sid, acl_id, snapshot=None):
         '''
-        Get existing ACL
+        Start getting existing ACL entries, a page at a time, or checking
+        the number of entries in a snapshot of them
         '''
 
-        sid = env.from_remote['service_id']
+        path = f'/service/{sid}/acl/{acl_id}/entries'
 
-        try:
-            acl_remote = self.api.conn.request('GET',
-                                               f'/service/{sid}'
-                                               f'/acl/{acl_id}'
-                                               f'/entries'
-                                               )[1]
-            env.from_remote['acls'].append(
-                {
-                    'name': name,
-                    'items': acl_remote
-                }
-            )
+        pages = Pages(self.transport, executor, acl_id, path)
+        if snapshot is None:
+            return pages.begin()
 
-        except BaseException:
-            exit(f'Error: Couldn\'t get acl for service: '
-                 f'{sid} acl name: {name}'
-                 )
+        return SnapshotPages(
+            pages, snapshot, executor.submit(self._count_entries, path)
+        )
+
+    def _count_entries(self, path):
+        '''
+        Count an ACL's entries, from the last page of one entry per page
+        Without links the count isn't known, so None is returned.
+        '''
+
+        response, entries = self.transport.request(
+            'GET', f'{path}?page=1&per_page=1'
+        )
 
-        if env.verbose:
-            print(f'\t\tGot fastly-blocklist acl name: {name}')
+        if not response.getheader('Link'):
+            return None
 
-    def _update_acl(self, env, name):
+        return _link_page(response, 'last') or len(entries)
+
+    def _update_acl(self, env, name, acl_id):
         '''
-        Update an existing ACL
+        Get the batch updates for an existing ACL, or None if it's up to date
         '''
 
         sid = env.to_remote['service_id']
-        version = env.to_remote['version']
+        # journaled under the live version diffed, not the draft version
+        version = env.from_remote['version']
         to_acl = []
         from_acl = []
-        entries = []
 
         # get items for comparison
         for acl in env.from_remote['acls']:
@@ -459,73 +725,37 @@ class Remote():
             if acl['name'] == name:
                 to_acl = acl['items']
 
-        # find items to remove
-        for from_item in from_acl:
-            flag_found = False
-            for to_item in to_acl:
-                if from_item['ip'] == to_item['ip'] \
-                        and from_item['negated'] == to_item['negated'] \
-                        and from_item['subnet'] == to_item['subnet']:
-                    flag_found = True
-
-            if not flag_found:
-                entries.append({
-                    'op': 'delete',
-                    'id': from_item['id']
-                })
-
-        # find items to create
-        for to_item in to_acl:
-            flag_found = False
-            for from_item in from_acl:
-                if from_item['ip'] == to_item['ip'] \
-                        and from_item['negated'] == to_item['negated'] \
-                        and from_item['subnet'] == to_item['subnet']:
-                    flag_found = True
-
-            if not flag_found:
-                entries.append({
-                    'op': 'create',
-                    'ip': to_item['ip'],
-                    'negated': to_item['negated'],
-                    'subnet': to_item['subnet']
-                })
-
-        if not entries:
+        # diff lazily, a batch of entries at a time, leaving out
+        # any batches a resumed commit already applied
+        counts = collections.Counter()
+        ops = self.journal.skip_applied(
+            sid, version, acl_id, diff_acl(from_acl, to_acl, counts), counts
+        )
+        batches = self._chunk_list(ops, self.batch_sizes['acl'])
+        first_batch = next(batches, None)
+
+        if counts['skip']:
+            print(f'\t\tSkipping {counts["skip"]} entries already applied to '
+                  f'acl name: {name}'
+                  )
+
+        if first_batch is None:
             if env.verbose:
                 print(f'\t\tNo items to update in acl name: {name}')
-            return
+            return None
 
         print(f'\t\tUpdating acl name: {name}')
 
-        try:
-            for chunk in self._chunk_list(entries):
-                response = self.api.conn.request('GET',
-                                                 f'/service/{sid}'
-                                                 f'/version/{version}'
-                                                 f'/acl/{name}'
-                                                 )[1]
-
-                acl_id = response['id']
-                body = json.dumps({'entries': chunk})
-                headers = {
-                    'Content-Type': 'application/json'
-                }
-
-                response = self.api.conn.request('PATCH',
-                                                 f'/service/{sid}'
-                                                 f'/acl/{acl_id}'
-                                                 f'/entries',
-                                                 body=body,
-                                                 headers=headers
-                                                 )[1]
-        except BaseException as e:
-            exit(f'Error: Couldn\'t update acl for service: '
-                 f'{sid} acl name: {name}.\n'
-                 f'Exception: {e}'
-                 )
-
-        print(f'\t\tUpdated acl name: {name}')
+        return {
+            'type': 'acl',
+            'name': name,
+            'key': 'entries',
+            'id': acl_id,
+            'version': version,
+            'path': f'/service/{sid}/acl/{acl_id}/entries',
+            'batches': itertools.chain([first_batch], batches),
+            'counts': counts
+        }
 
     def _delete_acl(self, env, name):
         '''
@@ -536,11 +766,11 @@ class Remote():
         version = env.to_remote['version']
 
         try:
-            self.api.conn.request('DELETE',
-                                  f'/service/{sid}'
-                                  f'/version/{version}'
-                                  f'/acl/{name}'
-                                  )[1]
+            self.transport.request('DELETE',
+                                   f'/service/{sid}'
+                                   f'/version/{version}'
+                                   f'/acl/{name}'
+                                   )[1]
 
             print(f'\t\tDeleted fastly-blocklist acl name: {name}')
 
@@ -551,7 +781,8 @@ class Remote():
 
     def _new_dict(self, env, name):
         '''
-        Create a new Edge Dictionary in this service + version
+        Create a new Edge Dictionary in this service + version, and return
+        its id
         '''
 
         sid = env.to_remote['service_id']
@@ -565,13 +796,13 @@ class Remote():
         }
 
         try:
-            response = self.api.conn.request('POST',
-                                             f'/service/{sid}'
-                                             f'/version/{version}'
-                                             f'/dictionary',
-                                             body=body,
-                                             headers=headers
-                                             )[1]
+            response = self.transport.request('POST',
+                                              f'/service/{sid}'
+                                              f'/version/{version}'
+                                              f'/dictionary',
+                                              body=body,
+                                              headers=headers
+                                              )[1]
         except BaseException as e:
             exit(f'Error: could not add dict name: {name} to '
                  f'service: {sid} version: {version}.\n'
@@ -580,46 +811,54 @@ class Remote():
 
         print(f'\t\tAdded new dict: {name}')
 
-        self._update_dict(env, name)
+        return response['id']
 
-    def _get_dict(self, env, name, dict_id):
+    def _get_dict(self, executor, sid, version, remote_dict, snapshot=None):
         '''
-        Get existing Edge Dictionary
+        Start getting existing Edge Dictionary items, a page at a time, and
+        the number of items to expect, or checking the number of items in a
+        snapshot of them
         '''
 
-        sid = env.from_remote['service_id']
+        name = remote_dict['name']
+        dict_id = remote_dict['id']
 
-        try:
-            dict_remote = self.api.conn.request('GET',
-                                                f'/service/{sid}'
-                                                f'/dictionary/{dict_id}'
-                                                f'/items'
-                                                )[1]
-            env.from_remote['dicts'].append(
-                {
-                    'name': name,
-                    'items': dict_remote
-                }
-            )
+        count = executor.submit(self._count_items, sid, version, name)
 
-        except BaseException:
-            exit(f'Error: Couldn\'t get dict for service: '
-                 f'{sid} dict name: {name}'
-                 )
+        pages = Pages(self.transport, executor, dict_id,
+                      f'/service/{sid}'
+                      f'/dictionary/{dict_id}'
+                      f'/items',
+                      count
+                      )
+        if snapshot is None:
+            return pages.begin()
+
+        return SnapshotPages(pages, snapshot, count)
+
+    def _count_items(self, sid, version, name):
+        '''
+        Count an Edge Dictionary's items
+        '''
 
-        if env.verbose:
-            print(f'\t\tGot fastly-blocklist dict name: {name}')
+        return self.transport.request('GET',
+                                      f'/service/{sid}'
+                                      f'/version/{version}'
+                                      f'/dictionary/{name}'
+                                      f'/info'
+                                      )[1]['item_count']
 
-    def _update_dict(self, env, name):
+    def _update_dict(self, env, name, dict_id):
         '''
-        Update an existing Edge Dictionary
+        Get the batch updates for an existing Edge Dictionary, or None if
+        it's up to date
         '''
 
         sid = env.to_remote['service_id']
-        version = env.to_remote['version']
+        # journaled under the live version diffed, not the draft version
+        version = env.from_remote['version']
         to_dict = []
         from_dict = []
-        entries = []
 
         # get items for comparison
         for remote_dict in env.from_remote['dicts']:
@@ -629,71 +868,155 @@ class Remote():
             if local_dict['name'] == name:
                 to_dict = local_dict['items']
 
-        # find items to remove
-        for from_item in from_dict:
-            flag_found = False
-            for to_item in to_dict:
-                if from_item['item_key'] == to_item['item_key'] \
-                        and from_item['item_value'] == to_item['item_value']:
-                    flag_found = True
-
-            if not flag_found:
-                entries.append({
-                    'op': 'delete',
-                    'item_key': from_item['item_key']
-                })
-
-        # find items to create
-        for to_item in to_dict:
-            flag_found = False
-            for from_item in from_dict:
-                if from_item['item_key'] == to_item['item_key'] \
-                        and from_item['item_value'] == to_item['item_value']:
-                    flag_found = True
-
-            if not flag_found:
-                entries.append({
-                    'op': 'create',
-                    'item_key': to_item['item_key'],
-                    'item_value': to_item['item_value']
-                })
-
-        if not entries:
+        # diff lazily, a batch of items at a time, leaving out
+        # any batches a resumed commit already applied
+        counts = collections.Counter()
+        ops = self.journal.skip_applied(
+            sid, version, dict_id,
+            diff_dict(from_dict, to_dict, counts), counts
+        )
+        batches = self._chunk_list(ops, self.batch_sizes['dict'])
+        first_batch = next(batches, None)
+
+        if counts['skip']:
+            print(f'\t\tSkipping {counts["skip"]} items already applied to '
+                  f'dict name: {name}'
+                  )
+
+        if first_batch is None:
             if env.verbose:
                 print(f'\t\tNo items to update in dict name: {name}')
-            return
+            return None
 
         print(f'\t\tUpdating dict name: {name}')
 
+        return {
+            'type': 'dict',
+            'name': name,
+            'key': 'items',
+            'id': dict_id,
+            'version': version,
+            'path': f'/service/{sid}/dictionary/{dict_id}/items',
+            'batches': itertools.chain([first_batch], batches),
+            'counts': counts
+        }
+
+    def _send_updates(self, env, updates):
+        '''
+        Send the batch updates of a service's lists
+        Batches from all lists go through one pool of pool_size workers,
+        with a few more batches queued than there are workers, so batches
+        are only built from the diffs as they can be sent. A list's delete
+        batches are all sent before its other batches, so entries are
+        removed before new ones are added, e.g. near the ACL entry limit.
+        '''
+
+        sid = env.to_remote['service_id']
+
+        sending = collections.deque()
+        with futures.ThreadPoolExecutor(self.pool_size) as executor:
+            try:
+                for update in updates:
+                    deleting = []
+                    for start, batch in update['batches']:
+                        if not _is_delete(batch[0]):
+                            # wait for the list's deletes before the rest
+                            for deleted in deleting:
+                                self._sent_update(env, update, deleted)
+                            deleting = []
+
+                        sending.append((update, executor.submit(
+                            self._send_batch, sid, update, start, batch
+                        )))
+
+                        if _is_delete(batch[0]):
+                            deleting.append(sending[-1][1])
+
+                        while len(sending) > 2 * self.pool_size:
+                            self._sent_update(env, *sending.popleft())
+
+                while sending:
+                    self._sent_update(env, *sending.popleft())
+            except SystemExit:
+                # don't send the queued batches after one has failed
+                for _, batch in sending:
+                    batch.cancel()
+                raise
+
+        for update in updates:
+            counts = update['counts']
+            if update['type'] == 'acl':
+                print(f'\t\tUpdated acl name: {update["name"]}. '
+                      f'Created {counts["create"]}, '
+                      f'deleted {counts["delete"]} entries.'
+                      )
+            else:
+                print(f'\t\tUpdated dict name: {update["name"]}. '
+                      f'Created {counts["create"]}, '
+                      f'upserted {counts["upsert"]}, '
+                      f'deleted {counts["delete"]} items.'
+                      )
+
+    def _send_batch(self, sid, update, start, batch):
+        '''
+        Send one batch update, starting at operation start of its list's
+        diff, and journal it
+        With adaptive batch sizes, a batch which gets an error response a
+        smaller batch may avoid is split in half, and each half sent again.
+        '''
+
+        batch_size = self.batch_sizes[update['type']]
+        body = json.dumps({update['key']: batch})
+        headers = {
+            'Content-Type': 'application/json'
+        }
+
+        sent = time.perf_counter()
         try:
-            for chunk in self._chunk_list(entries):
-                response = self.api.conn.request('GET',
-                                                 f'/service/{sid}'
-                                                 f'/version/{version}'
-                                                 f'/dictionary/{name}'
-                                                 )[1]
-
-                dict_id = response['id']
-                body = json.dumps({'items': chunk})
-                headers = {
-                    'Content-Type': 'application/json'
-                }
+            self.transport.request('PATCH', update['path'],
+                                   body=body,
+                                   headers=headers
+                                   )
+        except BaseException as e:
+            from .transport import ResponseLost
 
-                response = self.api.conn.request('PATCH',
-                                                 f'/service/{sid}'
-                                                 f'/dictionary/{dict_id}'
-                                                 f'/items',
-                                                 body=body,
-                                                 headers=headers
-                                                 )[1]
+            # a resumed commit can't tell if this batch was applied
+            if isinstance(e, ResponseLost):
+                self.journal.lost(sid)
+            if not batch_size.adaptive or len(batch) == 1 \
+                    or getattr(e, 'status', None) not in SHRINK_STATUSES:
+                raise
+
+            batch_size.failed()
+            half = len(batch) // 2
+            self._send_batch(sid, update, start, batch[:half])
+            self._send_batch(sid, update, start + half, batch[half:])
+            return
+
+        batch_size.sent(time.perf_counter() - sent)
+        self.journal.record(
+            sid, update['version'], update['id'], start, batch
+        )
+
+    def _sent_update(self, env, update, batch):
+        '''
+        Wait for a batch update to be sent
+        If it couldn't be, save the live config to the journal, so a resumed
+        commit can skip the batches which were.
+        '''
+
+        sid = env.to_remote['service_id']
+
+        try:
+            batch.result()
         except BaseException as e:
-            exit(f'Error: Couldn\'t update dict for service: '
-                 f'{sid} dict name: {name}.\n'
-                 f'Exception: {e}'
+            self.journal.save_remote(env.from_remote)
+            exit(f'Error: Couldn\'t update {update["type"]} for service: '
+                 f'{sid} {update["type"]} name: {update["name"]}.\n'
+                 f'Exception: {e}\n'
+                 f'Use --commit --resume to skip the updates already applied.'
                  )
 
-        print(f'\t\tUpdated dict name: {name}')
-
     def _delete_dict(self, env, name):
         '''
         Delete an existing Edge Dictionary
@@ -703,11 +1026,11 @@ class Remote():
         version = env.to_remote['version']
 
         try:
-            self.api.conn.request('DELETE',
-                                  f'/service/{sid}'
-                                  f'/version/{version}'
-                                  f'/dictionary/{name}'
-                                  )[1]
+            self.transport.request('DELETE',
+                                   f'/service/{sid}'
+                                   f'/version/{version}'
+                                   f'/dictionary/{name}'
+                                   )[1]
 
             print(f'\t\tDeleted fastly-blocklist dict name: {name}')
 
@@ -716,12 +1039,365 @@ class Remote():
                   f'{sid} dict name: {name}'
                   )
 
-    def _chunk_list(self, full_list):
+    def _chunk_list(self, entries, batch_size):
+        '''
+        Chunk a stream of numbered entries before sending update
+        Yields (start, chunk), where each chunk holds consecutively numbered
+        entries and takes the batch size at the time it is built. Deletes
+        are never chunked with other operations, so they can be sent first.
+        '''
+
+        start = None
+        chunk = []
+        for index, entry in entries:
+            if chunk and (index != start + len(chunk)
+                          or len(chunk) >= batch_size.size
+                          or _is_delete(entry) != _is_delete(chunk[0])):
+                yield start, chunk
+                chunk = []
+            if not chunk:
+                start = index
+            chunk.append(entry)
+
+        if chunk:
+            yield start, chunk
+
+
+class BatchSize():
+    '''
+    The number of entries to send in each batch update
+    An adaptive batch size grows additively while batches are answered
+    within TARGET_LATENCY, and shrinks multiplicatively after slow batches
+    or errors, up to MAX_BATCH_SIZE. Batches are sent from many threads.
+    '''
+
+    def __init__(self, size, adaptive=False):
+        self.size = size
+        self.adaptive = adaptive
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.smallest = size
+        self.largest = size
+
+    def sent(self, latency):
+        '''
+        Count a batch sent, and adapt to its latency
+        '''
+
+        with self.lock:
+            self.batches += 1
+
+            if not self.adaptive:
+                return
+            if latency <= TARGET_LATENCY:
+                self._resize(self.size + BATCH_SIZE_STEP)
+            else:
+                self._resize(self.size * 3 // 4)
+
+    def failed(self):
+        '''
+        Shrink after a batch got an error a smaller batch may avoid
+        '''
+
+        with self.lock:
+            if self.adaptive:
+                self._resize(self.size // 2)
+
+    def _resize(self, size):
+        self.size = min(max(size, 1), MAX_BATCH_SIZE)
+        self.smallest = min(self.smallest, self.size)
+        self.largest = max(self.largest, self.size)
+
+
+class Pages():
+    '''
+    Get every page of a paginated list of entries from the API
+    Pages after the first are fetched concurrently when the first page's
+    Link header says how many there are, or else one after another by
+    following each page's next link. count is an optional future for the
+    number of entries to expect.
+    '''
+
+    def __init__(self, transport, executor, container_id, path, count=None):
+        self.container_id = container_id
+        self.transport = transport
+        self.executor = executor
+        self.path = path
+        self.count = count
+        self.pages = []
+        self.started = False
+        self.last = None
+
+    def begin(self):
+        '''
+        Start getting the first page
+        '''
+
+        self.pages.append(self.executor.submit(self._get_page, 1))
+
+        return self
+
+    def start(self):
+        '''
+        Start getting the rest of the pages, once the first page is in
+        '''
+
+        response = self.pages[0].result()[0]
+        self.last = _link_page(response, 'last')
+        self.started = True
+
+        if self.last:
+            self.pages.extend(
+                self.executor.submit(self._get_page, page)
+                for page in range(2, self.last + 1)
+            )
+
+    def items(self):
+        '''
+        Get every entry, in page order
+        Each page's entries are added as the page arrives, and the page
+        dropped. Pages without links are got one after another until one
+        isn't full. The number of entries is then checked against the expected
+        count, or else the page count: a short page before the last means
+        entries moved between pages while they were read, so some would
+        have been missed.
+        '''
+
+        if not self.started:
+            self.start()
+
+        items = []
+        per_page = None
+        expected = None
+        response = None
+
+        for page in range(len(self.pages)):
+            response, page_items = self.pages[page].result()
+            self.pages[page] = None
+
+            if per_page is None:
+                per_page = len(page_items)
+            if page == len(self.pages) - 1 and self.last:
+                expected = per_page * (self.last - 1) + len(page_items)
+
+            items.extend(page_items)
+
+        # without a last page, follow next links until there are none, or
+        # without any links, get the next page until one isn't full
+        if not self.last:
+            page = self._next_page(response, 1, page_items)
+            while page:
+                response, page_items = self._get_page(page)
+                items.extend(page_items)
+                page = self._next_page(response, page, page_items)
+
+        if self.count is not None:
+            expected = self.count.result()
+
+        if expected is not None and len(items) != expected:
+            raise ValueError(
+                f'got {len(items)} of {expected} entries from {self.path}, '
+                f'which changed while being read'
+            )
+
+        return items
+
+    def _next_page(self, response, page, page_items):
+        '''
+        Get the number of the page after a page, or None if it was the last
+        '''
+
+        if response.getheader('Link'):
+            return _link_page(response, 'next')
+
+        if len(page_items) >= PER_PAGE:
+            return page + 1
+
+        return None
+
+    def _get_page(self, page):
         '''
-        Chunk list before sending update
+        Get one page of entries: (response, entries)
         '''
 
-        chunk_size = 250
+        return self.transport.request(
+            'GET', f'{self.path}?page={page}&per_page={PER_PAGE}'
+        )
+
 
-        for item in range(0, len(full_list), chunk_size):
-            yield full_list[item:item + chunk_size]
+class SnapshotPages():
+    '''
+    Reuse a list's entries from a snapshot, if it still has as many
+    Otherwise every page of the list is got, as Pages would. count is a
+    future for the number of entries the list has, or None if unknown.
+    '''
+
+    def __init__(self, pages, snapshot, count):
+        self.container_id = pages.container_id
+        self.pages = pages
+        self.snapshot = snapshot
+        self.count = count
+
+    def start(self):
+        '''
+        Start getting every page, once the count shows the list changed
+        '''
+
+        if self.count.result() != len(self.snapshot):
+            self.pages.begin().start()
+
+    def items(self):
+        '''
+        Get every entry, from the snapshot or else in page order
+        '''
+
+        if self.pages.started:
+            return self.pages.items()
+
+        return self.snapshot
+
+
+def _is_delete(op):
+    '''
+    Check if a batch operation deletes an entry
+    '''
+
+    return op['op'] == 'delete'
+
+
+def _link_page(response, rel):
+    '''
+    Get the page number of a response's Link header relation, e.g. last
+    '''
+
+    for link in (response.getheader('Link') or '').split(','):
+        url, _, params = link.partition(';')
+        if f'rel="{rel}"' in params:
+            query = urllib.parse.urlparse(url.strip(' <>')).query
+            page = urllib.parse.parse_qs(query).get('page')
+            if page:
+                return int(page[0])
+
+    return None
+
+
+def _acl_key(item):
+    '''
+    Get the key an ACL entry is matched on: (ip, negated, subnet)
+    Entries are normalized so the same entry compares equal however it was
+    written, e.g. a missing subnet matches the address family's full length,
+    and negated may be a string, int or bool.
+    '''
+
+    address = item['ip']
+    subnet = item.get('subnet')
+
+    # IPv6 addresses can be written many ways
+    if ':' in address:
+        try:
+            address = socket.inet_ntop(
+                socket.AF_INET6, socket.inet_pton(socket.AF_INET6, address)
+            )
+        except (OSError, ValueError):
+            pass
+        default_subnet = 128
+    else:
+        default_subnet = 32
+
+    if subnet is None or subnet == '':
+        subnet = default_subnet
+
+    negated = item.get('negated')
+    if negated not in ('0', '1'):
+        negated = '1' if str(negated).lower() in ('1', 'true') else '0'
+
+    return (address, negated, int(subnet))
+
+
+def diff_acl(from_items, to_items, counts=None):
+    '''
+    Get the batch operations that turn remote ACL entries into local ones
+    Remote entries are indexed by key, and local entries are streamed past
+    the index twice: once to find the remote entries to delete, then once to
+    find the entries to create. to_items must be iterable more than once.
+    Each op yielded is tallied in counts, if given.
+    '''
+
+    if counts is None:
+        counts = collections.Counter()
+
+    remote = {_acl_key(item): item for item in from_items}
+
+    found = set()
+    for to_item in to_items:
+        key = _acl_key(to_item)
+        if key in remote:
+            found.add(key)
+
+    for key, from_item in remote.items():
+        if key not in found:
+            counts['delete'] += 1
+            yield {
+                'op': 'delete',
+                'id': from_item['id']
+            }
+
+    for to_item in to_items:
+        key = _acl_key(to_item)
+        if key not in remote:
+            address, negated, subnet = key
+            counts['create'] += 1
+            yield {
+                'op': 'create',
+                'ip': address,
+                'negated': negated,
+                'subnet': subnet
+            }
+
+
+def diff_dict(from_items, to_items, counts=None):
+    '''
+    Get the batch operations that turn remote dictionary items into local
+    ones
+    Like diff_acl(), with items matched on their item_key and compared on
+    their item_value, both as strings. Keys whose value changed, e.g. a
+    refreshed temp list expiration, get a single upsert.
+    '''
+
+    if counts is None:
+        counts = collections.Counter()
+
+    remote = {
+        str(item['item_key']): str(item['item_value']) for item in from_items
+    }
+
+    found = set()
+    for to_item in to_items:
+        key = str(to_item['item_key'])
+        if key in remote:
+            found.add(key)
+
+    for key in remote:
+        if key not in found:
+            counts['delete'] += 1
+            yield {
+                'op': 'delete',
+                'item_key': key
+            }
+
+    for to_item in to_items:
+        key = str(to_item['item_key'])
+        value = str(to_item['item_value'])
+        if key not in remote:
+            op = 'create'
+        elif remote[key] != value:
+            op = 'upsert'
+        else:
+            continue
+
+        counts[op] += 1
+        yield {
+            'op': op,
+            'item_key': key,
+            'item_value': value
+        }
@@ -0,0 +1,124 @@
+'''
+Keep snapshots of services' live lists, to reuse while they're unchanged
+'''
+
+from pathlib import Path
+
+import os
+import json
+import tempfile
+
+
+class Snapshots():
+    '''
+    Keep snapshots of services' live lists, to reuse while they're unchanged
+    Each service's snapshot is a JSON file in the path directory, with the
+    active version it was taken at and the name, id and entries of each
+    fastly-blocklist ACL and dictionary. A list whose entries aren't known,
+    e.g. an ACL just given new entries the API hasn't told us the ids of,
+    is kept without them.
+    '''
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def load(self, sid):
+        '''
+        Get a service's snapshot, or None if there isn't a readable one
+        Lists are in env.from_remote form, with items of None if unknown.
+        '''
+
+        try:
+            with open(self._file(sid)) as file_snapshot:
+                snapshot = json.load(file_snapshot)
+
+            return {
+                'service_id': sid,
+                'version': snapshot['version'],
+                'acls': [
+                    {
+                        'name': acl['name'],
+                        'id': acl['id'],
+                        'items': None if acl['entries'] is None else [
+                            {'id': entry_id, 'ip': ip, 'subnet': subnet,
+                             'negated': negated}
+                            for entry_id, ip, subnet, negated
+                            in acl['entries']
+                        ]
+                    }
+                    for acl in snapshot['acls']
+                ],
+                'dicts': [
+                    {
+                        'name': remote_dict['name'],
+                        'id': remote_dict['id'],
+                        'items': None if remote_dict['items'] is None else [
+                            {'item_key': key, 'item_value': value}
+                            for key, value in remote_dict['items']
+                        ]
+                    }
+                    for remote_dict in snapshot['dicts']
+                ]
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def save(self, sid, version, acls, dicts):
+        '''
+        Save a service's snapshot, replacing any earlier one
+        acls and dicts are in env.from_remote form, with items of None if
+        unknown.
+        '''
+
+        snapshot = {
+            'version': version,
+            'acls': [
+                {
+                    'name': acl['name'],
+                    'id': acl['id'],
+                    'entries': None if acl['items'] is None else [
+                        [entry['id'], entry['ip'], entry.get('subnet'),
+                         entry.get('negated')]
+                        for entry in acl['items']
+                    ]
+                }
+                for acl in acls
+            ],
+            'dicts': [
+                {
+                    'name': remote_dict['name'],
+                    'id': remote_dict['id'],
+                    'items': None if remote_dict['items'] is None else [
+                        [item['item_key'], item['item_value']]
+                        for item in remote_dict['items']
+                    ]
+                }
+                for remote_dict in dicts
+            ]
+        }
+
+        # write a whole new file, so a save cut short leaves the old one
+        self.path.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+                'w', dir=self.path, suffix='.tmp', delete=False) as file_tmp:
+            try:
+                # encoding it all at once is much faster than json.dump
+                file_tmp.write(json.dumps(snapshot))
+                file_tmp.close()
+                os.replace(file_tmp.name, self._file(sid))
+            except BaseException:
+                os.unlink(file_tmp.name)
+                raise
+
+    def drop(self, sid):
+        '''
+        Remove a service's snapshot, before its lists are changed
+        '''
+
+        try:
+            self._file(sid).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _file(self, sid):
+        return self.path / f'{sid}.json'
@@ -2,12 +2,15 @@
 Manage blockly local and remote state
 '''
 
+from pathlib import Path
+
 import re
 import json
+import functools
 
 import urllib.parse
 
-from jinja2 import Environment, FileSystemLoader
+from .lists import is_dict_list, convert_items
 
 
 class State():
@@ -17,9 +20,12 @@ class State():
 
     def __init__(self):
         '''
-        do nothing
+        Track the vcl snippets rendered for a commit
         '''
 
+        # rendered snippet content by (snippet name, edge_only, var_ip)
+        self.snippets = {}
+
     def sync(self, env, remote):
         '''
         Sync live service to the running config
@@ -37,6 +43,7 @@ class State():
             pass
         else:
             remote.get_remote_config_service(env, sync_sid)
+            remote.save_snapshot(env)
 
         self._convert_remote_to_local(env)
 
@@ -48,6 +55,7 @@ class State():
         '''
 
         commit_sids = [service['id'] for service in env.config['services']]
+        self.snippets = {}
         print(f'\tConfig will be deployed to service(s): {commit_sids}')
 
         for service in env.config['services']:
@@ -60,14 +68,21 @@ class State():
             if env.mock_remote:
                 continue
 
-            remote.get_remote_config_service(env, commit_sid)
+            # a resumed commit starts from the same live config as before
+            if not remote.resume_remote_config(env, commit_sid):
+                remote.get_remote_config_service(env, commit_sid, reuse=True)
             env.to_remote['version'] = env.from_remote['version']
 
             print('\tDeploying config to service.')
+            remote.drop_snapshot(env)
             remote.deploy_list_updates(env)
             remote.update_snippet(env)
             remote.deploy_list_deletes(env)
             remote.deploy_snippet_updates(env)
+            remote.save_deployed_snapshot(env)
+
+        if not env.mock_remote:
+            remote.finish_commit()
 
         print(f'\tDeployed config to services.')
 
@@ -229,6 +244,10 @@ class State():
                               f'remote dict name: {remote_name}'
                               )
 
+        # store dictionary type list items as a key -> value mapping
+        for blockly_list in env.config['lists']:
+            blockly_list['items'] = convert_items(blockly_list)
+
     def _convert_local_to_remote(self, env, sid):
         '''
         convert & copy env.config to env.to_remote
@@ -238,9 +257,6 @@ class State():
 
         list_prefix = 'fastlyblocklist_'
 
-        log_line = env.config['log']
-        block_line = env.config['block']
-
         env.to_remote = {
             'service_id': sid,
             'acls': [],
@@ -258,27 +274,14 @@ class State():
                 list_name = blockly_list['name']
                 acl_name = f'{list_prefix}{list_name}'
 
+                # items are converted as they're sent, not all up front
                 remote_acl = {
-                    'items': [],
+                    'items': RemoteItems(
+                        blockly_list['items'], _remote_acl_item
+                    ),
                     'name': acl_name
                 }
 
-                for item in blockly_list['items']:
-
-                    remote_item = {}
-                    remote_match = re.match(r'^(!)?([0-9\.a-f:]+)/?([0-9]*)', item)
-
-                    remote_item['ip'] = remote_match.group(2)
-
-                    if remote_match.group(1):
-                        remote_item['negated'] = '1'
-                    else:
-                        remote_item['negated'] = '0'
-                    if remote_match.group(3):
-                        remote_item['subnet'] = int(remote_match.group(3))
-
-                    remote_acl['items'].append(remote_item)
-
                 env.to_remote['acls'].append(remote_acl)
 
                 if env.verbose:
@@ -288,26 +291,19 @@ class State():
 
         # convert dicts
         for blockly_list in env.config['lists']:
-            if blockly_list['type'] in ['geo', 'temp'] \
-                or (blockly_list['type'] == 'var'
-                    and blockly_list['match'] == 'exact'):
+            if is_dict_list(blockly_list):
 
                 list_name = blockly_list['name']
                 dict_name = f'{list_prefix}{list_name}'
 
+                # items are converted as they're sent, not all up front
                 remote_dict = {
-                    'items': [],
+                    'items': RemoteItems(
+                        blockly_list['items'].items(), _remote_dict_item
+                    ),
                     'name': dict_name
                 }
 
-                for item in blockly_list['items']:
-                    for key, value in item.items():
-                        remote_item = {
-                            'item_key': str(key),
-                            'item_value': str(value)
-                        }
-                        remote_dict['items'].append(remote_item)
-
                 env.to_remote['dicts'].append(remote_dict)
 
                 if env.verbose:
@@ -324,6 +320,30 @@ class State():
                 edge_only = service['options']['edge_only']
                 var_ip = service['options']['var_ip']
 
+        # render each distinct snippet only once per commit
+        snippet_key = (env.to_remote['snippet']['name'], edge_only, var_ip)
+        if snippet_key not in self.snippets:
+            self.snippets[snippet_key] = self._render_snippet(
+                env, env.to_remote['snippet']['name'], edge_only, var_ip
+            )
+
+        env.to_remote['snippet']['content'] = self.snippets[snippet_key]
+
+    def _render_snippet(self, env, snippet_name, edge_only, var_ip):
+        '''
+        Render the vcl snippet for the running config
+        '''
+
+        list_prefix = 'fastlyblocklist_'
+
+        log_line = env.config['log']
+        block_line = env.config['block']
+
+        lists_by_name = {
+            blockly_list['name']: blockly_list
+            for blockly_list in env.config['lists']
+        }
+
         # add vars for 'var' lists
         custom_vars = []
         for blockly_list in env.config['lists']:
@@ -406,18 +426,25 @@ class State():
                 'children': []
             }
             if blockly_list['type'] == 'combo':
-                for item in blockly_list['items']:
-                    for child_list in env.config['lists']:
-                        child_name = child_list['name']
-                        if item == child_name:
-                            combo_list['children'].append({
-                                'name': f'{list_prefix}{child_name}',
-                                'name_short': f'{child_name}',
-                                'type': child_list['type'],
-                                'match': child_list['match'],
-                                'variable': f'var.custom_{child_name}',
-                                'strings': child_list['items']
-                            })
+                for child_name in blockly_list['items']:
+                    child_list = lists_by_name.get(child_name)
+                    if not child_list:
+                        continue
+
+                    # only regexp var children are matched on their items
+                    strings = []
+                    if child_list['type'] == 'var' \
+                            and child_list['match'] == 'regexp':
+                        strings = child_list['items']
+
+                    combo_list['children'].append({
+                        'name': f'{list_prefix}{child_name}',
+                        'name_short': f'{child_name}',
+                        'type': child_list['type'],
+                        'match': child_list['match'],
+                        'variable': f'var.custom_{child_name}',
+                        'strings': strings
+                    })
                 combo_list['name'] = name
                 combo_list['log'] = blockly_list['action_log']
                 combo_list['block'] = blockly_list['action_block']
@@ -435,17 +462,8 @@ class State():
                     'none': blockly_list['action_none']
                 })
 
-        jinja_env = Environment(
-            loader=FileSystemLoader('lib/templates/'),
-            extensions=['jinja2.ext.do'],
-            trim_blocks=True,
-            lstrip_blocks=True
-        )
-
-        vcl = jinja_env.get_template('fastly-blocklist_vcl.jinja')
-
-        env.to_remote['snippet']['content'] = vcl.render(
-            name=env.to_remote['snippet']['name'],
+        return _template().render(
+            name=snippet_name,
             log_line=log_line,
             block_line=block_line,
             lists=lists,
@@ -453,3 +471,89 @@ class State():
             edge_only=edge_only,
             var_ip=var_ip
         )
+
+
+class RemoteItems():
+    '''
+    A list's items, converted to remote items each time they're iterated
+
+    This keeps only one remote item per list item in memory at a time,
+    while letting a diff pass over them more than once.
+    '''
+
+    def __init__(self, items, convert):
+        '''
+        Wrap a list's items and the function converting each of them
+        '''
+
+        self.items = items
+        self.convert = convert
+
+    def __iter__(self):
+        return map(self.convert, self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _remote_acl_item(item):
+    '''
+    Convert a list item, e.g. '!10.0.0.0/8', to a remote ACL entry
+    '''
+
+    negated = item.startswith('!')
+    if negated:
+        item = item[1:]
+
+    address, _, subnet = item.partition('/')
+
+    remote_item = {
+        'ip': address,
+        'negated': '1' if negated else '0'
+    }
+    if subnet:
+        remote_item['subnet'] = int(subnet)
+
+    return remote_item
+
+
+def _remote_dict_item(item):
+    '''
+    Convert a (key, value) list item to a remote dictionary item
+    '''
+
+    key, value = item
+
+    return {
+        'item_key': str(key),
+        'item_value': str(value)
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _template():
+    '''
+    Get the compiled vcl snippet template, once per process
+    Compiled templates are also cached on disk, keyed by a hash of the
+    template source, so later runs skip compiling it.
+    '''
+
+    # jinja2 is only needed to commit, so don't import it on startup
+    from jinja2 import (
+        Environment, FileSystemLoader, FileSystemBytecodeCache
+    )
+
+    try:
+        bytecode_cache = FileSystemBytecodeCache()
+    except (OSError, RuntimeError):
+        bytecode_cache = None
+
+    jinja_env = Environment(
+        loader=FileSystemLoader(str(Path(__file__).parent / 'templates')),
+        extensions=['jinja2.ext.do'],
+        trim_blocks=True,
+        lstrip_blocks=True,
+        bytecode_cache=bytecode_cache
+    )
+
+    return jinja_env.get_template('fastly-blocklist_vcl.jinja')
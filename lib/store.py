@@ -0,0 +1,466 @@
+'''
+Store fastly-blocklist configs in a compact binary format
+'''
+
+from array import array
+from pathlib import Path
+
+import os
+import mmap
+import zlib
+import shutil
+import json
+import struct
+import tempfile
+
+from .lists import is_dict_list
+
+# magic bytes at the start of a binary config file
+MAGIC = b'FBLBIN1\n'
+
+# each save ends with a trailer pointing back at its JSON header:
+# header offset, header length, header crc32, then TRAILER_MAGIC
+TRAILER = struct.Struct('<QQI')
+TRAILER_MAGIC = b'FBLEND1\n'
+
+# rewrite the file once it is this many times the size of its live data
+COMPACT_RATIO = 2
+
+# encodings for a list's keys and values sections
+LINES = 'lines'
+INT64 = 'int64'
+JSON = 'json'
+
+
+def is_binary(config_file):
+    '''
+    Check if a config file is in the binary format
+    '''
+
+    with open(config_file, 'rb') as file_config:
+        return file_config.read(len(MAGIC)) == MAGIC
+
+
+class ConfigFile():
+    '''
+    A memory mapped binary config file
+    '''
+
+    def __init__(self, config_file):
+        '''
+        Map a binary config file and find the header of its last save
+        '''
+
+        self.path = os.path.realpath(config_file)
+
+        with open(self.path, 'rb') as file_config:
+            self.stat = os.fstat(file_config.fileno())
+            self.buffer = mmap.mmap(
+                file_config.fileno(), 0, access=mmap.ACCESS_READ
+            )
+
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'not a binary config file: {config_file}')
+
+        self.header, self.header_size, self.end = _find_header(self.buffer)
+
+    def unchanged(self, config_file):
+        '''
+        Check if config_file is still this file, as it was when mapped
+        '''
+
+        try:
+            stat = os.stat(config_file)
+        except OSError:
+            return False
+
+        return os.path.realpath(config_file) == self.path \
+            and stat.st_ino == self.stat.st_ino \
+            and stat.st_size == self.stat.st_size \
+            and stat.st_mtime_ns == self.stat.st_mtime_ns
+
+
+class StoredList(dict):
+    '''
+    A list from a binary config, with items decoded the first time they are
+    accessed
+
+    Until then the list's 'items' key is absent and its section of the
+    config file is still mapped, so an untouched list can be saved again
+    without encoding it.
+    '''
+
+    def __init__(self, attributes, section, source):
+        '''
+        Wrap a list's attributes and its section of a config file
+        '''
+
+        super().__init__(attributes)
+        self.section = section
+        self.source = source
+
+    def __missing__(self, key):
+        if key != 'items':
+            raise KeyError(key)
+
+        self['items'] = decode_items(self, self.section, self.source.buffer)
+
+        return self['items']
+
+    def __contains__(self, key):
+        return key == 'items' or super().__contains__(key)
+
+    def get(self, key, default=None):
+        if key == 'items':
+            return self['items']
+
+        return super().get(key, default)
+
+    def __eq__(self, other):
+        self.load()
+
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        self.load()
+
+        return super().__ne__(other)
+
+    def copy(self):
+        self.load()
+
+        return dict(self)
+
+    def load(self):
+        '''
+        Decode this list's items, if they haven't been already
+        '''
+
+        return self['items']
+
+    def loaded(self):
+        '''
+        Check if this list's items have been decoded
+        '''
+
+        return super().__contains__('items')
+
+    def raw(self):
+        '''
+        Get this list's encoded section from the config file
+        '''
+
+        offset = self.section['offset']
+
+        return self.source.buffer[offset:offset + section_size(self.section)]
+
+
+def section_size(section):
+    '''
+    Get the size in bytes of a list's encoded section
+    '''
+
+    return section['keys'][1] + section['values'][1]
+
+
+def encode_items(blockly_list):
+    '''
+    Encode a list's items into (section, bytes)
+    Items are stored one per line, and temp list expirations as an array of
+    64-bit integers, so both can be built and split in bulk. Items that
+    can't be stored that way (e.g. containing a newline) fall back to JSON.
+    '''
+
+    items = blockly_list['items']
+
+    if is_dict_list(blockly_list):
+        keys = list(items)
+        values = list(items.values())
+    else:
+        keys = items
+        values = []
+
+    keys_encoding, keys_data = _encode_lines(keys)
+
+    if not is_dict_list(blockly_list):
+        values_encoding, values_data = LINES, b''
+    elif blockly_list['type'] == 'temp':
+        values_encoding, values_data = _encode_int64(values)
+    else:
+        values_encoding, values_data = _encode_lines(values)
+
+    section = {
+        'count': len(keys),
+        'keys': [keys_encoding, len(keys_data)],
+        'values': [values_encoding, len(values_data)]
+    }
+
+    return section, keys_data + values_data
+
+
+def decode_items(blockly_list, section, buffer):
+    '''
+    Decode a list's items from its section of a binary config
+    '''
+
+    offset = section['offset']
+    count = section['count']
+    keys_encoding, keys_size = section['keys']
+    values_encoding, values_size = section['values']
+
+    keys = _decode(
+        keys_encoding, buffer[offset:offset + keys_size], count
+    )
+
+    if not is_dict_list(blockly_list):
+        return keys
+
+    offset += keys_size
+    values = _decode(
+        values_encoding, buffer[offset:offset + values_size], count
+    )
+
+    return dict(zip(keys, values))
+
+
+def _encode_lines(values):
+    '''
+    Encode strings one per line, or as JSON if any contain a newline
+    '''
+
+    try:
+        data = '\n'.join(values).encode('utf-8')
+        if data.count(b'\n') == max(len(values) - 1, 0):
+            return LINES, data
+    except TypeError:
+        pass
+
+    return _encode_json(values)
+
+
+def _encode_int64(values):
+    '''
+    Encode integers as an array of 64-bit integers, or as JSON
+    '''
+
+    try:
+        return INT64, array('q', values).tobytes()
+    except (TypeError, OverflowError):
+        return _encode_json(values)
+
+
+def _encode_json(values):
+    return JSON, json.dumps(values).encode('utf-8')
+
+
+def _decode(encoding, data, count):
+    '''
+    Decode a keys or values section
+    '''
+
+    if encoding == LINES:
+        if not count:
+            return []
+        return data.decode('utf-8').split('\n')
+
+    if encoding == INT64:
+        values = array('q')
+        values.frombytes(data)
+        return values.tolist()
+
+    return json.loads(data)
+
+
+def _find_header(buffer):
+    '''
+    Find the header of the last complete save in a binary config
+    Returns the header, its size and the offset just past its trailer.
+    Anything after that is left over from a save that didn't finish, and is
+    ignored.
+    '''
+
+    end = len(buffer)
+
+    while True:
+        position = buffer.rfind(TRAILER_MAGIC, len(MAGIC), end)
+        if position < 0:
+            raise ValueError('no complete save found in binary config file')
+
+        start = position - TRAILER.size
+        if start >= len(MAGIC):
+            offset, length, checksum = TRAILER.unpack_from(buffer, start)
+            header = buffer[offset:start]
+
+            if offset + length == start and zlib.crc32(header) == checksum:
+                return (
+                    json.loads(header),
+                    length,
+                    position + len(TRAILER_MAGIC)
+                )
+
+        # keep looking before this trailer
+        end = position + len(TRAILER_MAGIC) - 1
+
+
+def load(config_file):
+    '''
+    Load a binary config file
+    The file is memory mapped, and list items are only decoded from it when
+    a list's items are accessed.
+    '''
+
+    source = ConfigFile(config_file)
+
+    config = source.header
+    config['lists'] = [
+        StoredList(attributes, attributes.pop('section'), source)
+        for attributes in config['lists']
+    ]
+
+    return config
+
+
+def save(config, config_file):
+    '''
+    Save a config to a binary config file
+    When config_file is the file the config was loaded from, only the lists
+    that changed are appended to it, followed by a new header. Otherwise, or
+    once the file is mostly stale data, the whole config is written to a new
+    file which is renamed over config_file. Either way an interrupted save
+    leaves the last complete save in place. Lists in the config are
+    re-attached to the saved file.
+    '''
+
+    source = None
+    for blockly_list in config['lists']:
+        if isinstance(blockly_list, StoredList) \
+                and blockly_list.source.unchanged(config_file):
+            source = blockly_list.source
+            break
+
+    # encode each list, unless it is unchanged in the source file
+    encoded = []
+    live = len(MAGIC)
+    for blockly_list in config['lists']:
+        section, data = None, None
+
+        if isinstance(blockly_list, StoredList):
+            if blockly_list.loaded():
+                section, data = encode_items(blockly_list)
+                if blockly_list.source is source \
+                        and data == blockly_list.raw():
+                    section, data = None, None
+            elif blockly_list.source is not source:
+                data = blockly_list.raw()
+        else:
+            section, data = encode_items(blockly_list)
+
+        if section is None:
+            section = {
+                key: value for key, value in blockly_list.section.items()
+                if key != 'offset'
+            }
+
+        encoded.append((blockly_list, section, data))
+        live += section_size(section)
+
+    # compact once stale sections and headers outweigh the live data
+    appended = sum(len(data) for _, _, data in encoded if data is not None)
+    if source:
+        live += source.header_size
+        if source.end + appended > COMPACT_RATIO * live:
+            source = None
+
+    if source:
+        offset = source.end
+    else:
+        offset = len(MAGIC)
+
+    # lay out the sections being written after the existing data
+    header = {key: value for key, value in config.items() if key != 'lists'}
+    header['lists'] = []
+    chunks = [] if source else [MAGIC]
+    for blockly_list, section, data in encoded:
+        if source is None and data is None:
+            data = blockly_list.raw()
+
+        if data is None:
+            section['offset'] = blockly_list.section['offset']
+        else:
+            section['offset'] = offset
+            offset += len(data)
+            chunks.append(data)
+
+        attributes = {
+            key: value for key, value in blockly_list.items()
+            if key != 'items'
+        }
+        attributes['section'] = section
+        header['lists'].append(attributes)
+
+    header_data = json.dumps(header).encode('utf-8')
+    chunks.append(header_data)
+    chunks.append(
+        TRAILER.pack(offset, len(header_data), zlib.crc32(header_data))
+    )
+    chunks.append(TRAILER_MAGIC)
+
+    if source:
+        append_file(config_file, source.end, chunks)
+    else:
+        replace_file(config_file, chunks)
+
+    # point lists at their sections in the saved file
+    saved = ConfigFile(config_file)
+    for position, (blockly_list, section, _) in enumerate(encoded):
+        if not isinstance(blockly_list, StoredList):
+            blockly_list = StoredList(blockly_list, section, saved)
+            config['lists'][position] = blockly_list
+        blockly_list.section = section
+        blockly_list.source = saved
+
+
+def append_file(config_file, end, chunks):
+    '''
+    Append chunks of bytes to a file after offset end, and sync it to disk
+    Anything after end is truncated first.
+    '''
+
+    with open(config_file, 'r+b') as file_config:
+        file_config.truncate(end)
+        file_config.seek(end)
+        for chunk in chunks:
+            file_config.write(chunk)
+        file_config.flush()
+        os.fsync(file_config.fileno())
+
+
+def replace_file(config_file, chunks):
+    '''
+    Atomically replace a file with chunks of bytes
+    The chunks are written to a temporary file beside config_file, synced to
+    disk and renamed over it, so config_file is never partially written.
+    '''
+
+    config_dir = Path(config_file).resolve().parent
+    with tempfile.NamedTemporaryFile(
+            dir=config_dir, prefix='.config.', delete=False) as file_config:
+        try:
+            for chunk in chunks:
+                file_config.write(chunk)
+            file_config.flush()
+            os.fsync(file_config.fileno())
+        except BaseException:
+            os.remove(file_config.name)
+            raise
+
+    # keep the mode of the file replaced, or else give a new file the mode
+    # open() would, where temporary files are only readable by their owner
+    if Path(config_file).exists():
+        shutil.copymode(config_file, file_config.name)
+    else:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(file_config.name, 0o666 & ~umask)
+
+    os.replace(file_config.name, config_file)
@@ -0,0 +1,357 @@
+'''
+Send requests to the Fastly API over a pool of keep-alive connections
+'''
+
+import http.client
+
+import ssl
+import json
+import socket
+import select
+import time
+import queue
+import random
+import threading
+
+API_HOST = 'api.fastly.com'
+
+# default number of connections kept open to the API
+POOL_SIZE = 4
+
+# default timeouts in seconds, for connecting and for each read
+CONNECT_TIMEOUT = 10
+TIMEOUT = 15
+
+# rate limit headers on responses to modifying requests, with how many are
+# left and the epoch time when the count resets
+RATE_LIMIT_REMAINING = 'Fastly-RateLimit-Remaining'
+RATE_LIMIT_RESET = 'Fastly-RateLimit-Reset'
+
+# once fewer modifying requests than this are left, spread them out
+RATE_LIMIT_RESERVE = 50
+
+# default number of times a request is retried after a retryable failure
+RETRIES = 3
+
+# retries wait a random time up to BACKOFF doubled for each attempt, capped
+BACKOFF = 0.5
+BACKOFF_CAP = 30
+
+# error responses worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# error responses to modifying requests which may have been applied anyway,
+# e.g. by the origin behind a gateway which timed out, unless a 503 says
+# when to retry
+UNKNOWN_STATUSES = (500, 502, 503, 504)
+
+# errors from a reused connection the server had already closed
+STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    ConnectionResetError,
+    BrokenPipeError
+)
+
+
+class TransportError(Exception):
+    '''
+    An API request which got an error response
+    '''
+
+    def __init__(self, method, path, status, data):
+        super().__init__(f'{method} {path} returned {status}: {data}')
+        self.status = status
+        self.data = data
+
+    def retryable(self):
+        '''
+        Check if the request may succeed if sent again
+        '''
+
+        return self.status in RETRY_STATUSES
+
+
+class ResponseLost(Exception):
+    '''
+    An API request which was sent, but whose response was lost
+    The server may or may not have applied it. error is the exception the
+    request got instead, e.g. a TransportError for a gateway timeout.
+    '''
+
+    def __init__(self, method, path, error):
+        super().__init__(
+            f'{method} {path} may or may not have been applied: {error!r}'
+        )
+        self.error = error
+
+
+class RateLimit():
+    '''
+    Pace modifying requests to stay within the API's rate limit
+    While plenty of requests are left before the limit resets they're sent
+    straight away. Once fewer than RATE_LIMIT_RESERVE are left, the rest are
+    spread evenly until the reset instead of running out and being
+    throttled.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.remaining = None
+        self.reset = None
+        self.next_time = 0
+
+    def update(self, response):
+        '''
+        Read the rate limit left from a response's headers, if it has them
+        '''
+
+        try:
+            remaining = int(response.getheader(RATE_LIMIT_REMAINING))
+            reset = float(response.getheader(RATE_LIMIT_RESET))
+        except (TypeError, ValueError):
+            return
+
+        with self.lock:
+            self.remaining = remaining
+            self.reset = reset
+
+    def wait(self):
+        '''
+        Wait until another modifying request can be sent
+        '''
+
+        with self.lock:
+            now = time.time()
+            if self.remaining is None or now >= self.reset:
+                return
+
+            if self.remaining > RATE_LIMIT_RESERVE:
+                send_time = now
+            elif self.remaining > 0:
+                send_time = max(self.next_time, now)
+                self.next_time = send_time \
+                    + (self.reset - now) / self.remaining
+            else:
+                send_time = self.reset
+
+            # count requests already on their way
+            self.remaining -= 1
+
+        time.sleep(max(send_time - now, 0))
+
+
+class Transport():
+    '''
+    Send requests to the Fastly API over a pool of keep-alive connections
+    Connections are opened as needed, up to pool_size at once, and reused
+    by later requests. Modifying requests are paced by the API's rate limit.
+    Requests which fail with a retryable error response, or a connection
+    error before they were sent, are retried with exponential backoff and
+    jitter. GET requests are also retried if their response is lost, but
+    others aren't, as they may have been applied. Nor are modifying
+    requests which get a server error, unless it's a 503 with Retry-After;
+    those count as lost too. A Transport can be shared between threads.
+    '''
+
+    def __init__(self, apikey, host=API_HOST, secure=True,
+                 pool_size=POOL_SIZE, timeout=TIMEOUT,
+                 connect_timeout=CONNECT_TIMEOUT, retries=RETRIES,
+                 backoff=BACKOFF):
+        '''
+        Set up a pool of connections to host, without connecting yet
+        '''
+
+        self.host = host
+        self.secure = secure
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = {
+            'Fastly-Key': apikey,
+            'Accept': 'application/json',
+            'User-Agent': 'fastly-blocklist'
+        }
+
+        self.context = ssl.create_default_context() if secure else None
+
+        # idle connections, most recently used first
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(pool_size)
+
+        self.rate_limit = RateLimit()
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.retried = 0
+        self.connections = 0
+
+    def request(self, method, path, body=None, headers=None):
+        '''
+        Send a request to the API and return (response, data)
+        data is the decoded JSON response body, or its text if it isn't
+        JSON. Error responses raise TransportError, and lost responses
+        ResponseLost, once any retries are used up.
+        '''
+
+        attempt = 0
+        while True:
+            try:
+                return self._request(method, path, body, headers)
+            except (TransportError, ResponseLost,
+                    http.client.HTTPException, OSError) as e:
+                if attempt >= self.retries \
+                        or isinstance(e, TransportError) \
+                        and not e.retryable() \
+                        or isinstance(e, ResponseLost) and method != 'GET':
+                    raise
+
+            # full jitter: wait anywhere up to the doubled backoff
+            time.sleep(random.uniform(
+                0, min(BACKOFF_CAP, self.backoff * 2 ** attempt)
+            ))
+            attempt += 1
+
+            with self.lock:
+                self.retried += 1
+
+    def _request(self, method, path, body, headers):
+        '''
+        Send a request to the API once
+        '''
+
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        request_headers = dict(self.headers)
+        if headers:
+            request_headers.update(headers)
+
+        if method != 'GET':
+            self.rate_limit.wait()
+
+        with self.slots:
+            connection, reused = self._get_connection()
+
+            while True:
+                try:
+                    response, text = self._send(
+                        connection, method, path, body, request_headers
+                    )
+                    break
+                except (ResponseLost, *STALE_ERRORS) as e:
+                    connection.close()
+                    # only a GET is sent again once it may have been read
+                    if isinstance(e, ResponseLost):
+                        stale = method == 'GET' \
+                            and isinstance(e.error, STALE_ERRORS)
+                    else:
+                        stale = True
+                    if not reused or not stale:
+                        raise
+                    # the server closed an idle connection, so try a new one
+                    connection, reused = self._connect(), False
+                except BaseException:
+                    connection.close()
+                    raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                self.idle.put(connection)
+
+        self.rate_limit.update(response)
+
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = text
+
+        if response.status >= 400:
+            error = TransportError(method, path, response.status, data)
+            if method != 'GET' and response.status in UNKNOWN_STATUSES \
+                    and not (response.status == 503
+                             and response.getheader('Retry-After')):
+                raise ResponseLost(method, path, error)
+            raise error
+
+        return response, data
+
+    def close(self):
+        '''
+        Close all idle connections
+        '''
+
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _get_connection(self):
+        '''
+        Get an idle connection, or a new one: (connection, reused)
+        Idle connections the server has closed are dropped.
+        '''
+
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                return self._connect(), False
+
+            if not _closed(connection):
+                return connection, True
+            connection.close()
+
+    def _connect(self):
+        '''
+        Open a new connection to the API
+        '''
+
+        if self.secure:
+            connection = http.client.HTTPSConnection(
+                self.host, timeout=self.connect_timeout, context=self.context
+            )
+        else:
+            connection = http.client.HTTPConnection(
+                self.host, timeout=self.connect_timeout
+            )
+
+        connection.connect()
+        connection.sock.settimeout(self.timeout)
+        connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        with self.lock:
+            self.connections += 1
+
+        return connection
+
+    def _send(self, connection, method, path, body, headers):
+        '''
+        Send a request on a connection and read its whole response
+        '''
+
+        with self.lock:
+            self.requests += 1
+
+        connection.request(method, path, body=body, headers=headers)
+
+        # once sent, the request may be applied even if its response is lost
+        try:
+            response = connection.getresponse()
+            return response, response.read().decode('utf-8')
+        except (http.client.HTTPException, OSError) as e:
+            raise ResponseLost(method, path, e) from e
+
+
+def _closed(connection):
+    '''
+    Check if the server closed an idle connection
+    An idle connection has nothing to read, unless it was closed.
+    '''
+
+    try:
+        return bool(select.select([connection.sock], [], [], 0)[0])
+    except (OSError, ValueError, TypeError):
+        return True
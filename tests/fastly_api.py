@@ -0,0 +1,715 @@
+'''
+A local stand-in for the Fastly API, for tests and benchmarks
+
+Implements the endpoints lib.remote uses, keeping services in memory:
+service versions with cloning and activation, dynamic VCL snippets, ACLs
+and their entries, Edge Dictionaries and their items, and batch updates of
+both. Responses can be slowed by a fixed latency, list reads are
+paginated, modifying requests carry rate limit headers, and errors can be
+injected for matching requests. Point lib.Remote at it with:
+
+    with FastlyAPI(latency=0.01) as api:
+        api.add_service('SERVICEID')
+        os.environ['FASTLY_HOST'] = api.host
+        os.environ['FASTLY_SECURE'] = 'false'
+'''
+
+import urllib.parse
+
+import re
+import json
+import time
+import itertools
+import threading
+import collections
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# most entries sent in one batch update, and returned in one page
+MAX_BATCH = 1000
+PER_PAGE = 1000
+
+
+class APIError(Exception):
+    '''
+    An error response from the stand-in API
+    '''
+
+    def __init__(self, status, msg):
+        super().__init__(msg)
+        self.status = status
+
+
+class Handler(BaseHTTPRequestHandler):
+    '''
+    Answer API requests from the state of the FastlyAPI serving them
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    # send each response in one write, flushed once it is complete
+    wbufsize = -1
+
+    def do_GET(self):
+        self.handle_api('GET')
+
+    def do_POST(self):
+        self.handle_api('POST')
+
+    def do_PUT(self):
+        self.handle_api('PUT')
+
+    def do_PATCH(self):
+        self.handle_api('PATCH')
+
+    def do_DELETE(self):
+        self.handle_api('DELETE')
+
+    def handle_api(self, method):
+        '''
+        Answer one request, after the server's latency
+        '''
+
+        api = self.server
+        url = urllib.parse.urlparse(self.path)
+        length = int(self.headers['Content-Length'] or 0)
+        body = self.rfile.read(length).decode('utf-8') if length else ''
+
+        headers = {}
+        api.begin(method)
+        try:
+            time.sleep(api.latency)
+
+            failure = api.injected_failure(method, url.path)
+            if failure == 'drop':
+                self.close_connection = True
+                return
+            if failure and failure != 'lose':
+                raise APIError(failure, 'Injected error')
+
+            if method != 'GET':
+                headers, limited = api.take_rate_limit()
+                if limited:
+                    raise APIError(429, 'Too many requests')
+
+            if not self.headers['Fastly-Key']:
+                raise APIError(401, 'Provide credentials')
+
+            data, links = api.route(method, url.path, url.query, body,
+                                    self.headers['Content-Type'])
+            if failure == 'lose':
+                self.close_connection = True
+                return
+            if links:
+                headers['Link'] = ', '.join(
+                    f'<http://{api.host}{url.path}?page={page}>; rel="{rel}"'
+                    for rel, page in links
+                )
+            self.respond(200, data, headers)
+
+        except APIError as e:
+            self.respond(e.status, {'msg': str(e)}, headers)
+        finally:
+            api.end()
+
+    def respond(self, status, data, headers):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FastlyAPI(ThreadingHTTPServer):
+    '''
+    A local stand-in for the Fastly API, keeping services in memory
+    latency is added to every request, in seconds. per_page caps the
+    entries in each page of a list, and max_batch the operations in each
+    batch update; larger batches get a 413. max_acl_entries caps the
+    entries in each ACL; batches adding more get a 400. rate_limit is
+    (requests, seconds) for modifying requests, which get the rate limit
+    headers and a 429 once none are left.
+    '''
+
+    daemon_threads = True
+
+    # (method, path pattern, handler) for each endpoint
+    ROUTES = [
+        ('GET', r'/service/([^/]+)', '_get_service'),
+        ('PUT', r'/service/([^/]+)/version/(\d+)/clone', '_clone_version'),
+        ('PUT', r'/service/([^/]+)/version/(\d+)/activate',
+         '_activate_version'),
+        ('GET', r'/service/([^/]+)/version/(\d+)/(acl|dictionary|snippet)',
+         '_list_containers'),
+        ('POST', r'/service/([^/]+)/version/(\d+)/(acl|dictionary|snippet)',
+         '_create_container'),
+        ('DELETE',
+         r'/service/([^/]+)/version/(\d+)/(acl|dictionary|snippet)/([^/]+)',
+         '_delete_container'),
+        ('GET', r'/service/([^/]+)/version/(\d+)/dictionary/([^/]+)/info',
+         '_get_dict_info'),
+        ('GET', r'/service/([^/]+)/snippet/([^/]+)', '_get_snippet'),
+        ('PUT', r'/service/([^/]+)/snippet/([^/]+)', '_update_snippet'),
+        ('GET', r'/service/([^/]+)/acl/([^/]+)/entries', '_get_entries'),
+        ('PATCH', r'/service/([^/]+)/acl/([^/]+)/entries', '_patch_entries'),
+        ('GET', r'/service/([^/]+)/dictionary/([^/]+)/items', '_get_items'),
+        ('PATCH', r'/service/([^/]+)/dictionary/([^/]+)/items',
+         '_patch_items'),
+    ]
+
+    def __init__(self, latency=0, per_page=PER_PAGE, max_batch=MAX_BATCH,
+                 max_acl_entries=None, rate_limit=None):
+        '''
+        Set up an empty API on a free local port, without serving yet
+        '''
+
+        super().__init__(('127.0.0.1', 0), Handler)
+
+        self.latency = latency
+        self.per_page = per_page
+        self.max_batch = max_batch
+        self.max_acl_entries = max_acl_entries
+
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+        # service id -> {version number: version}
+        self.services = {}
+        # container id -> ACL, dictionary or snippet, shared by versions
+        self.containers = {}
+
+        # [method, path pattern, status or 'drop' or 'lose', times, after]
+        self.failures = []
+
+        self.rate_limit = rate_limit
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = 0
+
+        self.requests = collections.Counter()
+        self.active = 0
+        self.most_active = 0
+
+    @property
+    def host(self):
+        return f'127.0.0.1:{self.server_port}'
+
+    def start(self):
+        '''
+        Serve requests in a background thread
+        '''
+
+        threading.Thread(
+            target=self.serve_forever, args=(0.05,), daemon=True
+        ).start()
+
+        return self
+
+    def stop(self):
+        '''
+        Stop serving requests
+        '''
+
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def add_service(self, sid):
+        '''
+        Add a service with an active, empty version 1
+        '''
+
+        with self.lock:
+            self.services[sid] = {1: self._new_version(1)}
+            self.services[sid][1].update(active=True, locked=True)
+
+    def add_acl(self, sid, name, entries=()):
+        '''
+        Add an ACL to a service's active version, and return its id
+        entries are dicts of ip, and optionally subnet and negated.
+        '''
+
+        with self.lock:
+            acl = self._add_container(sid, 'acl', {'name': name})
+            self._apply_entries(acl, [
+                dict(entry, op='create') for entry in entries
+            ])
+
+        return acl['id']
+
+    def add_dict(self, sid, name, items=None):
+        '''
+        Add a dictionary to a service's active version, and return its id
+        '''
+
+        with self.lock:
+            remote_dict = self._add_container(
+                sid, 'dictionary', {'name': name}
+            )
+            remote_dict['items'].update(items or {})
+
+        return remote_dict['id']
+
+    def add_snippet(self, sid, name, content, type='recv', priority='100'):
+        '''
+        Add a dynamic VCL snippet to a service's active version
+        '''
+
+        with self.lock:
+            snippet = self._add_container(sid, 'snippet', {
+                'name': name, 'type': type, 'priority': priority,
+                'dynamic': '1', 'content': content
+            })
+
+        return snippet['id']
+
+    def fail(self, method, path, status=503, times=1, after=0):
+        '''
+        Answer the next times requests matching method and the path
+        pattern with an error status, once after others have been
+        answered. A status of 'drop' closes the connection instead, and
+        'lose' closes it after the request is applied.
+        '''
+
+        with self.lock:
+            self.failures.append([method, path, status, times, after])
+
+    def active_version(self, sid):
+        '''
+        Get the number of a service's active version
+        '''
+
+        with self.lock:
+            return self._active_version(sid)['number']
+
+    def acl_entries(self, sid, name):
+        '''
+        Get the entries of an ACL in a service's active version
+        '''
+
+        with self.lock:
+            acl = self._find(sid, self._active_version(sid), 'acl', name)
+            return [_render_entry(acl, *entry)
+                    for entry in acl['entries'].items()]
+
+    def dict_items(self, sid, name):
+        '''
+        Get the items of a dictionary in a service's active version
+        '''
+
+        with self.lock:
+            return dict(self._find(
+                sid, self._active_version(sid), 'dictionary', name
+            )['items'])
+
+    def snippet(self, sid, name):
+        '''
+        Get a snippet in a service's active version
+        '''
+
+        with self.lock:
+            return _render_snippet(self._find(
+                sid, self._active_version(sid), 'snippet', name
+            ))
+
+    def begin(self, method):
+        '''
+        Count a request, and how many are being answered at once
+        '''
+
+        with self.lock:
+            self.requests[method] += 1
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+
+    def end(self):
+        with self.lock:
+            self.active -= 1
+
+    def injected_failure(self, method, path):
+        '''
+        Get the injected error status for a request, if any
+        '''
+
+        with self.lock:
+            for failure in self.failures:
+                if failure[0] != method or not re.fullmatch(failure[1], path):
+                    continue
+                if failure[4] > 0:
+                    failure[4] -= 1
+                elif failure[3] > 0:
+                    failure[3] -= 1
+                    return failure[2]
+
+        return None
+
+    def take_rate_limit(self):
+        '''
+        Count a modifying request against the rate limit, and get the rate
+        limit headers for its response: (headers, limited)
+        '''
+
+        if not self.rate_limit:
+            return {}, False
+
+        requests, seconds = self.rate_limit
+        with self.lock:
+            now = time.time()
+            if now >= self.rate_limit_reset:
+                self.rate_limit_remaining = requests
+                self.rate_limit_reset = now + seconds
+
+            limited = self.rate_limit_remaining <= 0
+            self.rate_limit_remaining = max(self.rate_limit_remaining - 1, 0)
+
+            headers = {
+                'Fastly-RateLimit-Remaining': str(self.rate_limit_remaining),
+                'Fastly-RateLimit-Reset': str(int(self.rate_limit_reset))
+            }
+
+        return headers, limited
+
+    def route(self, method, path, query, body, content_type):
+        '''
+        Answer a request with its endpoint: (data, links)
+        links are (rel, page) for a paginated response's Link header.
+        '''
+
+        try:
+            if content_type == 'application/json':
+                body = json.loads(body or 'null')
+            else:
+                body = dict(urllib.parse.parse_qsl(body))
+        except ValueError:
+            raise APIError(400, 'Invalid body')
+        query = dict(urllib.parse.parse_qsl(query))
+
+        for route_method, pattern, handler in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                with self.lock:
+                    return getattr(self, handler)(
+                        *match.groups(), query=query, body=body
+                    )
+
+        raise APIError(404, 'Record not found')
+
+    def _get_service(self, sid, **_):
+        return {
+            'id': sid,
+            'versions': [
+                {key: version[key]
+                 for key in ('number', 'active', 'locked')}
+                for version in self._versions(sid).values()
+            ]
+        }, None
+
+    def _clone_version(self, sid, number, **_):
+        versions = self._versions(sid)
+        version = self._version(sid, number)
+
+        clone = self._new_version(max(versions) + 1)
+        for kind in ('acl', 'dictionary', 'snippet'):
+            clone[kind].update(version[kind])
+        versions[clone['number']] = clone
+
+        return {'number': clone['number'], 'active': False,
+                'locked': False}, None
+
+    def _activate_version(self, sid, number, **_):
+        for version in self._versions(sid).values():
+            version['active'] = False
+
+        version = self._version(sid, number)
+        version.update(active=True, locked=True)
+
+        return {'number': version['number'], 'active': True,
+                'locked': True}, None
+
+    def _list_containers(self, sid, number, kind, **_):
+        version = self._version(sid, number)
+
+        return [
+            _render_container(self.containers[container_id])
+            for container_id in version[kind].values()
+        ], None
+
+    def _create_container(self, sid, number, kind, body, **_):
+        version = self._unlocked_version(sid, number)
+
+        if body.get('name') in version[kind]:
+            raise APIError(409, f'Duplicate record: {body.get("name")}')
+
+        container = self._new_container(sid, kind, body)
+        version[kind][container['name']] = container['id']
+
+        return _render_container(container), None
+
+    def _delete_container(self, sid, number, kind, name, **_):
+        version = self._unlocked_version(sid, number)
+
+        if version[kind].pop(name, None) is None:
+            raise APIError(404, 'Record not found')
+
+        return {'status': 'ok'}, None
+
+    def _get_dict_info(self, sid, number, name, **_):
+        remote_dict = self._find(sid, self._version(sid, number),
+                                 'dictionary', name)
+
+        return {'item_count': len(remote_dict['items'])}, None
+
+    def _get_snippet(self, sid, snippet_id, **_):
+        return _render_snippet(
+            self._container(sid, 'snippet', snippet_id)
+        ), None
+
+    def _update_snippet(self, sid, snippet_id, body, **_):
+        snippet = self._container(sid, 'snippet', snippet_id)
+        snippet['content'] = body.get('content', snippet['content'])
+
+        return _render_snippet(snippet), None
+
+    def _get_entries(self, sid, acl_id, query, **_):
+        acl = self._container(sid, 'acl', acl_id)
+
+        return self._page(acl, 'entries', query, lambda entry: (
+            _render_entry(acl, *entry)
+        ))
+
+    def _get_items(self, sid, dict_id, query, **_):
+        remote_dict = self._container(sid, 'dictionary', dict_id)
+
+        return self._page(remote_dict, 'items', query, lambda item: {
+            'dictionary_id': remote_dict['id'],
+            'service_id': remote_dict['service_id'],
+            'item_key': item[0],
+            'item_value': item[1]
+        })
+
+    def _patch_entries(self, sid, acl_id, body, **_):
+        acl = self._container(sid, 'acl', acl_id)
+        self._apply_entries(acl, self._batch(body, 'entries'))
+
+        return {'status': 'ok'}, None
+
+    def _patch_items(self, sid, dict_id, body, **_):
+        remote_dict = self._container(sid, 'dictionary', dict_id)
+        items = remote_dict['items']
+        ops = self._batch(body, 'items')
+
+        # check every operation before applying any
+        for op in ops:
+            if op.get('op') not in ('create', 'update', 'upsert', 'delete') \
+                    or 'item_key' not in op:
+                raise APIError(400, f'Invalid operation: {op}')
+            if op['op'] in ('update', 'delete') \
+                    and op['item_key'] not in items:
+                raise APIError(404, f'Record not found: {op["item_key"]}')
+
+        for op in ops:
+            if op['op'] == 'delete':
+                del items[op['item_key']]
+            else:
+                items[op['item_key']] = str(op.get('item_value', ''))
+        remote_dict['pages'] = None
+
+        return {'status': 'ok'}, None
+
+    def _page(self, container, key, query, render):
+        '''
+        Get a page of a container's entries: (data, links)
+        A list of the entries is kept between reads of their pages.
+        '''
+
+        try:
+            page = int(query.get('page', 1))
+            per_page = min(int(query.get('per_page', 100)), self.per_page)
+        except ValueError:
+            raise APIError(400, 'Invalid page')
+
+        if container['pages'] is None:
+            container['pages'] = list(container[key].items())
+        entries = container['pages']
+
+        last = max((len(entries) + per_page - 1) // per_page, 1)
+        links = [('last', last)]
+        if page < last:
+            links.insert(0, ('next', page + 1))
+
+        return [
+            render(entry)
+            for entry in entries[(page - 1) * per_page:page * per_page]
+        ], links
+
+    def _batch(self, body, key):
+        '''
+        Get the operations of a batch update
+        '''
+
+        try:
+            ops = body[key]
+        except (KeyError, TypeError):
+            raise APIError(400, f'Missing {key}')
+
+        if len(ops) > self.max_batch:
+            raise APIError(413, f'Too many operations: {len(ops)}')
+
+        return ops
+
+    def _apply_entries(self, acl, ops):
+        '''
+        Apply ACL entry operations, checking them all first
+        '''
+
+        entries = acl['entries']
+        for op in ops:
+            if op.get('op') == 'create':
+                if 'ip' not in op:
+                    raise APIError(400, f'Invalid operation: {op}')
+            elif op.get('op') in ('update', 'delete'):
+                if op.get('id') not in entries:
+                    raise APIError(404, f'Record not found: {op.get("id")}')
+            else:
+                raise APIError(400, f'Invalid operation: {op}')
+
+        created = sum(op['op'] == 'create' for op in ops)
+        deleted = sum(op['op'] == 'delete' for op in ops)
+        if self.max_acl_entries is not None and \
+                len(entries) + created - deleted > self.max_acl_entries:
+            raise APIError(400, 'Exceeded number of entries')
+
+        for op in ops:
+            if op['op'] == 'delete':
+                del entries[op['id']]
+                continue
+
+            if op['op'] == 'create':
+                entry_id = f'ENTRY{next(self.ids)}'
+                ip, subnet, negated = op['ip'], None, '0'
+            else:
+                entry_id = op['id']
+                ip, subnet, negated = entries[entry_id]
+
+            ip = op.get('ip', ip)
+            subnet = op.get('subnet', subnet)
+            if 'negated' in op:
+                negated = '1' if op['negated'] in (True, 1, '1') else '0'
+            entries[entry_id] = (
+                ip, None if subnet is None else int(subnet), negated
+            )
+
+        acl['pages'] = None
+
+    def _new_version(self, number):
+        return {
+            'number': number, 'active': False, 'locked': False,
+            # name -> container id
+            'acl': {}, 'dictionary': {}, 'snippet': {}
+        }
+
+    def _new_container(self, sid, kind, fields):
+        container = dict(fields)
+        container.update(
+            id=f'{kind.upper()}{next(self.ids)}', service_id=sid, kind=kind
+        )
+        if kind == 'acl':
+            container.update(entries={}, pages=None)
+        elif kind == 'dictionary':
+            container.update(items={}, pages=None)
+        self.containers[container['id']] = container
+
+        return container
+
+    def _add_container(self, sid, kind, fields):
+        container = self._new_container(sid, kind, fields)
+        self._active_version(sid)[kind][container['name']] = container['id']
+
+        return container
+
+    def _versions(self, sid):
+        try:
+            return self.services[sid]
+        except KeyError:
+            raise APIError(404, f'Record not found: {sid}')
+
+    def _version(self, sid, number):
+        try:
+            return self._versions(sid)[int(number)]
+        except KeyError:
+            raise APIError(404, f'Record not found: version {number}')
+
+    def _unlocked_version(self, sid, number):
+        version = self._version(sid, number)
+        if version['locked']:
+            raise APIError(400, f'Version {number} is locked')
+
+        return version
+
+    def _active_version(self, sid):
+        for version in self._versions(sid).values():
+            if version['active']:
+                return version
+
+        raise APIError(404, f'No active version: {sid}')
+
+    def _find(self, sid, version, kind, name):
+        try:
+            return self.containers[version[kind][name]]
+        except KeyError:
+            raise APIError(404, f'Record not found: {name}')
+
+    def _container(self, sid, kind, container_id):
+        container = self.containers.get(container_id)
+        if not container or container['service_id'] != sid \
+                or container['kind'] != kind:
+            raise APIError(404, f'Record not found: {container_id}')
+
+        return container
+
+
+def _render_container(container):
+    '''
+    Get the API's view of an ACL, dictionary or snippet, without contents
+    '''
+
+    return {
+        key: value for key, value in container.items()
+        if key not in ('kind', 'entries', 'items', 'pages', 'content')
+    }
+
+
+def _render_snippet(snippet):
+    '''
+    Get the API's view of a snippet, with its content
+    '''
+
+    return dict(_render_container(snippet), content=snippet['content'])
+
+
+def _render_entry(acl, entry_id, entry):
+    '''
+    Get the API's view of an ACL entry
+    '''
+
+    ip, subnet, negated = entry
+
+    return {
+        'acl_id': acl['id'],
+        'service_id': acl['service_id'],
+        'id': entry_id,
+        'ip': ip,
+        'subnet': subnet,
+        'negated': negated,
+        'comment': ''
+    }
@@ -5,6 +5,7 @@ Test environment creation with lib Environment()
 import unittest
 
 import os
+import json
 import argparse
 
 from lib import Environment
@@ -27,7 +28,8 @@ class EnvironmentTests(unittest.TestCase):
             log='',
             block='',
             force=False,
-            verbose=False
+            verbose=False,
+            convert=None
         )
 
     def tearDown(self):
@@ -136,6 +138,86 @@ class EnvironmentTests(unittest.TestCase):
         self.assertFalse(env.config['lists'])
         self.assertEqual(env.config['log'], '')
 
+    def test_load_config_migrate_items(self):
+        '''
+        test loading a config file with dict type list items in an array
+        '''
+
+        config = {
+            'log': '',
+            'block': '',
+            'services': [],
+            'lists': [
+                {
+                    'name': 'a_temp_list',
+                    'type': 'temp',
+                    'match': 'exact',
+                    'items': [
+                        {'10.0.0.1': 200},
+                        {'10.0.0.2': '300'},
+                        {'10.0.0.1': 100}
+                    ]
+                },
+                {
+                    'name': 'a_block_list',
+                    'type': 'block',
+                    'match': 'exact',
+                    'items': ['10.0.0.0/8']
+                }
+            ]
+        }
+        with open('tests.blocklist', 'w') as file_config:
+            file_config.write(json.dumps(config))
+
+        self.args.init = False
+        env = Environment(self.args)
+
+        # ensure dict items are keyed, deduplicated and temp values are ints
+        self.assertEqual(
+            env.config['lists'][0]['items'],
+            {'10.0.0.1': 200, '10.0.0.2': 300}
+        )
+        self.assertEqual(env.config['lists'][1]['items'], ['10.0.0.0/8'])
+
+    def test_convert_config(self):
+        '''
+        test converting a config file to binary and back to JSON
+        '''
+
+        # create a new config file with a list
+        env = Environment(self.args)
+        env.config['lists'].append({
+            'name': 'a_block_list',
+            'type': 'block',
+            'match': 'exact',
+            'items': ['10.0.0.0/8']
+        })
+        env.save_config()
+
+        # convert it to binary
+        self.args.init = False
+        self.args.convert = 'binary'
+        Environment(self.args).save_config()
+
+        with open('tests.blocklist', 'rb') as file_config:
+            self.assertEqual(file_config.read(7), b'FBLBIN1')
+
+        # ensure later saves keep the binary format
+        self.args.convert = None
+        env = Environment(self.args)
+        self.assertEqual(env.config_format, 'binary')
+        self.assertEqual(env.config['lists'][0]['items'], ['10.0.0.0/8'])
+        env.save_config()
+
+        # convert it back to JSON
+        self.args.convert = 'json'
+        Environment(self.args).save_config()
+
+        with open('tests.blocklist') as file_config:
+            config = json.load(file_config)
+
+        self.assertEqual(config['lists'][0]['items'], ['10.0.0.0/8'])
+
     def test_load_config_override_services(self):
         '''
         test runtime override of args.services
@@ -0,0 +1,74 @@
+'''
+Test reading list items with lib feed
+'''
+
+import unittest
+
+import os
+import bz2
+import gzip
+
+from lib import feed
+
+
+class FeedTests(unittest.TestCase):
+    '''
+    Test reading list items with feed
+    '''
+
+    def setUp(self):
+        self.lines = '# a comment\n10.0.0.1\n\n  \n10.0.0.2\r\n#10.0.0.3\n'
+
+    def tearDown(self):
+        try:
+            os.remove('tests.items')
+        except BaseException:
+            pass
+
+    def _read(self):
+        file_items = feed.open_feed('tests.items')
+        with file_items:
+            return list(feed.read_items(file_items))
+
+    def test_read_items(self):
+        '''
+        read a plain text file, skipping comments and blank lines
+        '''
+
+        with open('tests.items', 'w') as file_items:
+            file_items.write(self.lines)
+
+        self.assertEqual(self._read(), ['10.0.0.1', '10.0.0.2'])
+
+    def test_read_items_gzip(self):
+        '''
+        read a gzip compressed file
+        '''
+
+        with gzip.open('tests.items', 'wt') as file_items:
+            file_items.write(self.lines)
+
+        self.assertEqual(self._read(), ['10.0.0.1', '10.0.0.2'])
+
+    def test_read_items_bz2(self):
+        '''
+        read a bz2 compressed file
+        '''
+
+        with bz2.open('tests.items', 'wt') as file_items:
+            file_items.write(self.lines)
+
+        self.assertEqual(self._read(), ['10.0.0.1', '10.0.0.2'])
+
+    def test_batched(self):
+        '''
+        group items into bounded-size batches
+        '''
+
+        batches = list(feed.batched(range(5), size=2))
+
+        self.assertEqual(batches, [[0, 1], [2, 3], [4]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+'''
+Test indexing lists with lib ListIndex()
+'''
+
+import unittest
+
+import argparse
+
+from lib.index import ListIndex
+
+
+class IndexTests(unittest.TestCase):
+    '''
+    Test indexing lists with ListIndex()
+    '''
+
+    def setUp(self):
+        self.env = argparse.Namespace(
+            config={
+                'lists': [
+                    {
+                        'name': 'a_block_list',
+                        'type': 'block',
+                        'match': 'exact',
+                        'items': ['10.0.0.0/8', '!10.0.0.1/32']
+                    },
+                    {
+                        'name': 'a_geo_list',
+                        'type': 'geo',
+                        'match': 'exact',
+                        'items': {'US': 'fastly-blocklist'}
+                    }
+                ]
+            }
+        )
+
+    def test_add(self):
+        '''
+        add new and duplicate items to a list
+        '''
+
+        index = ListIndex(self.env)
+
+        self.assertTrue(index.add('a_block_list', '192.168.0.0/16'))
+        self.assertFalse(index.add('a_block_list', '10.0.0.0/8'))
+        index.flush()
+
+        self.assertEqual(
+            self.env.config['lists'][0]['items'],
+            ['10.0.0.0/8', '!10.0.0.1/32', '192.168.0.0/16']
+        )
+
+    def test_remove(self):
+        '''
+        remove existing and missing items from a list
+        '''
+
+        index = ListIndex(self.env)
+
+        self.assertTrue(index.remove('a_block_list', '10.0.0.0/8'))
+        self.assertFalse(index.remove('a_block_list', '10.0.0.0/8'))
+        index.flush()
+
+        self.assertEqual(
+            self.env.config['lists'][0]['items'],
+            ['!10.0.0.1/32']
+        )
+
+    def test_lookup(self):
+        '''
+        look up dict items by key
+        '''
+
+        index = ListIndex(self.env)
+
+        self.assertEqual(
+            index.lookup('a_geo_list', 'US'),
+            {'US': 'fastly-blocklist'}
+        )
+        self.assertIsNone(index.lookup('a_geo_list', 'RU'))
+
+        index.remove('a_geo_list', {'US': 'fastly-blocklist'})
+        self.assertIsNone(index.lookup('a_geo_list', 'US'))
+
+    def test_expire(self):
+        '''
+        remove expired items from a temp list
+        '''
+
+        self.env.config['lists'].append({
+            'name': 'a_temp_list',
+            'type': 'temp',
+            'match': 'exact',
+            'items': {'10.0.0.1': 100, '10.0.0.2': 300, '10.0.0.3': 200}
+        })
+
+        index = ListIndex(self.env)
+
+        self.assertEqual(index.expire('a_temp_list', 250), 2)
+        self.assertEqual(index.expire('a_temp_list', 250), 0)
+
+        # items added after a clean are expired by the next
+        index.add('a_temp_list', {'10.0.0.4': 150})
+        self.assertEqual(index.expire('a_temp_list', 250), 1)
+        index.flush()
+
+        self.assertEqual(
+            self.env.config['lists'][2]['items'],
+            {'10.0.0.2': 300}
+        )
+
+    def test_flush_untouched(self):
+        '''
+        ensure lists that weren't modified are left alone
+        '''
+
+        items = self.env.config['lists'][1]['items']
+
+        index = ListIndex(self.env)
+        index.lookup('a_geo_list', 'US')
+        index.flush()
+
+        self.assertIs(self.env.config['lists'][1]['items'], items)
+
+
+if __name__ == '__main__':
+    unittest.main()
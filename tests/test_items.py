@@ -28,7 +28,11 @@ class ItemTests(unittest.TestCase):
             log='',
             block='',
             force=False,
-            verbose=False
+            verbose=False,
+            aggregate=False,
+            jobs=1,
+            replace=False,
+            convert=None
         )
 
     def tearDown(self):
@@ -97,7 +101,7 @@ class ItemTests(unittest.TestCase):
         Items(self.args, env)
 
         self.assertEqual(
-            env.config['lists'][0]['items'][0]['US'],
+            env.config['lists'][0]['items']['US'],
             'fastly-blocklist'
         )
 
@@ -383,12 +387,45 @@ class ItemTests(unittest.TestCase):
         expiration_time = int(time.time()) + self.args.block_length
         Items(self.args, env)
 
-        self.assertTrue(env.config['lists'][0]['items'][0]['10.0.0.1'])
+        self.assertTrue(env.config['lists'][0]['items']['10.0.0.1'])
         self.assertEqual(
-            env.config['lists'][0]['items'][0]['10.0.0.1'],
+            env.config['lists'][0]['items']['10.0.0.1'],
             expiration_time
         )
 
+    def test_add_temp_refresh(self):
+        '''
+        try to re-add an item to temp list, refreshing its expiration
+        '''
+
+        self.args.new = True
+        self.args.delete = False
+        self.args.list = ['a_new_list']
+        self.args.type = 'temp'
+        self.args.action = 'block'
+        self.args.match = 'exact'
+        self.args.variable = None
+        self.args.block_length = 600
+
+        self.args.add = True
+        self.args.remove = False
+        self.args.clean = False
+        self.args.removeall = False
+        self.args.item = ['10.0.0.1']
+        self.args.file = None
+
+        # create a new environment
+        env = Environment(self.args)
+        Lists(self.args, env)
+        Items(self.args, env)
+
+        env.config['lists'][0]['items']['10.0.0.1'] = 1
+        self.args.new = False
+        Items(self.args, env)
+
+        self.assertEqual(len(env.config['lists'][0]['items']), 1)
+        self.assertGreater(env.config['lists'][0]['items']['10.0.0.1'], 1)
+
     def test_add_temp_bad(self):
         '''
         try to add an invalid new item to temp list
@@ -444,7 +481,7 @@ class ItemTests(unittest.TestCase):
         Items(self.args, env)
 
         self.assertEqual(
-            env.config['lists'][0]['items'][0]['ABC'],
+            env.config['lists'][0]['items']['ABC'],
             'fastly-blocklist'
         )
 
@@ -519,6 +556,182 @@ class ItemTests(unittest.TestCase):
 
         self.assertFalse(env.config['lists'][2]['items'])
 
+    def test_add_block_file_jobs(self):
+        '''
+        try to add items from args.file using a process pool
+        '''
+
+        items = [f'10.0.{i // 256}.{i % 256}' for i in range(20000)]
+        with open('tests.items', 'w') as file_items:
+            file_items.write('\n'.join(items + ['867-5309']))
+
+        self.args.new = True
+        self.args.delete = False
+        self.args.list = ['a_new_list']
+        self.args.type = 'block'
+        self.args.action = 'block'
+        self.args.match = 'exact'
+        self.args.variable = None
+        self.args.block_length = None
+
+        self.args.add = True
+        self.args.remove = False
+        self.args.clean = False
+        self.args.removeall = False
+        self.args.item = []
+        self.args.file = 'tests.items'
+        self.args.jobs = 2
+
+        # create a new environment
+        env = Environment(self.args)
+        Lists(self.args, env)
+        Items(self.args, env)
+
+        # ensure items are merged back in input order
+        self.assertEqual(
+            env.config['lists'][0]['items'],
+            [f'{item}/32' for item in items]
+        )
+
+    def test_add_block_range(self):
+        '''
+        try to add an IP range to block list
+        '''
+
+        self.args.new = True
+        self.args.delete = False
+        self.args.list = ['a_new_list']
+        self.args.type = 'block'
+        self.args.action = 'block'
+        self.args.match = 'exact'
+        self.args.variable = None
+        self.args.block_length = None
+
+        self.args.add = True
+        self.args.remove = False
+        self.args.clean = False
+        self.args.removeall = False
+        self.args.item = ['10.0.0.0-10.0.1.255']
+        self.args.file = None
+
+        # create a new environment
+        env = Environment(self.args)
+        Lists(self.args, env)
+        Items(self.args, env)
+
+        self.assertEqual(
+            env.config['lists'][0]['items'],
+            ['10.0.0.0/23']
+        )
+
+    def test_aggregate(self):
+        '''
+        try to aggregate overlapping and adjacent networks in a block list
+        '''
+
+        self.args.new = True
+        self.args.delete = False
+        self.args.list = ['a_new_list']
+        self.args.type = 'block'
+        self.args.action = 'block'
+        self.args.match = 'exact'
+        self.args.variable = None
+        self.args.block_length = None
+
+        self.args.add = True
+        self.args.remove = False
+        self.args.clean = False
+        self.args.removeall = False
+        self.args.aggregate = True
+        self.args.item = [
+            '10.0.0.0/25', '10.0.0.128/25', '10.0.0.1', '!10.0.1.0/24',
+            '10.0.1.1'
+        ]
+        self.args.file = None
+
+        # create a new environment
+        env = Environment(self.args)
+        Lists(self.args, env)
+        Items(self.args, env)
+
+        self.assertEqual(
+            env.config['lists'][0]['items'],
+            ['10.0.0.0/24', '!10.0.1.0/24', '10.0.1.1/32']
+        )
+
+    def test_replace(self):
+        '''
+        try to replace the items in a block list, keeping unchanged items
+        '''
+
+        self.args.new = True
+        self.args.delete = False
+        self.args.list = ['a_new_list']
+        self.args.type = 'block'
+        self.args.action = 'block'
+        self.args.match = 'exact'
+        self.args.variable = None
+        self.args.block_length = None
+
+        self.args.add = True
+        self.args.remove = False
+        self.args.clean = False
+        self.args.removeall = False
+        self.args.item = ['10.0.0.1', '10.0.0.2', '10.0.0.3']
+        self.args.file = None
+
+        # create a new environment
+        env = Environment(self.args)
+        Lists(self.args, env)
+        Items(self.args, env)
+
+        self.args.add = False
+        self.args.replace = True
+        self.args.item = ['10.0.0.3', '10.0.0.4', '10.0.0.1']
+        Items(self.args, env)
+
+        self.assertEqual(
+            env.config['lists'][0]['items'],
+            ['10.0.0.1/32', '10.0.0.3/32', '10.0.0.4/32']
+        )
+
+    def test_replace_temp(self):
+        '''
+        try to replace the items in a temp list, keeping existing expirations
+        '''
+
+        self.args.new = True
+        self.args.delete = False
+        self.args.list = ['a_new_list']
+        self.args.type = 'temp'
+        self.args.action = 'block'
+        self.args.match = 'exact'
+        self.args.variable = None
+        self.args.block_length = 600
+
+        self.args.add = True
+        self.args.remove = False
+        self.args.clean = False
+        self.args.removeall = False
+        self.args.item = ['10.0.0.1', '10.0.0.2']
+        self.args.file = None
+
+        # create a new environment
+        env = Environment(self.args)
+        Lists(self.args, env)
+        Items(self.args, env)
+
+        env.config['lists'][0]['items']['10.0.0.1'] = 1
+
+        self.args.add = False
+        self.args.replace = True
+        self.args.item = ['10.0.0.1', '10.0.0.3']
+        Items(self.args, env)
+
+        self.assertEqual(len(env.config['lists'][0]['items']), 2)
+        self.assertEqual(env.config['lists'][0]['items']['10.0.0.1'], 1)
+        self.assertIn('10.0.0.3', env.config['lists'][0]['items'])
+
     def test_remove_item_bad(self):
         '''
         try to remove item when no args.item or args.file provided
@@ -707,7 +920,7 @@ class ItemTests(unittest.TestCase):
         Items(self.args, env)
 
         force_expiration_time = int(time.time()) - self.args.block_length
-        env.config['lists'][0]['items'][0]['10.0.0.1'] = force_expiration_time
+        env.config['lists'][0]['items']['10.0.0.1'] = force_expiration_time
 
         self.args.add = False
         self.args.list = []
@@ -743,7 +956,7 @@ class ItemTests(unittest.TestCase):
         Items(self.args, env)
 
         force_expiration_time = int(time.time()) - self.args.block_length
-        env.config['lists'][0]['items'][0]['10.0.0.1'] = force_expiration_time
+        env.config['lists'][0]['items']['10.0.0.1'] = force_expiration_time
 
         self.args.add = False
         self.args.clean = True
@@ -816,6 +1029,55 @@ class ItemTests(unittest.TestCase):
 
         self.assertFalse(env.config['lists'][0]['items'])
 
+    def test_add_binary_config(self):
+        '''
+        ensure only the lists being updated are loaded from a binary config
+        '''
+
+        self.args.new = True
+        self.args.delete = False
+        self.args.list = ['a_block_list', 'another_block_list']
+        self.args.type = 'block'
+        self.args.action = 'block'
+        self.args.match = 'exact'
+        self.args.variable = None
+        self.args.block_length = None
+
+        self.args.add = True
+        self.args.remove = False
+        self.args.clean = False
+        self.args.removeall = False
+        self.args.item = ['10.0.0.1']
+        self.args.file = None
+
+        # create a binary config with two lists
+        self.args.convert = 'binary'
+        env = Environment(self.args)
+        Lists(self.args, env)
+        Items(self.args, env)
+        env.save_config()
+
+        # add an item to one of the lists
+        self.args.init = False
+        self.args.new = False
+        self.args.convert = None
+        self.args.list = ['another_block_list']
+        self.args.item = ['10.0.0.2']
+
+        env = Environment(self.args)
+        Items(self.args, env)
+        env.save_config()
+
+        self.assertFalse(env.config['lists'][0].loaded())
+
+        env = Environment(self.args)
+
+        self.assertEqual(env.config['lists'][0]['items'], ['10.0.0.1/32'])
+        self.assertEqual(
+            env.config['lists'][1]['items'],
+            ['10.0.0.1/32', '10.0.0.2/32']
+        )
+
 
 if __name__ == '__main__':
     unittest.main()
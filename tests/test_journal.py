@@ -0,0 +1,106 @@
+'''
+Test resuming commits with lib journal
+'''
+
+import unittest
+
+import os
+import tempfile
+import collections
+
+from lib.journal import Journal
+
+
+class JournalTests(unittest.TestCase):
+    '''
+    Test resuming commits with journal
+    '''
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'config.blocklist.journal')
+
+    def test_skip_applied(self):
+        '''
+        ensure journaled batches are skipped when resuming, unless changed
+        '''
+
+        ops = [{'op': 'create', 'ip': f'10.0.0.{op}'} for op in range(10)]
+
+        journal = Journal(self.path)
+        journal.record('SERVICEID', 1, 'ACLID', 2, ops[2:5])
+        journal.record('SERVICEID', 1, 'ACLID', 7, ops[7:9])
+        journal.save_remote({'service_id': 'SERVICEID', 'version': 1})
+        journal.file.close()
+
+        journal = Journal(self.path, resume=True)
+        self.assertEqual(
+            journal.remote, {'SERVICEID': {'service_id': 'SERVICEID',
+                                           'version': 1}}
+        )
+
+        counts = collections.Counter()
+        self.assertEqual(
+            list(journal.skip_applied('SERVICEID', 1, 'ACLID', ops, counts)),
+            [(index, ops[index]) for index in (0, 1, 5, 6, 9)]
+        )
+        self.assertEqual(counts['skip'], 5)
+
+        # the operations changed since they were journaled
+        changed = ops[:3] + [{'op': 'delete', 'id': '1'}] + ops[4:]
+        counts = collections.Counter()
+        self.assertEqual(
+            [index for index, _ in journal.skip_applied(
+                'SERVICEID', 1, 'ACLID', changed, counts
+            )],
+            [0, 1, 2, 3, 4, 5, 6, 9]
+        )
+        self.assertEqual(counts['skip'], 2)
+
+        # another version of the service
+        self.assertEqual(
+            len(list(journal.skip_applied('SERVICEID', 2, 'ACLID', ops, {}))),
+            10
+        )
+
+        journal.finish()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_truncated(self):
+        '''
+        ensure a record cut short is ignored
+        '''
+
+        journal = Journal(self.path)
+        journal.record('SERVICEID', 1, 'ACLID', 0, [{'op': 'create'}])
+        journal.file.write('{"applied": ["SERVICEID", 1')
+        journal.file.close()
+
+        journal = Journal(self.path, resume=True)
+        applied = journal.applied[('SERVICEID', 1, 'ACLID')]
+        self.assertEqual(list(applied), [0])
+        self.assertEqual(applied[0][0], 1)
+
+    def test_lost(self):
+        '''
+        ensure a service with a lost batch isn't resumed from its old live
+        config
+        '''
+
+        journal = Journal(self.path)
+        for sid in ('SERVICEID', 'OTHERID'):
+            journal.record(sid, 1, 'ACLID', 0, [{'op': 'create'}])
+        journal.lost('SERVICEID')
+        for sid in ('SERVICEID', 'OTHERID'):
+            journal.save_remote({'service_id': sid, 'version': 1})
+        journal.file.close()
+
+        journal = Journal(self.path, resume=True)
+        self.assertEqual(journal.lost_sids, {'SERVICEID'})
+        self.assertEqual(list(journal.remote), ['OTHERID'])
+        self.assertEqual(list(journal.applied), [('OTHERID', 1, 'ACLID')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -27,7 +27,8 @@ class ListTests(unittest.TestCase):
             log='',
             block='',
             force=False,
-            verbose=False
+            verbose=False,
+            convert=None
         )
 
     def tearDown(self):
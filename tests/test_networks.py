@@ -0,0 +1,143 @@
+'''
+Test validating IP addresses and networks with lib networks
+'''
+
+import unittest
+
+from lib import networks
+
+
+class NetworkTests(unittest.TestCase):
+    '''
+    Test validating IP addresses and networks with networks
+    '''
+
+    def test_validate_networks(self):
+        '''
+        validate and canonicalize IPv4/IPv6 items, with negation
+        '''
+
+        valid, rejects = networks.validate_networks([
+            '10.0.0.1',
+            '!10.0.0.0/8',
+            '2a04:4e42:0010:0000:0000:0000:0000:0313',
+            '2001:db8::/32'
+        ])
+
+        self.assertEqual(valid, [
+            '10.0.0.1/32',
+            '!10.0.0.0/8',
+            '2a04:4e42:10::313/128',
+            '2001:db8::/32'
+        ])
+        self.assertFalse(rejects)
+
+    def test_validate_networks_host_bits(self):
+        '''
+        ensure host bits are masked off
+        '''
+
+        valid, rejects = networks.validate_networks([
+            '10.1.2.3/8',
+            '!2001:db8::1/32'
+        ])
+
+        self.assertEqual(valid, ['10.0.0.0/8', '!2001:db8::/32'])
+        self.assertFalse(rejects)
+
+    def test_validate_networks_bad(self):
+        '''
+        ensure invalid items are rejected
+        '''
+
+        items = ['867-5309', '10.0.0.1/33', '010.0.0.1', '!', '', '1.2.3.4/']
+
+        valid, rejects = networks.validate_networks(items)
+
+        self.assertFalse(valid)
+        self.assertEqual(rejects, items)
+
+    def test_validate_networks_slow_path(self):
+        '''
+        ensure forms only ipaddress understands are canonicalized the same way
+        '''
+
+        valid, rejects = networks.validate_networks([
+            '10.1.2.3/255.0.0.0',
+            '::ffff:1.2.3.4'
+        ])
+
+        self.assertEqual(valid, ['10.0.0.0/8', '::ffff:102:304/128'])
+        self.assertFalse(rejects)
+
+    def test_validate_ranges(self):
+        '''
+        expand start-end ranges into the networks covering them
+        '''
+
+        valid, rejects = networks.validate_networks([
+            '10.0.0.0-10.0.0.255',
+            '!10.0.1.1-10.0.1.4',
+            '10.0.0.9-10.0.0.1',
+            '10.0.0.1-2001:db8::1'
+        ])
+
+        self.assertEqual(valid, [
+            '10.0.0.0/24',
+            '!10.0.1.1/32',
+            '!10.0.1.2/31',
+            '!10.0.1.4/32'
+        ])
+        self.assertEqual(
+            rejects, ['10.0.0.9-10.0.0.1', '10.0.0.1-2001:db8::1']
+        )
+
+    def test_aggregate_networks(self):
+        '''
+        collapse covered and adjacent networks
+        '''
+
+        aggregated = networks.aggregate_networks([
+            '10.0.0.0/25',
+            '10.0.0.128/25',
+            '10.0.0.5/32',
+            '2001:db8:8000::/33',
+            '2001:db8::/33'
+        ])
+
+        self.assertEqual(aggregated, ['10.0.0.0/24', '2001:db8::/32'])
+
+    def test_aggregate_networks_negated(self):
+        '''
+        ensure networks separated by a negated network aren't collapsed
+        '''
+
+        items = ['10.0.0.0/16', '!10.0.0.0/24', '10.0.0.1/32', '!10.0.0.1/32']
+
+        self.assertEqual(networks.aggregate_networks(items), [
+            '10.0.0.0/16', '!10.0.0.0/24', '10.0.0.1/32', '!10.0.0.1/32'
+        ])
+
+        items = ['10.0.0.0/16', '!10.0.0.0/24', '10.0.0.0/25',
+                 '10.0.0.128/25']
+
+        self.assertEqual(networks.aggregate_networks(items), [
+            '10.0.0.0/16', '!10.0.0.0/24', '10.0.0.0/25', '10.0.0.128/25'
+        ])
+
+    def test_validate_addresses(self):
+        '''
+        validate items that must be single addresses
+        '''
+
+        valid, rejects = networks.validate_networks(
+            ['10.0.0.1', '2A04:4E42::313', '10.0.0.0/8', '!10.0.0.1'],
+            address_only=True
+        )
+
+        self.assertEqual(valid, ['10.0.0.1', '2a04:4e42::313'])
+        self.assertEqual(rejects, ['10.0.0.0/8', '!10.0.0.1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
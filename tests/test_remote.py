@@ -0,0 +1,612 @@
+'''
+Test diffing remote config with lib remote
+'''
+
+import unittest
+
+import urllib.parse
+
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+import collections
+
+from concurrent import futures
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lib import remote, transport, Remote
+from lib.state import RemoteItems, _remote_acl_item, _remote_dict_item
+from tests.fastly_api import FastlyAPI
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    '''
+    Answer reads of a service with 8 ACLs and dictionaries, slowly, tracking
+    how many requests are answered at once
+    '''
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.active += 1
+            self.server.most_active = max(
+                self.server.most_active, self.server.active
+            )
+
+        path = self.path.split('/')[3:]
+        if not path:
+            data = {'versions': [{'number': 1, 'active': True}]}
+        elif path[-1] in ('acl', 'dictionary'):
+            data = [
+                {'name': f'fastlyblocklist_{path[-1]}_{number}',
+                 'id': str(number)}
+                for number in range(8)
+            ] + [{'name': 'another_list', 'id': 'ANOTHERID'}]
+        elif path[-1] == 'snippet':
+            data = []
+        elif path[-1] == 'info':
+            data = {'item_count': 1}
+        else:
+            # earlier lists take longer to fetch
+            time.sleep(0.01 * (8 - int(path[1])))
+            if path[0] == 'acl':
+                data = [{'id': path[1], 'ip': '10.0.0.0', 'negated': '0',
+                         'subnet': int(path[1])}]
+            else:
+                data = [{'item_key': path[1], 'item_value': '1'}]
+
+        with self.server.lock:
+            self.server.active -= 1
+
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PagesHandler(BaseHTTPRequestHandler):
+    '''
+    Answer reads of paginated entries, at most 10 to a page
+    '''
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+
+        query = urllib.parse.parse_qs(url.query)
+        page = int(query['page'][0])
+        per_page = min(int(query['per_page'][0]), 10)
+
+        entries = self.server.entries
+        last = max((len(entries) + per_page - 1) // per_page, 1)
+        data = entries[(page - 1) * per_page:page * per_page]
+
+        # entries deleted while the first page is read shift later pages
+        if page == 1:
+            del entries[:self.server.deleted]
+
+        links = []
+        if self.server.links in ('last', 'next') and page < last:
+            links.append(f'<http://api{url.path}?page={page + 1}>; '
+                         f'rel="next"')
+        if self.server.links == 'last':
+            links.append(f'<http://api{url.path}?page={last}>; rel="last"')
+
+        self.respond(data, links)
+
+    def respond(self, data, links):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        if links:
+            self.send_header('Link', ', '.join(links))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RemoteTests(unittest.TestCase):
+    '''
+    Test diffing remote config with remote
+    '''
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.config_file = os.path.join(tmp.name, 'config.blocklist')
+
+    def test_diff_acl(self):
+        '''
+        delete remote entries missing locally, then create new entries
+        '''
+
+        from_items = [
+            {'id': '1', 'ip': '10.0.0.0', 'negated': '0', 'subnet': 8},
+            {'id': '2', 'ip': '10.0.0.1', 'negated': '0', 'subnet': 32}
+        ]
+        to_items = RemoteItems(
+            ['10.0.0.0/8', '!10.0.0.1/32'], _remote_acl_item
+        )
+
+        self.assertEqual(list(remote.diff_acl(from_items, to_items)), [
+            {'op': 'delete', 'id': '2'},
+            {'op': 'create', 'ip': '10.0.0.1', 'negated': '1', 'subnet': 32}
+        ])
+
+    def test_diff_acl_normalized(self):
+        '''
+        ensure entries written differently are matched
+        '''
+
+        from_items = [
+            {'id': '1', 'ip': '10.0.0.1', 'negated': '0', 'subnet': None},
+            {'id': '2', 'ip': '2001:DB8:0::1', 'negated': 1},
+            {'id': '3', 'ip': '10.0.0.0', 'negated': False, 'subnet': '8'}
+        ]
+        to_items = RemoteItems(
+            ['10.0.0.1/32', '!2001:db8::1/128', '10.0.0.0/8', '10.0.0.2'],
+            _remote_acl_item
+        )
+
+        self.assertEqual(list(remote.diff_acl(from_items, to_items)), [
+            {'op': 'create', 'ip': '10.0.0.2', 'negated': '0', 'subnet': 32}
+        ])
+
+    def test_diff_dict(self):
+        '''
+        delete remote items missing locally, then create new items
+        '''
+
+        from_items = [
+            {'item_key': '10.0.0.1', 'item_value': '100'},
+            {'item_key': '10.0.0.2', 'item_value': '200'}
+        ]
+        to_items = RemoteItems(
+            {'10.0.0.1': 100, '10.0.0.3': 300}.items(), _remote_dict_item
+        )
+
+        self.assertEqual(list(remote.diff_dict(from_items, to_items)), [
+            {'op': 'delete', 'item_key': '10.0.0.2'},
+            {'op': 'create', 'item_key': '10.0.0.3', 'item_value': '300'}
+        ])
+
+    def test_diff_dict_changed(self):
+        '''
+        upsert items whose value changed, compared as strings, and count ops
+        '''
+
+        from_items = [
+            {'item_key': '10.0.0.1', 'item_value': 100},
+            {'item_key': '10.0.0.2', 'item_value': '200'},
+            {'item_key': '10.0.0.3', 'item_value': '300'}
+        ]
+        to_items = RemoteItems(
+            {'10.0.0.1': 100, '10.0.0.2': 400, '10.0.0.4': 400}.items(),
+            _remote_dict_item
+        )
+        counts = collections.Counter()
+
+        self.assertEqual(
+            list(remote.diff_dict(from_items, to_items, counts)),
+            [
+                {'op': 'delete', 'item_key': '10.0.0.3'},
+                {'op': 'upsert', 'item_key': '10.0.0.2', 'item_value': '400'},
+                {'op': 'create', 'item_key': '10.0.0.4', 'item_value': '400'}
+            ]
+        )
+        self.assertEqual(counts, {'delete': 1, 'upsert': 1, 'create': 1})
+
+    def test_diff_lazy(self):
+        '''
+        ensure local items are converted as the diff is consumed
+        '''
+
+        converted = []
+
+        def convert(item):
+            converted.append(item)
+            return _remote_acl_item(item)
+
+        to_items = RemoteItems(
+            [f'10.0.{item // 256}.{item % 256}/32' for item in range(1000)],
+            convert
+        )
+        diff = remote.diff_acl([], to_items)
+
+        # the first pass over local items only finds deletes
+        next(diff)
+        self.assertEqual(len(converted), 1001)
+
+        # the second pass converts items as they're created
+        for _ in range(9):
+            next(diff)
+        self.assertEqual(len(converted), 1010)
+
+    def test_get_remote_config_concurrent(self):
+        '''
+        ensure lists are fetched concurrently, and kept in the API's order
+        '''
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), ServiceHandler)
+        server.lock = threading.Lock()
+        server.active = 0
+        server.most_active = 0
+        threading.Thread(target=server.serve_forever, args=(0.05,)).start()
+
+        args = argparse.Namespace(
+            pool_size=4, timeout=5, connect_timeout=5,
+            acl_batch_size=250, dict_batch_size=250, adaptive_batches=False,
+            retries=0, resume=False, refresh=False
+        )
+        env = argparse.Namespace(
+            apikey='APIKEY', verbose=False, config_file=self.config_file
+        )
+
+        os.environ['FASTLY_HOST'] = f'127.0.0.1:{server.server_port}'
+        os.environ['FASTLY_SECURE'] = 'false'
+        try:
+            live = Remote(args, env)
+            live.get_remote_config_service(env, 'SERVICEID')
+            live.close()
+        finally:
+            del os.environ['FASTLY_HOST']
+            del os.environ['FASTLY_SECURE']
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(env.from_remote['version'], 1)
+        self.assertEqual(
+            [acl['name'] for acl in env.from_remote['acls']],
+            [f'fastlyblocklist_acl_{number}' for number in range(8)]
+        )
+        self.assertEqual(
+            [acl['items'][0]['subnet'] for acl in env.from_remote['acls']],
+            list(range(8))
+        )
+        self.assertEqual(
+            [remote_dict['items'][0]['item_key']
+             for remote_dict in env.from_remote['dicts']],
+            [str(number) for number in range(8)]
+        )
+        self.assertGreater(server.most_active, 1)
+        self.assertLessEqual(server.most_active, 4)
+
+    def batch_server(self, max_entries=remote.MAX_BATCH_SIZE,
+                     fail_after=None, full=False):
+        '''
+        Start a stand-in API with 2 ACLs, answering slowly
+        The ACLs are empty, or if full hold as many entries as they can.
+        '''
+
+        api = FastlyAPI(latency=0.02, max_batch=max_entries,
+                        max_acl_entries=1000).start()
+        self.addCleanup(api.stop)
+
+        api.add_service('SERVICEID')
+        api.acl_ids = [
+            api.add_acl('SERVICEID', f'fastlyblocklist_{number}', [
+                {'ip': f'172.{16 + number}.{entry >> 8}.{entry & 255}'}
+                for entry in range(1000 if full else 0)
+            ])
+            for number in range(2)
+        ]
+
+        # pretend to break once fail_after batches are applied
+        if fail_after is not None:
+            api.fail('PATCH', r'.*/entries', status=400, times=100,
+                     after=fail_after)
+
+        return api
+
+    def acl_entries(self, api):
+        '''
+        Count the entries in a stand-in API's ACLs
+        '''
+
+        return sum(
+            len(api.acl_entries('SERVICEID', f'fastlyblocklist_{number}'))
+            for number in range(2)
+        )
+
+    def deploy_list_updates(self, api, replace=False, new_list=False,
+                            **options):
+        '''
+        Deploy 2 new 1000 entry ACLs to a stand-in API
+        With replace, the ACLs' live entries are replaced, otherwise they
+        are taken to be empty. With new_list, a third ACL is created first,
+        in a new version. Returns the Remote used.
+        '''
+
+        args = argparse.Namespace(
+            pool_size=4, timeout=5, connect_timeout=5,
+            acl_batch_size=250, dict_batch_size=250, adaptive_batches=False,
+            retries=0, resume=False, refresh=False
+        )
+        vars(args).update(options)
+        env = argparse.Namespace(
+            apikey='APIKEY', verbose=False, config_file=self.config_file
+        )
+        env.from_remote = {
+            'service_id': 'SERVICEID',
+            'version': 1,
+            'acls': [
+                {'name': f'fastlyblocklist_{number}', 'id': acl_id,
+                 'items': api.acl_entries(
+                     'SERVICEID', f'fastlyblocklist_{number}'
+                 ) if replace else []}
+                for number, acl_id in enumerate(api.acl_ids)
+            ],
+            'dicts': []
+        }
+        env.to_remote = {
+            'service_id': 'SERVICEID',
+            'version': 1,
+            'acls': [
+                {'name': f'fastlyblocklist_{number}',
+                 'items': RemoteItems(
+                     [f'10.{number}.{entry >> 8}.{entry & 255}'
+                      for entry in range(1000)],
+                     _remote_acl_item
+                 )}
+                for number in range(2)
+            ],
+            'dicts': []
+        }
+        if new_list:
+            env.to_remote['acls'].insert(0, {
+                'name': 'fastlyblocklist_new',
+                'items': RemoteItems(
+                    [f'10.9.{entry >> 8}.{entry & 255}'
+                     for entry in range(1000)],
+                    _remote_acl_item
+                )
+            })
+
+        os.environ['FASTLY_HOST'] = api.host
+        os.environ['FASTLY_SECURE'] = 'false'
+        try:
+            live = Remote(args, env)
+            live.deploy_list_updates(env)
+            live.close()
+        finally:
+            del os.environ['FASTLY_HOST']
+            del os.environ['FASTLY_SECURE']
+
+        return live
+
+    def test_deploy_list_updates(self):
+        '''
+        ensure batches for all lists are sent at once, without looking up
+        their ACLs again
+        '''
+
+        api = self.batch_server()
+        live = self.deploy_list_updates(api)
+
+        self.assertEqual(self.acl_entries(api), 2000)
+        self.assertEqual(api.requests, {'PATCH': 8})
+        self.assertEqual(live.transport.requests, 8)
+        self.assertEqual(live.batch_sizes['acl'].batches, 8)
+        self.assertGreater(api.most_active, 1)
+        self.assertLessEqual(api.most_active, 4)
+
+    def test_deploy_list_updates_adaptive(self):
+        '''
+        ensure adaptive batches are split after errors, then grow again
+        '''
+
+        api = self.batch_server(max_entries=400)
+        live = self.deploy_list_updates(
+            api, acl_batch_size=1000, adaptive_batches=True
+        )
+
+        self.assertEqual(self.acl_entries(api), 2000)
+        self.assertLess(live.batch_sizes['acl'].smallest, 400)
+        self.assertEqual(live.batch_sizes['acl'].largest, 1000)
+
+        # without adaptive batches, errors aren't retried
+        with self.assertRaises(SystemExit):
+            self.deploy_list_updates(
+                self.batch_server(max_entries=400), acl_batch_size=1000
+            )
+
+    def test_deploy_list_updates_replace(self):
+        '''
+        ensure a list's deletes are applied before its creates, so full
+        ACLs can have every entry replaced
+        '''
+
+        api = self.batch_server(full=True)
+
+        # the first delete batch is retried, landing after the others
+        api.fail('PATCH', r'.*/entries', status=429, times=1)
+        self.deploy_list_updates(api, replace=True, acl_batch_size=500,
+                                 retries=1)
+
+        self.assertEqual(self.acl_entries(api), 2000)
+        self.assertEqual(api.requests, {'PATCH': 9})
+        for number in range(2):
+            for entry in api.acl_entries('SERVICEID',
+                                         f'fastlyblocklist_{number}'):
+                self.assertTrue(entry['ip'].startswith(f'10.{number}.'))
+
+    def test_deploy_list_updates_resume(self):
+        '''
+        ensure a resumed commit skips the batches already applied
+        '''
+
+        api = self.batch_server(fail_after=3)
+        with self.assertRaises(SystemExit):
+            self.deploy_list_updates(api, pool_size=1)
+        self.assertEqual(self.acl_entries(api), 750)
+
+        # entries applied twice would be duplicated
+        api.failures.clear()
+        live = self.deploy_list_updates(api, resume=True)
+        self.assertEqual(self.acl_entries(api), 2000)
+        self.assertEqual(live.batch_sizes['acl'].batches, 5)
+
+        # the live config was saved for the resumed commit
+        self.assertIn('SERVICEID', live.journal.remote)
+
+        live.finish_commit()
+        self.assertFalse(os.path.exists(f'{self.config_file}.journal'))
+
+    def test_deploy_list_updates_resume_new_list(self):
+        '''
+        ensure a resumed commit skips the batches already applied to
+        existing lists, when the failed commit created a new version
+        '''
+
+        # the new ACL's 4 batches, then 2 of the first existing ACL's
+        api = self.batch_server(fail_after=6)
+        with self.assertRaises(SystemExit):
+            self.deploy_list_updates(api, new_list=True, pool_size=1)
+        self.assertEqual(self.acl_entries(api), 500)
+
+        # the new ACL is created again in another new version
+        api.failures.clear()
+        live = self.deploy_list_updates(api, new_list=True, resume=True)
+        self.assertEqual(self.acl_entries(api), 2000)
+        self.assertEqual(
+            len(api.acl_entries('SERVICEID', 'fastlyblocklist_new')), 1000
+        )
+        self.assertEqual(live.batch_sizes['acl'].batches, 10)
+
+    def test_deploy_list_updates_lost(self):
+        '''
+        ensure a resumed commit isn't made from the old live config, when a
+        batch may have been applied without being journaled
+        '''
+
+        api = self.batch_server()
+        api.fail('PATCH', r'.*/entries', status='lose', after=3)
+        with self.assertRaises(SystemExit):
+            self.deploy_list_updates(api, pool_size=1)
+
+        # the lost batch was applied, as may be the one sent after it
+        applied = self.acl_entries(api)
+        self.assertIn(applied, (1000, 1250))
+
+        # resumed from the live entries, so none are created twice
+        live = self.deploy_list_updates(api, replace=True, resume=True)
+        self.assertEqual(self.acl_entries(api), 2000)
+        self.assertEqual(live.batch_sizes['acl'].batches,
+                         (2000 - applied) // 250)
+        self.assertEqual(live.journal.remote, {})
+        self.assertEqual(live.journal.applied, {})
+
+    def test_batch_size(self):
+        '''
+        ensure adaptive batch sizes grow additively and shrink
+        multiplicatively, within limits
+        '''
+
+        batch_size = remote.BatchSize(250, adaptive=True)
+
+        batch_size.sent(0.1)
+        self.assertEqual(batch_size.size, 250 + remote.BATCH_SIZE_STEP)
+        batch_size.sent(remote.TARGET_LATENCY + 1)
+        self.assertEqual(batch_size.size, 225)
+        batch_size.failed()
+        self.assertEqual(batch_size.size, 112)
+
+        for _ in range(100):
+            batch_size.sent(0.1)
+        self.assertEqual(batch_size.size, remote.MAX_BATCH_SIZE)
+        for _ in range(100):
+            batch_size.failed()
+        self.assertEqual(batch_size.size, 1)
+
+        self.assertEqual(batch_size.batches, 102)
+        self.assertEqual(batch_size.smallest, 1)
+        self.assertEqual(batch_size.largest, remote.MAX_BATCH_SIZE)
+
+        # fixed batch sizes stay put
+        batch_size = remote.BatchSize(250)
+        batch_size.sent(0.1)
+        batch_size.failed()
+        self.assertEqual(batch_size.size, 250)
+
+    def get_pages(self, entries, links, deleted=0, item_count=None):
+        '''
+        Get entries from a paginated stand-in API through Pages
+        '''
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), PagesHandler)
+        server.entries = list(entries)
+        server.links = links
+        server.deleted = deleted
+        threading.Thread(target=server.serve_forever, args=(0.05,)).start()
+
+        api = transport.Transport(
+            'APIKEY', host=f'127.0.0.1:{server.server_port}', secure=False
+        )
+        try:
+            with futures.ThreadPoolExecutor(4) as executor, \
+                    mock.patch.object(remote, 'PER_PAGE', 10):
+                count = None
+                if item_count is not None:
+                    count = futures.Future()
+                    count.set_result(item_count)
+                return remote.Pages(
+                    api, executor, 'ACLID',
+                    '/service/SERVICEID/acl/ACLID/entries', count
+                ).begin().items()
+        finally:
+            api.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_get_pages(self):
+        '''
+        ensure every page is fetched, in order, however pages are linked
+        '''
+
+        entries = [{'id': str(entry)} for entry in range(95)]
+
+        for links in ('last', 'next', None):
+            self.assertEqual(self.get_pages(entries, links), entries)
+
+        self.assertEqual(self.get_pages([], 'last'), [])
+        self.assertEqual(self.get_pages(entries[:10], 'last'), entries[:10])
+
+        # without links, full pages are followed until a short one
+        self.assertEqual(self.get_pages(entries[:90], None), entries[:90])
+        self.assertEqual(self.get_pages(entries[:5], None), entries[:5])
+
+    def test_get_pages_changed(self):
+        '''
+        ensure entries missed because the list changed are noticed
+        '''
+
+        entries = [{'id': str(entry)} for entry in range(95)]
+
+        # enough entries deleted to leave a page before the last short
+        with self.assertRaises(ValueError):
+            self.get_pages(entries, 'last', deleted=15)
+
+        # a few entries deleted, noticed with an expected count
+        self.assertEqual(
+            len(self.get_pages(entries, 'last', item_count=95)), 95
+        )
+        with self.assertRaises(ValueError):
+            self.get_pages(entries, 'last', deleted=3, item_count=95)
+
+
+if __name__ == '__main__':
+    unittest.main()
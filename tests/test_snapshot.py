@@ -0,0 +1,70 @@
+'''
+Test keeping snapshots of live lists with lib snapshot
+'''
+
+import unittest
+
+import os
+import tempfile
+
+from lib.snapshot import Snapshots
+
+
+class SnapshotTests(unittest.TestCase):
+    '''
+    Test keeping snapshots of live lists with Snapshots
+    '''
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.snapshots = Snapshots(os.path.join(tmp.name, 'snapshots'))
+
+    def test_save_load(self):
+        '''
+        ensure lists are kept, with unknown entries left unknown
+        '''
+
+        acls = [
+            {'name': 'fastlyblocklist_a', 'id': 'ACLID', 'items': [
+                {'id': '1', 'ip': '10.0.0.0', 'subnet': 8, 'negated': '0',
+                 'comment': ''},
+                {'id': '2', 'ip': '10.0.0.1', 'subnet': None, 'negated': '1',
+                 'comment': ''}
+            ]},
+            {'name': 'fastlyblocklist_b', 'id': 'ACLID2', 'items': None}
+        ]
+        dicts = [
+            {'name': 'fastlyblocklist_c', 'id': 'DICTID', 'items': [
+                {'item_key': '10.0.0.1', 'item_value': '100'}
+            ]}
+        ]
+        self.snapshots.save('SERVICEID', 3, acls, dicts)
+
+        snapshot = self.snapshots.load('SERVICEID')
+        self.assertEqual(snapshot['version'], 3)
+        self.assertEqual(snapshot['acls'][0]['items'], [
+            {'id': '1', 'ip': '10.0.0.0', 'subnet': 8, 'negated': '0'},
+            {'id': '2', 'ip': '10.0.0.1', 'subnet': None, 'negated': '1'}
+        ])
+        self.assertIsNone(snapshot['acls'][1]['items'])
+        self.assertEqual(snapshot['dicts'], dicts)
+
+        self.snapshots.drop('SERVICEID')
+        self.assertIsNone(self.snapshots.load('SERVICEID'))
+        self.snapshots.drop('SERVICEID')
+
+    def test_unreadable(self):
+        '''
+        ensure a damaged snapshot isn't used
+        '''
+
+        self.snapshots.save('SERVICEID', 1, [], [])
+        with open(self.snapshots._file('SERVICEID'), 'w') as file_snapshot:
+            file_snapshot.write('{"version": 1, "acls": [')
+
+        self.assertIsNone(self.snapshots.load('SERVICEID'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+'''
+Test fastly-blocklist startup time for local-only operations
+'''
+
+import unittest
+
+import os
+import sys
+import time
+import subprocess
+
+from pathlib import Path
+
+# longest a local-only invocation may take, in seconds
+STARTUP_BUDGET = 1.0
+
+SCRIPT = str(Path(__file__).resolve().parent.parent / 'fastly-blocklist.py')
+
+
+class StartupTests(unittest.TestCase):
+    '''
+    Test fastly-blocklist startup time for local-only operations
+    '''
+
+    def tearDown(self):
+        try:
+            os.remove('tests.blocklist')
+        except BaseException:
+            pass
+
+    def test_local_imports(self):
+        '''
+        ensure the template engine and API transport aren't imported on startup
+        '''
+
+        result = subprocess.run(
+            [sys.executable, '-c', (
+                'import sys, lib; '
+                'print([name for name in ("jinja2", "lib.transport") '
+                'if name in sys.modules])'
+            )],
+            cwd=str(Path(SCRIPT).parent),
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            check=True
+        )
+
+        self.assertEqual(result.stdout.strip(), '[]')
+
+    def test_local_budget(self):
+        '''
+        ensure a local-only invocation runs without an API key, within budget
+        '''
+
+        command = [
+            sys.executable, SCRIPT,
+            '--apikey', 'tests.missing.apikey',
+            '--config', 'tests.blocklist',
+            '--init', '--service', 'SERVICEID',
+            '--new', '--list', 'a_block_list', '--type', 'block',
+            '--add', '--item', '10.0.0.1',
+            '--save'
+        ]
+
+        # take the best of a few runs, to ignore a slow first start
+        elapsed = []
+        for _ in range(3):
+            start = time.perf_counter()
+            subprocess.run(
+                command + ['--force'],
+                stdout=subprocess.DEVNULL,
+                check=True
+            )
+            elapsed.append(time.perf_counter() - start)
+
+        self.assertLess(min(elapsed), STARTUP_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,9 +5,11 @@ Test modifying state with lib State()
 import unittest
 
 import os
+import shutil
 import argparse
 
-from lib import Environment, State, Lists, Items
+from lib import Environment, State, Lists, Items, Remote
+from tests.fastly_api import FastlyAPI
 
 
 class StateTests(unittest.TestCase):
@@ -28,7 +30,20 @@ class StateTests(unittest.TestCase):
             log='',
             block='',
             force=False,
-            verbose=False
+            verbose=False,
+            aggregate=False,
+            jobs=1,
+            replace=False,
+            convert=None,
+            pool_size=4,
+            timeout=5,
+            connect_timeout=5,
+            acl_batch_size=250,
+            dict_batch_size=250,
+            adaptive_batches=False,
+            retries=0,
+            resume=False,
+            refresh=False
         )
 
     def tearDown(self):
@@ -37,6 +52,7 @@ class StateTests(unittest.TestCase):
             os.remove('tests.blocklist')
         except BaseException:
             pass
+        shutil.rmtree('tests.blocklist.snapshots', ignore_errors=True)
 
     def test_sync(self):
         '''
@@ -117,6 +133,50 @@ class StateTests(unittest.TestCase):
             '2a04:4e42:10::313/128'
         )
 
+    def test_sync_dict(self):
+        '''
+        test sync of remote dictionaries into keyed list items
+        '''
+        # create a new environment
+        env = Environment(self.args)
+        env.mock_remote = True
+        # create an env.from_remote object
+        env.from_remote = {
+            'service_id': 'REMOTESERVICEID',
+            'version': 1,
+            'snippet': {
+                'name': 'REMOTE_SNIPPET_NAME',
+                'type': 'recv',
+                'priority': 10,
+                'content': '#fastlyblocklist_list {"name": "my_test_list", '
+                           '"type": "temp", "action_block": true, '
+                           '"action_log": true, "action_none": false, '
+                           '"match": "exact", "variable": null, '
+                           '"block_length": 600, "items": []}\n'
+            },
+            'acls': [],
+            'dicts': [
+                {
+                    'name': 'fastlyblocklist_my_test_list',
+                    'items': [
+                        {
+                            'item_key': '10.0.0.1',
+                            'item_value': '1700000000'
+                        }
+                    ]
+                }
+            ]
+        }
+
+        # sync env.from_remote to local env.config
+        State().sync(env, 'remote')
+
+        # ensure remote items are keyed, with integer expirations
+        self.assertEqual(
+            env.config['lists'][0]['items'],
+            {'10.0.0.1': 1700000000}
+        )
+
     def test_commit(self):
         '''
         test local portion of commit operations (create env.to_remote)
@@ -170,31 +230,218 @@ class StateTests(unittest.TestCase):
             env.to_remote['acls'][0]['name'],
             'fastlyblocklist_a_new_list'
         )
+        acl_items = list(env.to_remote['acls'][0]['items'])
         self.assertEqual(
-            env.to_remote['acls'][0]['items'][0]['ip'],
+            acl_items[0]['ip'],
             '10.0.0.0'
         )
         self.assertEqual(
-            env.to_remote['acls'][0]['items'][0]['negated'],
+            acl_items[0]['negated'],
             '1'
         )
         self.assertEqual(
-            env.to_remote['acls'][0]['items'][0]['subnet'],
+            acl_items[0]['subnet'],
             8
         )
         self.assertEqual(
-            env.to_remote['acls'][0]['items'][1]['ip'],
+            acl_items[1]['ip'],
             '2a04:4e42:10::313'
         )
         self.assertEqual(
-            env.to_remote['acls'][0]['items'][1]['negated'],
+            acl_items[1]['negated'],
             '0'
         )
         self.assertEqual(
-            env.to_remote['acls'][0]['items'][1]['subnet'],
+            acl_items[1]['subnet'],
             128
         )
 
+    def test_commit_combo(self):
+        '''
+        ensure combo lists match on their children
+        '''
+
+        env = Environment(self.args)
+        env.mock_remote = True
+
+        for name, list_type, match, items in [
+                ('a_block_list', 'block', 'exact', ['10.0.0.0/8']),
+                ('a_var_list', 'var', 'regexp', ['curl%2F']),
+                ('a_combo_list', 'combo', 'exact',
+                 ['a_block_list', 'a_var_list'])]:
+            env.config['lists'].append({
+                'name': name,
+                'type': list_type,
+                'action_block': True,
+                'action_log': True,
+                'action_none': False,
+                'match': match,
+                'variable': 'req.http.User-Agent',
+                'block_length': 600,
+                'items': items
+            })
+
+        state = State()
+        state.commit(env, 'remote')
+
+        self.assertIn(
+            'var.ip ~ fastlyblocklist_a_block_list\n\t && '
+            '(var.custom_a_var_list ~ "curl%2F")',
+            env.to_remote['snippet']['content']
+        )
+        self.assertEqual(list(env.to_remote['acls'][0]['items']), [
+            {'ip': '10.0.0.0', 'negated': '0', 'subnet': 8}
+        ])
+
+    def test_commit_render_once(self):
+        '''
+        ensure the snippet is rendered once per distinct service options
+        '''
+
+        self.args.service = [f'SERVICE{number}' for number in range(50)]
+
+        env = Environment(self.args)
+        env.mock_remote = True
+
+        # one service renders with different options
+        env.config['services'][-1]['options']['var_ip'] = 'req.http.ip'
+
+        state = State()
+        state.commit(env, 'remote')
+
+        self.assertEqual(len(state.snippets), 2)
+        self.assertEqual(env.to_remote['service_id'], 'SERVICE49')
+        self.assertIn('req.http.ip', env.to_remote['snippet']['content'])
+
+    def remote_env(self):
+        '''
+        Start a stand-in API, and set up a config with a block list and a
+        temp list to commit to it
+        '''
+
+        api = FastlyAPI().start()
+        self.addCleanup(api.stop)
+        api.add_service('SERVICEID')
+
+        os.environ['FASTLY_HOST'] = api.host
+        os.environ['FASTLY_SECURE'] = 'false'
+        self.addCleanup(os.environ.pop, 'FASTLY_HOST')
+        self.addCleanup(os.environ.pop, 'FASTLY_SECURE')
+
+        env = Environment(self.args)
+        for name, list_type, items in [
+                ('a_block_list', 'block',
+                 [f'10.0.{item >> 8}.{item & 255}/32' for item in range(600)]
+                 + ['!192.0.2.0/24']),
+                ('a_temp_list', 'temp',
+                 {f'10.1.0.{item}': 2000000000 for item in range(10)})]:
+            env.config['lists'].append({
+                'name': name,
+                'type': list_type,
+                'action_block': True,
+                'action_log': True,
+                'action_none': False,
+                'match': 'exact',
+                'variable': None,
+                'block_length': 600,
+                'items': items
+            })
+
+        return api, env
+
+    def test_commit_sync_remote(self):
+        '''
+        ensure a commit to a stand-in API syncs back the same config
+        '''
+
+        api, env = self.remote_env()
+
+        remote = Remote(self.args, env)
+        State().commit(env, remote)
+
+        # new lists and a new snippet are deployed in new versions
+        self.assertEqual(api.active_version('SERVICEID'), 3)
+        self.assertEqual(
+            len(api.acl_entries('SERVICEID', 'fastlyblocklist_a_block_list')),
+            601
+        )
+        self.assertEqual(
+            api.dict_items('SERVICEID', 'fastlyblocklist_a_temp_list'),
+            {f'10.1.0.{item}': '2000000000' for item in range(10)}
+        )
+        self.assertIn(
+            'fastlyblocklist_a_block_list',
+            api.snippet(
+                'SERVICEID', env.config['services'][0]['snippet_name']
+            )['content']
+        )
+
+        # a changed list is updated in place
+        env.config['lists'][0]['items'].remove('10.0.0.0/32')
+        api.requests.clear()
+        State().commit(env, remote)
+
+        self.assertEqual(api.active_version('SERVICEID'), 3)
+        self.assertEqual(api.requests['PATCH'], 1)
+        self.assertNotIn('PUT', api.requests)
+
+        # sync the live config into a new config file
+        self.args.config = 'tests.synced.blocklist'
+        self.addCleanup(os.remove, 'tests.synced.blocklist')
+        synced = Environment(self.args)
+        State().sync(synced, remote)
+        remote.close()
+
+        self.assertEqual(
+            [blockly_list['name'] for blockly_list in synced.config['lists']],
+            ['a_block_list', 'a_temp_list']
+        )
+        self.assertEqual(
+            sorted(synced.config['lists'][0]['items']),
+            sorted(env.config['lists'][0]['items'])
+        )
+        self.assertEqual(
+            synced.config['lists'][1]['items'],
+            {f'10.1.0.{item}': 2000000000 for item in range(10)}
+        )
+
+    def test_commit_snapshot(self):
+        '''
+        ensure lists are reused from the last commit's snapshot while the
+        service is unchanged
+        '''
+
+        api, env = self.remote_env()
+        remote = Remote(self.args, env)
+
+        # the first commit creates the lists, so the next gets the new
+        # ACL's entry ids, and the one after reuses both lists
+        for _ in range(3):
+            api.requests.clear()
+            State().commit(env, remote)
+        self.assertEqual(api.requests, {'GET': 5})
+
+        # an ACL entry added outside of a commit changes the ACL's size
+        block_list = 'fastlyblocklist_a_block_list'
+        acl_id = remote.snapshots.load('SERVICEID')['acls'][0]['id']
+        remote.transport.request(
+            'PATCH', f'/service/SERVICEID/acl/{acl_id}/entries',
+            body='{"entries": [{"op": "create", "ip": "192.0.2.1"}]}',
+            headers={'Content-Type': 'application/json'}
+        )
+        api.requests.clear()
+        State().commit(env, remote)
+        self.assertEqual(api.requests['PATCH'], 1)
+        self.assertEqual(len(api.acl_entries('SERVICEID', block_list)), 601)
+
+        # without reusing the snapshot
+        remote.refresh = True
+        api.requests.clear()
+        State().commit(env, remote)
+        self.assertEqual(api.requests, {'GET': 8})
+
+        remote.close()
+
     def test_save(self):
         '''
         test create, save, and load of a config file
@@ -0,0 +1,231 @@
+'''
+Test binary config files with lib store
+'''
+
+import unittest
+
+import os
+
+from lib import store
+
+
+class StoreTests(unittest.TestCase):
+    '''
+    Test binary config files with store
+    '''
+
+    def setUp(self):
+        self.config = {
+            'log': '',
+            'block': 'error 403 "Forbidden";',
+            'services': [{'id': 'SERVICEID'}],
+            'lists': [
+                {
+                    'name': 'a_block_list',
+                    'type': 'block',
+                    'match': 'exact',
+                    'items': ['10.0.0.0/8', '!10.0.0.1/32', '2001:db8::/32']
+                },
+                {
+                    'name': 'a_temp_list',
+                    'type': 'temp',
+                    'match': 'exact',
+                    'items': {'10.0.0.1': 1700000000, '2001:db8::1': 100}
+                },
+                {
+                    'name': 'a_geo_list',
+                    'type': 'geo',
+                    'match': 'exact',
+                    'items': {'US': 'fastly-blocklist'}
+                },
+                {
+                    'name': 'a_var_list',
+                    'type': 'var',
+                    'match': 'regexp',
+                    'items': ['curl%2F', 'bad\nitem']
+                },
+                {
+                    'name': 'an_empty_list',
+                    'type': 'combo',
+                    'match': 'exact',
+                    'items': []
+                }
+            ]
+        }
+
+    def tearDown(self):
+        try:
+            os.remove('tests.blocklist')
+        except BaseException:
+            pass
+
+    def test_save_load(self):
+        '''
+        round trip a config through a binary config file
+        '''
+
+        store.save(self.config, 'tests.blocklist')
+
+        self.assertTrue(store.is_binary('tests.blocklist'))
+
+        config = store.load('tests.blocklist')
+
+        self.assertEqual(config, self.config)
+
+    def test_load_lazy(self):
+        '''
+        ensure list items are only decoded when accessed
+        '''
+
+        store.save(self.config, 'tests.blocklist')
+        config = store.load('tests.blocklist')
+
+        self.assertFalse(config['lists'][0].loaded())
+        self.assertIn('items', config['lists'][0])
+        self.assertEqual(
+            config['lists'][1]['items'],
+            {'10.0.0.1': 1700000000, '2001:db8::1': 100}
+        )
+        self.assertTrue(config['lists'][1].loaded())
+        self.assertFalse(config['lists'][0].loaded())
+
+    def test_save_untouched(self):
+        '''
+        ensure untouched lists are saved again as they were
+        '''
+
+        store.save(self.config, 'tests.blocklist')
+        config = store.load('tests.blocklist')
+
+        config['lists'][1]['items']['10.0.0.2'] = 200
+        config['lists'].pop(2)
+        store.save(config, 'tests.blocklist')
+
+        config = store.load('tests.blocklist')
+
+        self.assertEqual(
+            config['lists'][0]['items'],
+            ['10.0.0.0/8', '!10.0.0.1/32', '2001:db8::/32']
+        )
+        self.assertEqual(
+            config['lists'][1]['items'],
+            {'10.0.0.1': 1700000000, '2001:db8::1': 100, '10.0.0.2': 200}
+        )
+        self.assertEqual(config['lists'][2]['name'], 'a_var_list')
+
+    def test_save_incremental(self):
+        '''
+        ensure only changed lists are appended to the config file
+        '''
+
+        self.config['lists'][0]['items'].extend(
+            f'10.1.{item // 256}.{item % 256}/32' for item in range(1000)
+        )
+
+        store.save(self.config, 'tests.blocklist')
+        size = os.path.getsize('tests.blocklist')
+
+        # saving an unchanged config only appends a header
+        config = store.load('tests.blocklist')
+        self.assertEqual(config['lists'][0]['items'][0], '10.0.0.0/8')
+        store.save(config, 'tests.blocklist')
+        header_size = os.path.getsize('tests.blocklist') - size
+
+        self.assertLess(header_size, size)
+
+        # saving a changed list appends the list and a header
+        config = store.load('tests.blocklist')
+        config['lists'][1]['items']['10.0.0.2'] = 200
+        size = os.path.getsize('tests.blocklist')
+        store.save(config, 'tests.blocklist')
+
+        config = store.load('tests.blocklist')
+        self.assertEqual(
+            os.path.getsize('tests.blocklist') - size,
+            header_size + store.section_size(config['lists'][1].section)
+        )
+        self.assertEqual(config['lists'][1]['items']['10.0.0.2'], 200)
+        self.assertEqual(config['lists'][3]['items'], ['curl%2F', 'bad\nitem'])
+
+    def test_save_compact(self):
+        '''
+        ensure the config file is rewritten once it is mostly stale data
+        '''
+
+        store.save(self.config, 'tests.blocklist')
+        size = os.path.getsize('tests.blocklist')
+
+        for expiration in range(10):
+            config = store.load('tests.blocklist')
+            config['lists'][1]['items']['10.0.0.2'] = expiration
+            store.save(config, 'tests.blocklist')
+
+        self.assertLess(
+            os.path.getsize('tests.blocklist'),
+            store.COMPACT_RATIO * size + 100
+        )
+        self.assertEqual(
+            store.load('tests.blocklist')['lists'][1]['items']['10.0.0.2'], 9
+        )
+
+    def test_load_interrupted_save(self):
+        '''
+        ensure a save that didn't finish is ignored, then overwritten
+        '''
+
+        store.save(self.config, 'tests.blocklist')
+        size = os.path.getsize('tests.blocklist')
+
+        # a partially written list section and header
+        with open('tests.blocklist', 'ab') as file_config:
+            file_config.write(
+                b'10.0.0.0/8\n{"log": ' + store.TRAILER_MAGIC[:4]
+            )
+
+        config = store.load('tests.blocklist')
+        self.assertEqual(config, self.config)
+
+        config['lists'][2]['items']['RU'] = 'fastly-blocklist'
+        store.save(config, 'tests.blocklist')
+
+        config = store.load('tests.blocklist')
+        self.assertEqual(
+            config['lists'][2]['items'],
+            {'US': 'fastly-blocklist', 'RU': 'fastly-blocklist'}
+        )
+        self.assertEqual(config['lists'][0], self.config['lists'][0])
+        self.assertGreater(os.path.getsize('tests.blocklist'), size)
+
+    def test_replace_file_mode(self):
+        '''
+        ensure new files get the mode open() would, and replaced files keep
+        theirs
+        '''
+
+        umask = os.umask(0o022)
+        try:
+            store.replace_file('tests.blocklist', [b'{}'])
+            self.assertEqual(os.stat('tests.blocklist').st_mode & 0o777, 0o644)
+
+            os.chmod('tests.blocklist', 0o640)
+            store.replace_file('tests.blocklist', [b'{}'])
+            self.assertEqual(os.stat('tests.blocklist').st_mode & 0o777, 0o640)
+        finally:
+            os.umask(umask)
+
+    def test_load_not_binary(self):
+        '''
+        ensure JSON config files aren't loaded as binary
+        '''
+
+        with open('tests.blocklist', 'w') as file_config:
+            file_config.write('{}')
+
+        self.assertFalse(store.is_binary('tests.blocklist'))
+
+        with self.assertRaises(ValueError):
+            store.load('tests.blocklist')
+
+
+if __name__ == '__main__':
+    unittest.main()
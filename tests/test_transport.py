@@ -0,0 +1,306 @@
+'''
+Test sending API requests with lib transport
+'''
+
+import unittest
+
+import os
+import json
+import time
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lib import transport, Remote
+
+
+class Handler(BaseHTTPRequestHandler):
+    '''
+    Answer requests like the Fastly API, counting connections
+    '''
+
+    protocol_version = 'HTTP/1.1'
+
+    # send each response in one write, flushed once it is complete
+    wbufsize = -1
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        if self.path == '/lost':
+            self.lose()
+        elif self.path == '/missing':
+            self.respond(404, {'msg': 'Record not found'})
+        elif self.path == '/flaky' and self.server.failures:
+            self.server.failures -= 1
+            self.respond(503, {'msg': 'Service unavailable'})
+        elif self.path == '/service/SERVICEID':
+            self.respond(200, {'versions': [
+                {'number': 1, 'active': False},
+                {'number': 2, 'active': True},
+                {'number': 3, 'active': False}
+            ]})
+        else:
+            self.respond(200, {
+                'path': self.path,
+                'key': self.headers['Fastly-Key']
+            })
+
+        # pretend to be a server that drops idle connections
+        if self.server.drop:
+            self.close_connection = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        if self.path == '/lost':
+            self.lose()
+        elif self.path == '/flaky' and self.server.failures:
+            self.server.failures -= 1
+            self.respond(503, {'msg': 'Service unavailable'},
+                         self.server.retry_after)
+        else:
+            self.respond(200, {'path': self.path})
+
+    def lose(self):
+        # pretend to apply the request, then lose the response
+        self.server.lost += 1
+        self.close_connection = True
+
+    def respond(self, status, data, retry_after=None):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if retry_after:
+            self.send_header('Retry-After', retry_after)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TransportTests(unittest.TestCase):
+    '''
+    Test sending API requests with transport
+    '''
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.connections = 0
+        self.server.drop = False
+        self.server.failures = 0
+        self.server.lost = 0
+        self.server.retry_after = None
+        threading.Thread(target=self.server.serve_forever).start()
+
+        self.host = f'127.0.0.1:{self.server.server_port}'
+        self.transport = transport.Transport(
+            'APIKEY', host=self.host, secure=False, pool_size=2,
+            backoff=0.01
+        )
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_request(self):
+        '''
+        ensure responses are decoded and requests are authenticated
+        '''
+
+        response, data = self.transport.request('GET', '/service/SERVICEID')
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(data['versions'][1], {'number': 2, 'active': True})
+
+        data = self.transport.request('GET', '/service/SERVICEID/acl')[1]
+        self.assertEqual(
+            data, {'path': '/service/SERVICEID/acl', 'key': 'APIKEY'}
+        )
+
+    def test_keep_alive(self):
+        '''
+        ensure sequential requests reuse one connection
+        '''
+
+        for _ in range(10):
+            self.transport.request('GET', '/')
+
+        self.assertEqual(self.transport.requests, 10)
+        self.assertEqual(self.transport.connections, 1)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_pool_size(self):
+        '''
+        ensure concurrent requests open no more than pool_size connections
+        '''
+
+        threads = [
+            threading.Thread(
+                target=lambda: [self.transport.request('GET', '/')
+                                for _ in range(10)]
+            )
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.transport.requests, 80)
+        self.assertLessEqual(self.transport.connections, 2)
+
+    def test_stale_connection(self):
+        '''
+        ensure a connection closed by the server is replaced
+        '''
+
+        self.server.drop = True
+
+        for _ in range(3):
+            data = self.transport.request('GET', '/')[1]
+            self.assertEqual(data['path'], '/')
+
+        self.assertEqual(self.server.connections, 3)
+
+    def test_error(self):
+        '''
+        ensure error responses raise TransportError
+        '''
+
+        with self.assertRaises(transport.TransportError) as context:
+            self.transport.request('GET', '/missing')
+
+        self.assertEqual(context.exception.status, 404)
+        self.assertEqual(context.exception.data, {'msg': 'Record not found'})
+
+        # the connection is still reused after an error response
+        self.transport.request('GET', '/')
+        self.assertEqual(self.transport.connections, 1)
+
+    def test_retry(self):
+        '''
+        ensure retryable errors are retried, until retries are used up
+        '''
+
+        self.server.failures = 2
+        data = self.transport.request('GET', '/flaky')[1]
+        self.assertEqual(data['path'], '/flaky')
+        self.assertEqual(self.transport.retried, 2)
+
+        self.server.failures = 4
+        with self.assertRaises(transport.TransportError) as context:
+            self.transport.request('GET', '/flaky')
+        self.assertEqual(context.exception.status, 503)
+        self.assertEqual(self.transport.retried, 5)
+
+        # other errors aren't retried
+        with self.assertRaises(transport.TransportError):
+            self.transport.request('GET', '/missing')
+        self.assertEqual(self.transport.retried, 5)
+
+    def test_retry_lost(self):
+        '''
+        ensure only GET requests are retried once their response is lost
+        '''
+
+        with self.assertRaises(transport.ResponseLost):
+            self.transport.request('GET', '/lost')
+        self.assertEqual(self.server.lost, 4)
+
+        # a POST may have been applied, so isn't sent again
+        self.transport.request('POST', '/', body='{}')
+        with self.assertRaises(transport.ResponseLost):
+            self.transport.request('POST', '/lost', body='{}')
+        self.assertEqual(self.server.lost, 5)
+
+    def test_retry_server_error(self):
+        '''
+        ensure a POST which gets a server error is only retried if it says
+        when to retry, as it may have been applied otherwise
+        '''
+
+        self.server.failures = 1
+        with self.assertRaises(transport.ResponseLost) as context:
+            self.transport.request('POST', '/flaky', body='{}')
+        self.assertEqual(context.exception.error.status, 503)
+        self.assertEqual(self.transport.retried, 0)
+
+        self.server.failures = 1
+        self.server.retry_after = '1'
+        data = self.transport.request('POST', '/flaky', body='{}')[1]
+        self.assertEqual(data['path'], '/flaky')
+        self.assertEqual(self.transport.retried, 1)
+
+    def test_rate_limit(self):
+        '''
+        ensure requests are spread out as the rate limit runs low
+        '''
+
+        class Response(dict):
+            getheader = dict.get
+
+        rate_limit = transport.RateLimit()
+
+        # plenty of requests left
+        rate_limit.update(Response({
+            transport.RATE_LIMIT_REMAINING: '900',
+            transport.RATE_LIMIT_RESET: str(time.time() + 60)
+        }))
+        start = time.perf_counter()
+        for _ in range(10):
+            rate_limit.wait()
+        self.assertLess(time.perf_counter() - start, 0.1)
+
+        # 2 requests left, then none until the reset
+        rate_limit.update(Response({
+            transport.RATE_LIMIT_REMAINING: '2',
+            transport.RATE_LIMIT_RESET: str(time.time() + 0.4)
+        }))
+        start = time.perf_counter()
+        rate_limit.wait()
+        self.assertLess(time.perf_counter() - start, 0.1)
+        rate_limit.wait()
+        self.assertGreater(time.perf_counter() - start, 0.15)
+        rate_limit.wait()
+        self.assertGreater(time.perf_counter() - start, 0.35)
+
+        # the limit has reset
+        start = time.perf_counter()
+        rate_limit.wait()
+        self.assertLess(time.perf_counter() - start, 0.1)
+
+    def test_remote_active_version(self):
+        '''
+        ensure Remote sends its requests through a shared transport
+        '''
+
+        args = argparse.Namespace(
+            pool_size=2, timeout=5, connect_timeout=5,
+            acl_batch_size=250, dict_batch_size=250, adaptive_batches=False,
+            retries=0, resume=False, refresh=False
+        )
+        env = argparse.Namespace(apikey='APIKEY', config_file='unused')
+
+        os.environ['FASTLY_HOST'] = self.host
+        os.environ['FASTLY_SECURE'] = 'false'
+        try:
+            remote = Remote(args, env)
+        finally:
+            del os.environ['FASTLY_HOST']
+            del os.environ['FASTLY_SECURE']
+
+        self.assertEqual(remote._get_active_version('SERVICEID'), 2)
+        self.assertEqual(remote._get_active_version('SERVICEID'), 2)
+        self.assertEqual(remote.transport.connections, 1)
+
+        remote.close()
+
+
+if __name__ == '__main__':
+    unittest.main()